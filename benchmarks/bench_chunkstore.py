@@ -0,0 +1,90 @@
+"""
+Dedup ratio and ingest throughput of smam_package.chunkstore on synthetic,
+near-identical profiles.
+
+    PYTHONPATH=src python benchmarks/bench_chunkstore.py --profiles 12 --size-mb 24
+
+Every profile gets a copy of a shared database file with a few small edits
+at random offsets (some inserted, which shifts everything after them), the
+attachments of a few shared groups and some attachments of its own. The
+first snapshot ingests everything; the second runs after editing one
+profile's database, which shows the incremental cost.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from smam_package.chunkstore import ChunkRepository
+
+
+def make_profiles(root: str, count: int, size_mb: int, seed: int = 1):
+    """
+    Create count profiles and return their account records.
+    """
+    rng = random.Random(seed)
+    database = bytearray(os.urandom(size_mb * 2**20 // 2))
+    shared = [os.urandom(rng.randint(20, 400) * 1024) for _ in range(24)]
+    records = []
+    for n in range(count):
+        profile_dir = os.path.join(root, f"Signal-P{n}")
+        os.makedirs(os.path.join(profile_dir, "sql"))
+        os.makedirs(os.path.join(profile_dir, "attachments.noindex"))
+        db = bytearray(database)
+        for _ in range(8):
+            pos = rng.randrange(len(db))
+            edit = os.urandom(rng.randint(16, 512))
+            if rng.random() < 0.5:
+                db[pos:pos] = edit
+            else:
+                db[pos:pos + len(edit)] = edit
+        with open(os.path.join(profile_dir, "sql", "db.sqlite"), "wb") as f:
+            f.write(db)
+        attachments = rng.sample(shared, 12) + [os.urandom(rng.randint(20, 400) * 1024)
+                                                for _ in range(4)]
+        for i, data in enumerate(attachments):
+            with open(os.path.join(profile_dir, "attachments.noindex", f"{i:04x}"), "wb") as f:
+                f.write(data)
+        records.append({"name": f"P{n}", "profile_dir": profile_dir})
+    return records
+
+
+def report(label: str, result, elapsed: float) -> None:
+    ratio = result.logical / result.stored if result.stored else float("inf")
+    print(f"{label}: {result.files} files, {result.logical / 2**20:.1f} MiB logical, "
+          f"{result.read / 2**20:.1f} MiB read, {result.stored / 2**20:.1f} MiB stored "
+          f"({result.new_chunks} new chunks), dedup ratio {ratio:.2f}x, "
+          f"{elapsed:.2f}s, ingest {result.read / 2**20 / elapsed:.1f} MiB/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=12)
+    parser.add_argument("--size-mb", type=int, default=24, help="approximate size of one profile")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dir", default=None, help="where to build the profiles (default: $TMPDIR)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        records = make_profiles(os.path.join(tmp, "profiles"), args.profiles, args.size_mb)
+        repo = ChunkRepository(os.path.join(tmp, "repo"))
+
+        started = time.monotonic()
+        result = repo.snapshot(records, workers=args.workers)
+        report("initial snapshot", result, time.monotonic() - started)
+
+        with open(os.path.join(records[0]["profile_dir"], "sql", "db.sqlite"), "r+b") as f:
+            f.seek(1000)
+            f.write(os.urandom(4096))
+        started = time.monotonic()
+        result = repo.snapshot(records, workers=args.workers)
+        report("incremental snapshot", result, time.monotonic() - started)
+
+        chunks, size = repo.stats()
+        print(f"repository: {chunks} chunks, {size / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare cold-launch time of Signal with and without page-cache prewarming.
+
+    PYTHONPATH=src python benchmarks/bench_prewarm.py --profile ~/.config/Signal-Work --rounds 5
+
+Before every launch the Signal binary, app.asar and the profile's sql/ and
+IndexedDB/ files are evicted from the page cache with
+posix_fadvise(POSIX_FADV_DONTNEED). The prewarmed launches then run
+smam_package.prewarm alongside Popen, as 'smam launch --prewarm' does. Time
+to ready is measured like 'smam launch' measures it (CPU quiescence of the
+process tree, or the first window if wmctrl or xdotool is installed), and
+each instance is terminated before the next launch. Rounds alternate
+between the two modes so drift in the machine's state hits both equally.
+
+DONTNEED cannot drop dirty pages or pages another process has mapped, so
+close every other Signal instance first. For a reboot-like cold start,
+run as root with --drop-caches, which empties the whole page cache instead.
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import time
+
+from smam_package import latency, prewarm, scheduler
+from smam_package.instances import is_running
+
+
+def launch_once(profile_dir: str, executable: str, warm: bool, timeout: float) -> float:
+    """
+    Launch, wait until ready, terminate, and return the time to ready.
+    """
+    processes = []
+
+    def start(acc):
+        if warm:
+            prewarm.prewarm_in_background(acc["profile_dir"], executable=executable)
+        process = subprocess.Popen([executable, f"--user-data-dir={acc['profile_dir']}"],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, start_new_session=True)
+        processes.append(process)
+        return process
+
+    report = scheduler.batch_launch([{"name": "bench", "profile_dir": profile_dir}], start,
+                                    timeout=timeout, windows=latency.window_probe())
+    result = report.results[0]
+    for process in processes:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        process.wait()
+    # Let Chromium release the profile before the next launch.
+    deadline = time.monotonic() + 10
+    while is_running(profile_dir) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if result.state != scheduler.READY:
+        raise SystemExit(f"Launch did not become ready: {result.state}")
+    return result.time_to_ready
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", required=True, help="profile directory to launch")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--executable", default="signal-desktop")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="drop the whole page cache before each launch (needs root)")
+    args = parser.parse_args()
+
+    profile_dir = os.path.expanduser(args.profile)
+    if is_running(profile_dir):
+        raise SystemExit(f"Signal is running with {profile_dir}; close it first.")
+    files = prewarm.signal_files(args.executable) + prewarm.profile_files(profile_dir)
+    size = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+    print(f"{len(files)} files, {size / 2**20:.1f} MiB read at startup")
+
+    times = {False: [], True: []}
+    for n in range(args.rounds):
+        for warm in (False, True):
+            if args.drop_caches:
+                os.sync()
+                with open("/proc/sys/vm/drop_caches", "w") as f:
+                    f.write("3\n")
+            else:
+                prewarm.evict(files)
+            seconds = launch_once(profile_dir, args.executable, warm, args.timeout)
+            times[warm].append(seconds)
+            label = "prewarmed" if warm else "cold"
+            print(f"round {n + 1}: {label}: {seconds:.2f}s", flush=True)
+
+    cold, warm = statistics.median(times[False]), statistics.median(times[True])
+    print(f"median cold: {cold:.2f}s, prewarmed: {warm:.2f}s, speedup {cold / warm:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare shutil.rmtree with smam_package.fsutil.parallel_rmtree on a synthetic
+Signal profile.
+
+    PYTHONPATH=src python benchmarks/bench_rmtree.py --files 200000
+
+The profile mimics a real one: most files are small attachments spread over
+256 hash-prefix directories under attachments.noindex, plus IndexedDB, cache
+and sql directories. Each contender gets a freshly generated tree; the page
+cache is not dropped, so both run against warm metadata.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from smam_package.fsutil import default_workers, parallel_rmtree
+
+# (subdirectory, share of the files, fan-out into hash-prefix directories)
+LAYOUT = (
+    ("attachments.noindex", 0.80, 256),
+    ("IndexedDB/file__0.indexeddb.leveldb", 0.05, 0),
+    ("Cache/Cache_Data", 0.10, 0),
+    ("stickers.noindex", 0.05, 16),
+)
+
+
+def make_profile(root: str, files: int, seed: int = 1) -> int:
+    """
+    Create the synthetic profile and return its size in bytes.
+    """
+    rng = random.Random(seed)
+    payload = os.urandom(64 * 1024)
+    total = 0
+    for subdir, share, fanout in LAYOUT:
+        base = os.path.join(root, subdir)
+        buckets = [os.path.join(base, f"{i:02x}") for i in range(fanout)] or [base]
+        for bucket in buckets:
+            os.makedirs(bucket, exist_ok=True)
+        for n in range(int(files * share)):
+            # Mostly a few KiB, occasionally up to 64 KiB
+            size = min(len(payload), int(rng.expovariate(1 / 4096)))
+            with open(os.path.join(buckets[n % len(buckets)], f"{n:08x}"), "wb") as f:
+                f.write(payload[:size])
+            total += size
+    os.makedirs(os.path.join(root, "sql"), exist_ok=True)
+    return total
+
+
+def timed(remove, path: str) -> float:
+    started = time.monotonic()
+    remove(path)
+    return time.monotonic() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--dir", default=None, help="where to build the profiles (default: $TMPDIR)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        results = []
+        for label, remove in (
+            ("shutil.rmtree", shutil.rmtree),
+            (f"parallel_rmtree ({args.workers} workers)",
+             lambda p: parallel_rmtree(p, workers=args.workers)),
+        ):
+            path = os.path.join(tmp, "Signal-Bench")
+            print(f"Generating {args.files} files for {label}...", flush=True)
+            size = make_profile(path, args.files)
+            seconds = timed(remove, path)
+            results.append((label, seconds))
+            print(f"{label}: {seconds:.2f}s, {args.files / seconds:.0f} files/s, "
+                  f"{size / seconds / 2**20:.1f} MiB/s")
+
+        baseline = results[0][1]
+        for label, seconds in results[1:]:
+            print(f"{label} speedup over shutil.rmtree: {baseline / seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Incremental profile backups.
+
+Each run writes one tar archive and one manifest per account under
+<dest>/<account>/. Every file in the archive is gzip-compressed on its own,
+so files are compressed in parallel by a process pool and the archive
+itself is written as a stream: memory use does not depend on file sizes.
+The manifest lists every file of the profile with its size, mtime and the
+archive holding its data. A file whose size and mtime match the previous
+manifest is not stored again, only referenced, so a restore reads the chain
+of archives that the newest manifest points to.
+
+Caches that Signal rebuilds on its own (BACKUP_EXCLUDE) are not backed up.
+"""
+
+import fnmatch
+import gzip
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import CORE_FIELDS
+from .storage import atomic_write
+
+BACKUP_EXCLUDE = (
+    "Singleton*", "Cache", "Code Cache", "GPUCache", "DawnCache", "DawnGraphiteCache",
+    "DawnWebGPUCache", "Crashpad", "logs", "temp",
+)
+MANIFEST_SUFFIX = ".manifest.json"
+COMPRESS_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+
+# progress(done, total, relative path) after each file is stored
+BackupProgress = Callable[[int, int, str], None]
+
+
+class BackupResult:
+    """
+    Summary of one backup run.
+    """
+
+    __slots__ = ("manifest", "archive", "files", "changed", "bytes_in", "bytes_out", "seconds")
+
+    def __init__(self, manifest: Path, archive: Path) -> None:
+        self.manifest = manifest
+        self.archive = archive
+        self.files = 0
+        self.changed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+
+def account_backup_dir(dest: Path, name: str) -> Path:
+    """
+    Directory holding the archives and manifests of one account.
+    """
+    return Path(dest) / name.replace("/", "_").replace(" ", "_")
+
+
+def latest_manifest(account_dir: Path) -> Optional[Path]:
+    """
+    Newest manifest of an account, or None if it has never been backed up.
+    """
+    try:
+        names = sorted(n for n in os.listdir(account_dir) if n.endswith(MANIFEST_SUFFIX))
+    except FileNotFoundError:
+        return None
+    return Path(account_dir) / names[-1] if names else None
+
+
+def read_manifest(path: Path) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _excluded(name: str) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in BACKUP_EXCLUDE)
+
+
+def scan_profile(profile_dir: str) -> Tuple[Dict[str, List[int]], List[str], Dict[str, str]]:
+    """
+    Walk a profile. Returns ({relative path: [size, mtime_ns, mode]} for
+    regular files, relative directories, {relative path: target} for symlinks).
+    """
+    files = {}  # type: Dict[str, List[int]]
+    dirs = []  # type: List[str]
+    links = {}  # type: Dict[str, str]
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(profile_dir, rel_dir)) as it:
+            for entry in it:
+                if _excluded(entry.name):
+                    continue
+                rel = os.path.join(rel_dir, entry.name)
+                if entry.is_symlink():
+                    links[rel] = os.readlink(entry.path)
+                elif entry.is_dir():
+                    dirs.append(rel)
+                    stack.append(rel)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[rel] = [st.st_size, st.st_mtime_ns, st.st_mode & 0o7777]
+    return files, sorted(dirs), links
+
+
+def _compress(path: str, spool_dir: str) -> Tuple[str, int, int]:
+    # Runs in a worker process: gzip one file into a spool file. Returns
+    # (spool path, bytes read, compressed size).
+    fd, spool = tempfile.mkstemp(dir=spool_dir, suffix=".gz")
+    read = 0
+    with open(path, "rb") as src, os.fdopen(fd, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as out:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+                read += len(chunk)
+    return spool, read, os.path.getsize(spool)
+
+
+def backup_profile(record: Dict, dest: Path, workers: Optional[int] = None,
+                   full: bool = False, progress: Optional[BackupProgress] = None) -> BackupResult:
+    """
+    Back up the profile of an account record. Only files that changed since
+    the previous manifest are archived unless full is set. At most two files
+    per worker are compressed but not yet written at any time.
+    """
+    started = time.monotonic()
+    profile_dir = record["profile_dir"]
+    account_dir = account_backup_dir(dest, record["name"])
+    account_dir.mkdir(parents=True, exist_ok=True)
+    # Names sort in creation order; latest_manifest() relies on that.
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    n = 0
+    while (account_dir / f"{stamp}-{n:02d}.tar").exists():
+        n += 1
+    archive = account_dir / f"{stamp}-{n:02d}.tar"
+    manifest_path = archive.with_name(archive.stem + MANIFEST_SUFFIX)
+
+    # 1) Compare the profile with the previous manifest.
+    previous = latest_manifest(account_dir)
+    old = {} if full or previous is None else read_manifest(previous)["files"]
+    files, dirs, links = scan_profile(profile_dir)
+    entries = {}  # type: Dict[str, List]
+    changed = []
+    for rel, (size, mtime_ns, mode) in files.items():
+        prev = old.get(rel)
+        if prev is not None and prev[:2] == [size, mtime_ns] and (account_dir / prev[3]).exists():
+            entries[rel] = [size, mtime_ns, mode, prev[3]]
+        else:
+            entries[rel] = [size, mtime_ns, mode, archive.name]
+            changed.append(rel)
+
+    # 2) Compress changed files in parallel and stream them into the archive.
+    result = BackupResult(manifest_path, archive)
+    result.files = len(files)
+    tmp_archive = archive.with_name("." + archive.name + ".tmp")
+    spool_dir = tempfile.mkdtemp(prefix=".spool-", dir=str(account_dir))
+    try:
+        with tarfile.open(str(tmp_archive), "w", format=tarfile.PAX_FORMAT) as tar, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            limit = 2 * (workers or os.cpu_count() or 1)
+            in_flight = deque()  # (relative path, compression future), oldest first
+
+            def write_next() -> None:
+                rel, future = in_flight.popleft()
+                try:
+                    spool, read, size = future.result()
+                except FileNotFoundError:
+                    del entries[rel]  # deleted since the scan
+                    return
+                info = tarfile.TarInfo(rel + ".gz")
+                info.size = size
+                info.mode = entries[rel][2]
+                info.mtime = entries[rel][1] // 10**9
+                with open(spool, "rb") as f:
+                    tar.addfile(info, f)
+                os.unlink(spool)
+                result.changed += 1
+                result.bytes_in += read
+                result.bytes_out += size
+                if progress:
+                    progress(result.changed, len(changed), rel)
+
+            for rel in changed:
+                if len(in_flight) >= limit:
+                    write_next()
+                in_flight.append((rel, pool.submit(
+                    _compress, os.path.join(profile_dir, rel), spool_dir)))
+            while in_flight:
+                write_next()
+        os.replace(str(tmp_archive), str(archive))
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        if tmp_archive.exists():
+            tmp_archive.unlink()
+
+    # 3) The manifest makes the backup visible; write it last.
+    manifest = {
+        "account": {k: v for k, v in record.items() if k not in ("last_backup",) + CORE_FIELDS[2:]},
+        "created": time.time(),
+        "archive": archive.name,
+        "parent": previous.name if previous is not None and not full else None,
+        "files": entries,
+        "dirs": dirs,
+        "symlinks": links,
+    }
+    atomic_write(manifest_path, json.dumps(manifest, ensure_ascii=False))
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def restore_profile(manifest_path: Path, target_dir: str,
+                    progress: Optional[BackupProgress] = None) -> Dict:
+    """
+    Recreate a profile from a manifest and the archives it references into
+    target_dir, which must not exist or be empty. Returns the account record
+    stored in the manifest. Raises ValueError if an archive is missing data.
+    """
+    manifest_path = Path(manifest_path)
+    manifest = read_manifest(manifest_path)
+    target = Path(target_dir)
+    if target.exists() and any(target.iterdir()):
+        raise ValueError(f"{target} is not empty.")
+    target.mkdir(parents=True, exist_ok=True)
+    for rel in manifest["dirs"]:
+        (target / rel).mkdir(parents=True, exist_ok=True)
+
+    # Read each archive once, newest first, taking only what it still holds.
+    by_archive = {}  # type: Dict[str, Dict[str, List]]
+    for rel, entry in manifest["files"].items():
+        by_archive.setdefault(entry[3], {})[rel + ".gz"] = [rel] + entry
+    total = len(manifest["files"])
+    done = 0
+    for archive_name in sorted(by_archive, reverse=True):
+        wanted = by_archive[archive_name]
+        with tarfile.open(str(manifest_path.parent / archive_name), "r:") as tar:
+            for member in tar:
+                item = wanted.pop(member.name, None)
+                if item is None or not member.isfile():
+                    continue
+                rel, size, mtime_ns, mode = item[:4]
+                path = target / rel
+                with tar.extractfile(member) as raw, gzip.GzipFile(fileobj=raw) as data, \
+                        open(path, "wb") as out:
+                    shutil.copyfileobj(data, out, CHUNK_SIZE)
+                os.chmod(path, mode)
+                os.utime(path, ns=(mtime_ns, mtime_ns))
+                done += 1
+                if progress:
+                    progress(done, total, rel)
+        if wanted:
+            raise ValueError(f"{archive_name} is missing {len(wanted)} file(s), "
+                             f"e.g. {next(iter(wanted))[:-3]}.")
+
+    for rel, link_target in manifest["symlinks"].items():
+        os.symlink(link_target, target / rel)
+    return dict(manifest["account"])
@@ -0,0 +1,188 @@
+"""
+Bulk account import and export.
+
+A manifest lists accounts, one per line or row, with the fields 'name',
+optional 'profile_dir' and optional 'desktop_icon'. Accepted formats are
+NDJSON, a JSON array (for example an exported accounts.json) and CSV with a
+header row. Any other fields of a JSON record are kept in the account record.
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, IO, Iterable, List, Optional, Tuple
+
+from .desktop import write_desktop_file
+from .models import AccountTable, canonical_path, profile_identity
+from .storage import AccountStore
+
+MANIFEST_FORMATS = ("ndjson", "json", "csv")
+CSV_FIELDS = ("name", "profile_dir")
+
+# Record fields recomputed on import rather than copied from the manifest
+_DERIVED_FIELDS = ("desktop_icon", "canonical_dir", "st_dev", "st_ino")
+
+# progress(done, total, name, error): error is None for a successful item
+ProgressCallback = Callable[[int, int, str, Optional[str]], None]
+
+
+class ImportReport:
+    """
+    Outcome of a bulk import: names that were registered and (name, reason)
+    pairs for entries that were skipped.
+    """
+
+    __slots__ = ("imported", "failed")
+
+    def __init__(self) -> None:
+        self.imported = []  # type: List[str]
+        self.failed = []  # type: List[Tuple[str, str]]
+
+
+def detect_format(path: str) -> str:
+    """
+    Guess the manifest format from the file extension (NDJSON by default).
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix == ".json":
+        return "json"
+    return "ndjson"
+
+
+def _truthy(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "y", "yes", "true")
+    return bool(value)
+
+
+def read_manifest(f: IO[str], fmt: str) -> List[Dict]:
+    """
+    Parse a whole manifest. Raises ValueError with the offending line for
+    malformed input, before anything has been created.
+    """
+    if fmt == "csv":
+        return [dict(row) for row in csv.DictReader(f)]
+    if fmt == "json":
+        entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("A JSON manifest must be an array of account objects.")
+        return entries
+    entries = []
+    for lineno, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {lineno}: {e}") from e
+    return entries
+
+
+def validate_manifest(entries: List[Dict], table: AccountTable,
+                      default_profile_dir: Callable[[str], Path]) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    Check every entry against the registry and against the rest of the
+    manifest. Returns the entries that can be created, normalized to account
+    records plus a 'desktop_icon' flag, and (label, reason) for the others.
+    """
+    valid = []  # type: List[Dict]
+    invalid = []  # type: List[Tuple[str, str]]
+    names = set()
+    dirs = set()
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            invalid.append((f"entry {number}", "not an object"))
+            continue
+        name = str(entry.get("name") or "").strip()
+        if not name:
+            invalid.append((f"entry {number}", "missing name"))
+            continue
+        profile_dir = os.path.abspath(os.path.expanduser(
+            entry.get("profile_dir") or str(default_profile_dir(name))))
+        canonical = canonical_path(profile_dir)
+        if name in names or table.index_of(name) is not None:
+            invalid.append((name, "an account with this name already exists"))
+            continue
+        if canonical in dirs or table.index_of_path(profile_dir) is not None:
+            invalid.append((name, f"profile directory {profile_dir} is already in use"))
+            continue
+        names.add(name)
+        dirs.add(canonical)
+        record = {k: v for k, v in entry.items() if k not in _DERIVED_FIELDS}
+        record.update(name=name, profile_dir=profile_dir,
+                      desktop_icon=_truthy(entry.get("desktop_icon")))
+        valid.append(record)
+    return valid, invalid
+
+
+def _provision(item: Dict) -> Dict:
+    # Runs in a worker thread: create the directory and launcher, then
+    # resolve the directory's identity for the registry.
+    record = {k: v for k, v in item.items() if k != "desktop_icon"}
+    Path(record["profile_dir"]).mkdir(parents=True, exist_ok=True)
+    if item["desktop_icon"]:
+        write_desktop_file(record["name"], record["profile_dir"])
+    record.update(profile_identity(record["profile_dir"]))
+    return record
+
+
+def import_manifest(entries: List[Dict], store: AccountStore,
+                    default_profile_dir: Callable[[str], Path],
+                    workers: int = 8, progress: Optional[ProgressCallback] = None,
+                    dry_run: bool = False) -> ImportReport:
+    """
+    Import a parsed manifest: validate all entries up front, create profile
+    directories and launchers in parallel, then commit every successfully
+    provisioned account to the registry with a single write. Failing entries
+    are reported and skipped; they never abort the batch.
+    """
+    report = ImportReport()
+    items, invalid = validate_manifest(entries, store.load_table(), default_profile_dir)
+    total = len(items) + len(invalid)
+    done = 0
+    for label, reason in invalid:
+        done += 1
+        report.failed.append((label, reason))
+        if progress:
+            progress(done, total, label, reason)
+    if dry_run:
+        report.imported = [item["name"] for item in items]
+        return report
+
+    provisioned = {}  # type: Dict[int, Dict]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_provision, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            done += 1
+            try:
+                provisioned[i] = future.result()
+                error = None
+            except OSError as e:
+                error = str(e)
+                report.failed.append((items[i]["name"], error))
+            if progress:
+                progress(done, total, items[i]["name"], error)
+
+    # Keep manifest order in the registry.
+    records = [provisioned[i] for i in sorted(provisioned)]
+    if records:
+        store.add_many(records)
+    report.imported = [record["name"] for record in records]
+    return report
+
+
+def export_csv(records: Iterable[Dict], out: IO[str]) -> int:
+    """
+    Stream records as CSV with a header row. Returns the number of rows.
+    """
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDS)
+    count = 0
+    for count, record in enumerate(records, start=1):
+        writer.writerow([record[field] for field in CSV_FIELDS])
+    return count
@@ -0,0 +1,332 @@
+"""
+Content-addressed backup repository shared by all profiles.
+
+Files are split into content-defined chunks with a gear rolling hash
+(boundaries depend on the bytes around them, not on offsets, so an insert
+only changes the chunks it touches). Each chunk is stored once under its
+SHA-256, zlib-compressed, in <repo>/chunks/. A snapshot is a JSON file in
+<repo>/snapshots/ that lists, for every profile, its account record and the
+chunk ids of every file, so near-identical profiles cost little more than
+one. A file whose size and mtime match the previous snapshot reuses its
+chunk list without being read.
+
+Attachments, stickers and badges (WHOLE_FILE_DIRS) are written once and
+never modified, so there is nothing for content-defined chunking to find in
+them: each is stored as a single chunk, hashed and compressed as it is
+streamed, which skips the byte-by-byte gear hash where most of a profile's
+bytes are. Only the files that change in place (databases, settings) are
+chunked.
+
+Chunking runs in a process pool, one file per task; workers write the
+chunks they produce directly into the repository.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .backup import scan_profile
+from .dedup import DEDUP_DIRS
+from .models import CORE_FIELDS
+from .storage import atomic_write
+
+MIN_CHUNK = 16 * 1024
+AVG_CHUNK = 64 * 1024
+MAX_CHUNK = 256 * 1024
+READ_SIZE = 4 * 1024 * 1024
+# Top-level directories whose files are stored as one chunk each
+WHOLE_FILE_DIRS = DEDUP_DIRS
+
+_MASK64 = (1 << 64) - 1
+# A boundary is where the top log2(AVG_CHUNK) bits of the hash are zero; high
+# bits depend on the last 64 bytes, low bits only on the last few.
+_CUT_MASK = (AVG_CHUNK - 1) << (64 - (AVG_CHUNK - 1).bit_length())
+# Fixed table of 64-bit values, one per byte value
+GEAR = [int.from_bytes(hashlib.sha256(bytes([b])).digest()[:8], "little") for b in range(256)]
+
+# progress(done, total, "profile/relative path") after each file
+IngestProgress = Callable[[int, int, str], None]
+
+
+def find_cut(data, start: int, end: int) -> int:
+    """
+    Length of the first chunk of data[start:end] (which holds at least
+    MAX_CHUNK bytes unless it is the end of the file).
+    """
+    size = end - start
+    if size <= MIN_CHUNK:
+        return size
+    limit = start + min(size, MAX_CHUNK)
+    h = 0
+    gear = GEAR
+    # The hash only depends on the last 64 bytes, so nothing before that
+    # window needs hashing.
+    for i in range(start + MIN_CHUNK - 64, start + MIN_CHUNK):
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+    for i in range(start + MIN_CHUNK, limit):
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+        if not h & _CUT_MASK:
+            return i + 1 - start
+    return limit - start
+
+
+def iter_chunks(path: str) -> Iterator[bytes]:
+    """
+    Content-defined chunks of a file, read in READ_SIZE blocks.
+    """
+    buf = bytearray()
+    eof = False
+    with open(path, "rb") as f:
+        while True:
+            while not eof and len(buf) < MAX_CHUNK:
+                block = f.read(READ_SIZE)
+                if not block:
+                    eof = True
+                buf += block
+            if not buf:
+                return
+            pos = 0
+            # Cut as many chunks as possible from what is buffered.
+            while len(buf) - pos >= MAX_CHUNK or (eof and pos < len(buf)):
+                n = find_cut(buf, pos, len(buf))
+                yield bytes(buf[pos:pos + n])
+                pos += n
+            del buf[:pos]
+            if eof and not buf:
+                return
+
+
+def _chunk_path(repo: str, chunk_id: str) -> str:
+    return os.path.join(repo, "chunks", chunk_id[:2], chunk_id)
+
+
+def _store_whole(repo: str, path: str) -> Tuple[List[str], int, int, int]:
+    # Hash and compress in one streaming pass into a temporary file, then
+    # move it to its content address (or drop it if that chunk exists).
+    digest = hashlib.sha256()
+    compressor = zlib.compressobj(6)
+    read = written = 0
+    fd, tmp = tempfile.mkstemp(dir=os.path.join(repo, "chunks"), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out, open(path, "rb") as f:
+            for block in iter(lambda: f.read(READ_SIZE), b""):
+                digest.update(block)
+                read += len(block)
+                data = compressor.compress(block)
+                out.write(data)
+                written += len(data)
+            data = compressor.flush()
+            out.write(data)
+            written += len(data)
+        chunk_id = digest.hexdigest()
+        target = _chunk_path(repo, chunk_id)
+        if os.path.exists(target):
+            os.unlink(tmp)
+            return [chunk_id], read, 0, 0
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return [chunk_id], read, 1, written
+
+
+def _ingest_file(repo: str, path: str, whole: bool) -> Tuple[List[str], int, int, int]:
+    # Runs in a worker process. Returns (chunk ids, bytes read, new chunks,
+    # compressed bytes written).
+    if whole:
+        return _store_whole(repo, path)
+    ids = []
+    read = new = written = 0
+    for chunk in iter_chunks(path):
+        chunk_id = hashlib.sha256(chunk).hexdigest()
+        ids.append(chunk_id)
+        read += len(chunk)
+        target = _chunk_path(repo, chunk_id)
+        if os.path.exists(target):
+            continue
+        data = zlib.compress(chunk, 6)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Two workers may store the same chunk; both write identical data.
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        new += 1
+        written += len(data)
+    return ids, read, new, written
+
+
+class SnapshotResult:
+    """
+    Summary of one snapshot: logical bytes of all files, bytes actually read
+    (changed files) and compressed bytes added to the repository.
+    """
+
+    __slots__ = ("path", "files", "logical", "read", "new_chunks", "stored", "seconds")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.files = 0
+        self.logical = 0
+        self.read = 0
+        self.new_chunks = 0
+        self.stored = 0
+        self.seconds = 0.0
+
+
+class ChunkRepository:
+    """
+    A repository directory with chunks/ and snapshots/.
+    """
+
+    def __init__(self, root) -> None:
+        self.root = Path(root)
+
+    def snapshots(self) -> List[Path]:
+        try:
+            return sorted((self.root / "snapshots").glob("*.json"))
+        except FileNotFoundError:
+            return []
+
+    def load_snapshot(self, path: Path) -> Dict:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def snapshot(self, records: List[Dict], workers: Optional[int] = None,
+                 progress: Optional[IngestProgress] = None) -> SnapshotResult:
+        """
+        Store the current state of the profiles of the given account records
+        as a new snapshot.
+        """
+        started = time.monotonic()
+        (self.root / "chunks").mkdir(parents=True, exist_ok=True)
+        (self.root / "snapshots").mkdir(parents=True, exist_ok=True)
+        previous = self.snapshots()
+        old = self.load_snapshot(previous[-1])["profiles"] if previous else {}
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        n = 0
+        while (self.root / "snapshots" / f"{stamp}-{n:02d}.json").exists():
+            n += 1
+        result = SnapshotResult(self.root / "snapshots" / f"{stamp}-{n:02d}.json")
+
+        # 1) Reuse chunk lists of files unchanged since the previous snapshot.
+        profiles = {}  # type: Dict[str, Dict]
+        todo = []  # type: List[Tuple[str, str, str, bool]]
+        for record in records:
+            files, dirs, links = scan_profile(record["profile_dir"])
+            before = old.get(record["name"], {}).get("files", {})
+            entries = {}
+            for rel, (size, mtime_ns, mode) in files.items():
+                prev = before.get(rel)
+                if prev is not None and prev[:2] == [size, mtime_ns]:
+                    entries[rel] = [size, mtime_ns, mode, prev[3]]
+                else:
+                    entries[rel] = [size, mtime_ns, mode, None]
+                    whole = rel.split(os.sep, 1)[0] in WHOLE_FILE_DIRS
+                    todo.append((record["name"], rel, os.path.join(record["profile_dir"], rel),
+                                 whole))
+                result.logical += size
+            result.files += len(files)
+            profiles[record["name"]] = {
+                "account": {k: v for k, v in record.items() if k not in CORE_FIELDS[2:]},
+                "files": entries, "dirs": dirs, "symlinks": links,
+            }
+
+        # 2) Chunk the rest in parallel.
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_ingest_file, str(self.root), path, whole)
+                       for _, _, path, whole in todo]
+            for done, ((name, rel, _, _), future) in enumerate(zip(todo, futures), start=1):
+                try:
+                    ids, read, new, written = future.result()
+                except FileNotFoundError:
+                    del profiles[name]["files"][rel]  # deleted since the scan
+                    continue
+                profiles[name]["files"][rel][3] = ids
+                result.read += read
+                result.new_chunks += new
+                result.stored += written
+                if progress:
+                    progress(done, len(todo), f"{name}/{rel}")
+
+        # 3) The snapshot file makes it visible; write it last.
+        atomic_write(result.path, json.dumps({"created": time.time(), "profiles": profiles},
+                                             ensure_ascii=False, separators=(",", ":")))
+        result.seconds = time.monotonic() - started
+        return result
+
+    def restore(self, snapshot_path: Path, name: str, target_dir: str) -> Dict:
+        """
+        Recreate one profile of a snapshot in target_dir, which must not exist
+        or be empty. Returns the account record stored in the snapshot.
+        Raises KeyError if the snapshot has no such profile and ValueError if
+        a chunk is missing or damaged.
+        """
+        profile = self.load_snapshot(snapshot_path)["profiles"][name]
+        target = Path(target_dir)
+        if target.exists() and any(target.iterdir()):
+            raise ValueError(f"{target} is not empty.")
+        target.mkdir(parents=True, exist_ok=True)
+        for rel in profile["dirs"]:
+            (target / rel).mkdir(parents=True, exist_ok=True)
+        for rel, (size, mtime_ns, mode, ids) in profile["files"].items():
+            path = target / rel
+            with open(path, "wb") as out:
+                for chunk_id in ids:
+                    try:
+                        intact = self._copy_chunk(chunk_id, out)
+                    except (OSError, zlib.error) as e:
+                        raise ValueError(f"chunk {chunk_id} of {rel}: {e}") from e
+                    if not intact:
+                        raise ValueError(f"chunk {chunk_id} of {rel} is damaged.")
+            os.chmod(path, mode)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        for rel, link_target in profile["symlinks"].items():
+            os.symlink(link_target, target / rel)
+        return dict(profile["account"])
+
+    def _copy_chunk(self, chunk_id: str, out) -> bool:
+        # Decompress in blocks: whole-file chunks can be as large as an
+        # attachment. Returns False if the content does not match its id.
+        digest = hashlib.sha256()
+        decompressor = zlib.decompressobj()
+        with open(_chunk_path(str(self.root), chunk_id), "rb") as f:
+            for block in iter(lambda: f.read(READ_SIZE), b""):
+                data = decompressor.decompress(block)
+                digest.update(data)
+                out.write(data)
+        data = decompressor.flush()
+        digest.update(data)
+        out.write(data)
+        return decompressor.eof and digest.hexdigest() == chunk_id
+
+    def stats(self) -> Tuple[int, int]:
+        """
+        (number of chunks, compressed bytes) in the repository. Temporary
+        files of an interrupted ingest are not chunks and are not counted.
+        """
+        count = size = 0
+        for dirpath, _, names in os.walk(str(self.root / "chunks")):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                count += 1
+                size += os.path.getsize(os.path.join(dirpath, name))
+        return count, size
@@ -0,0 +1,283 @@
+"""
+Deduplication of attachments across profiles.
+
+Accounts that share groups keep identical attachment files in every profile.
+dedup() finds them without reading most files: candidates are grouped by
+(device, size) first, and only files whose size occurs more than once are
+hashed (SHA-256, streamed). Digests are kept in a SQLite cache keyed on
+(st_dev, st_ino) and valid while size and mtime are unchanged, so later runs
+only hash new files. Each duplicate is then replaced, via a temporary name
+and os.replace, by a reflink of the kept copy where the filesystem supports
+it (the files stay independent) and by a hard link otherwise. Temporary
+names left behind by a crashed run are removed by the next scan.
+"""
+
+import errno
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .fsutil import default_workers, reflink
+
+# Profile subdirectories whose files are written once and never modified
+DEDUP_DIRS = ("attachments.noindex", "stickers.noindex", "badges.noindex")
+MIN_SIZE = 4096  # smaller files are not worth a link
+# Marks the temporary link _replace() creates next to a duplicate:
+# .<name>.smam-dedup.<pid>.<random>
+TEMP_MARKER = ".smam-dedup."
+
+CHUNK_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (dev, ino)
+)
+"""
+
+# A candidate file: (path, st_dev, st_ino, st_size, st_mtime_ns, st_nlink)
+Candidate = Tuple[str, int, int, int, int, int]
+
+# progress(done, total) while hashing
+HashProgress = Callable[[int, int], None]
+
+
+class DedupReport:
+    """
+    Outcome of a dedup run. bytes_saved counts duplicates whose data is
+    freed (or would be, in a dry run).
+    """
+
+    __slots__ = ("files", "hashed", "cached", "duplicates", "bytes_saved",
+                 "methods", "failed")
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.hashed = 0
+        self.cached = 0
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.methods = {}  # type: Dict[str, int]
+        self.failed = []  # type: List[Tuple[str, str]]
+
+
+def _scan(directory: str, min_size: int, out: List[Candidate]) -> None:
+    try:
+        it = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    with it:
+        for entry in it:
+            if TEMP_MARKER in entry.name:
+                _remove_stale_temp(entry.path)
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                _scan(entry.path, min_size, out)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                if st.st_size >= min_size:
+                    out.append((entry.path, st.st_dev, st.st_ino, st.st_size,
+                                st.st_mtime_ns, st.st_nlink))
+
+
+def _remove_stale_temp(path: str) -> None:
+    # Left behind by a run that crashed between link and rename. Another
+    # process's temporary link is in use until that process exits.
+    try:
+        pid = int(path.rsplit(TEMP_MARKER, 1)[1].split(".")[0])
+        os.kill(pid, 0)
+        return
+    except ProcessLookupError:
+        pass
+    except (ValueError, IndexError, PermissionError):
+        return
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def find_candidates(profile_dirs: Iterable[str], min_size: int = MIN_SIZE) -> List[Candidate]:
+    """
+    Every file in the DEDUP_DIRS of the given profiles that is at least
+    min_size bytes, one entry per inode.
+    """
+    files = []  # type: List[Candidate]
+    for profile_dir in profile_dirs:
+        for sub in DEDUP_DIRS:
+            _scan(os.path.join(profile_dir, sub), min_size, files)
+    seen = set()
+    unique = []
+    for item in files:
+        if (item[1], item[2]) not in seen:
+            seen.add((item[1], item[2]))
+            unique.append(item)
+    return unique
+
+
+def file_digest(path: str) -> str:
+    """
+    SHA-256 of a file, read in CHUNK_SIZE pieces.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Digests of files by (st_dev, st_ino), valid while size and mtime match.
+    """
+
+    def __init__(self, path) -> None:
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def lookup(self, files: List[Candidate]) -> Dict[Tuple[int, int], str]:
+        known = {}
+        for dev, ino, size, mtime_ns, digest in self.conn.execute(
+                "SELECT dev, ino, size, mtime_ns, digest FROM hashes"):
+            known[(dev, ino)] = (size, mtime_ns, digest)
+        found = {}
+        for _, dev, ino, size, mtime_ns, _ in files:
+            entry = known.get((dev, ino))
+            if entry is not None and entry[:2] == (size, mtime_ns):
+                found[(dev, ino)] = entry[2]
+        return found
+
+    def store(self, rows: List[Tuple[int, int, int, int, str]]) -> None:
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", rows)
+
+    def prune(self, files: List[Candidate]) -> None:
+        """
+        Forget inodes that are no longer among the candidates.
+        """
+        live = {(f[1], f[2]) for f in files}
+        stale = [key for key in self.conn.execute("SELECT dev, ino FROM hashes")
+                 if key not in live]
+        with self.conn:
+            self.conn.executemany("DELETE FROM hashes WHERE dev = ? AND ino = ?", stale)
+
+
+def _unchanged(item: Candidate) -> bool:
+    # Same inode, size and mtime as when the file was hashed.
+    st = os.lstat(item[0])
+    return (st.st_ino, st.st_size, st.st_mtime_ns) == (item[2], item[3], item[4])
+
+
+def _link_beside(source: str, path: str) -> Tuple[str, str]:
+    # Reflink or hard link source under a fresh temporary name next to path;
+    # names are never reused, so a leftover from a crashed run cannot clash.
+    # Returns (temporary path, method).
+    directory, name = os.path.split(path)
+    for _ in range(100):
+        tmp = os.path.join(directory, f".{name}{TEMP_MARKER}{os.getpid()}.{os.urandom(4).hex()}")
+        try:
+            if reflink(source, tmp):
+                return tmp, "reflink"
+            os.link(source, tmp)
+            return tmp, "hardlink"
+        except FileExistsError:
+            continue
+    raise FileExistsError(errno.EEXIST, "No free temporary name", path)
+
+
+def _replace(keep: Candidate, dup: Candidate) -> str:
+    # Swap dup for a reflink or hard link of keep, unless either file changed
+    # since it was hashed. Returns the method used.
+    for item in (keep, dup):
+        if not _unchanged(item):
+            raise OSError(f"{item[0]} changed while deduplicating")
+    path = dup[0]
+    tmp, method = _link_beside(keep[0], path)
+    try:
+        # keep must still be what was hashed after the link or clone was made
+        # (and a hard link must point at that very inode).
+        if not _unchanged(keep) or (method == "hardlink" and os.lstat(tmp).st_ino != keep[2]):
+            raise OSError(f"{keep[0]} changed while deduplicating")
+        os.replace(tmp, path)
+    except OSError:
+        os.unlink(tmp)
+        raise
+    return method
+
+
+def dedup(profile_dirs: Iterable[str], cache: HashCache, dry_run: bool = False,
+          workers: Optional[int] = None, min_size: int = MIN_SIZE,
+          progress: Optional[HashProgress] = None) -> DedupReport:
+    """
+    Find identical attachment files across profiles and replace all but one
+    copy of each with links to it. The copy with the most links is kept.
+    """
+    report = DedupReport()
+    files = find_candidates(profile_dirs, min_size)
+    report.files = len(files)
+
+    # 1) Only files sharing (device, size) with another file can be duplicates.
+    by_size = {}  # type: Dict[Tuple[int, int], List[Candidate]]
+    for item in files:
+        by_size.setdefault((item[1], item[3]), []).append(item)
+    candidates = [item for group in by_size.values() if len(group) > 1 for item in group]
+
+    # 2) Hash them, reusing cached digests.
+    digests = cache.lookup(candidates)
+    report.cached = len(digests)
+    todo = [item for item in candidates if (item[1], item[2]) not in digests]
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        for done, (item, digest) in enumerate(
+                zip(todo, pool.map(lambda c: _digest_or_none(c[0]), todo)), start=1):
+            if digest is not None:
+                digests[(item[1], item[2])] = digest
+                rows.append((item[1], item[2], item[3], item[4], digest))
+            if progress:
+                progress(done, len(todo))
+    report.hashed = len(rows)
+    cache.store(rows)
+    cache.prune(files)
+
+    # 3) Link duplicates to one kept copy per (device, digest).
+    groups = {}  # type: Dict[Tuple[int, str], List[Candidate]]
+    for item in candidates:
+        digest = digests.get((item[1], item[2]))
+        if digest is not None:
+            groups.setdefault((item[1], digest), []).append(item)
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        group.sort(key=lambda c: (-c[5], c[0]))
+        keep = group[0]
+        for dup in group[1:]:
+            if dry_run:
+                method = "would link"
+            else:
+                try:
+                    method = _replace(keep, dup)
+                except OSError as e:
+                    report.failed.append((dup[0], str(e)))
+                    continue
+            report.duplicates += 1
+            if dup[5] == 1:
+                report.bytes_saved += dup[3]
+            report.methods[method] = report.methods.get(method, 0) + 1
+    return report
+
+
+def _digest_or_none(path: str) -> Optional[str]:
+    try:
+        return file_digest(path)
+    except OSError:
+        return None
+
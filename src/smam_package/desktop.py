@@ -0,0 +1,51 @@
+"""
+.desktop launcher files for Signal accounts.
+"""
+
+from pathlib import Path
+
+
+def applications_dir() -> Path:
+    """
+    Where launchers are placed (typical location in many Linux distros).
+    """
+    return Path.home() / ".local" / "share" / "applications"
+
+
+def desktop_file_name(account_name: str) -> str:
+    """
+    File name of an account's launcher, e.g. "Signal-Work.desktop".
+    """
+    sanitized_name = account_name.replace(" ", "_")
+    return f"Signal-{sanitized_name}.desktop"
+
+
+def desktop_entry(account_name: str, profile_dir_str: str) -> str:
+    """
+    Content of the .desktop file for an account.
+    """
+    return f"""[Desktop Entry]
+Name=Signal - {account_name}
+Comment=Launch Signal for the '{account_name}' profile
+Exec=signal-desktop --user-data-dir="{profile_dir_str}"
+Terminal=false
+Type=Application
+Icon=signal-desktop
+Categories=Network;InstantMessaging;"""
+
+
+def write_desktop_file(account_name: str, profile_dir_str: str) -> Path:
+    """
+    Write (or overwrite) the launcher for an account, make it executable and
+    return its path.
+    """
+    target_dir = applications_dir()
+    target_dir.mkdir(parents=True, exist_ok=True)
+    desktop_path = target_dir / desktop_file_name(account_name)
+
+    with open(desktop_path, "w", encoding="utf-8") as f:
+        f.write(desktop_entry(account_name, profile_dir_str))
+
+    # Make it executable
+    desktop_path.chmod(0o755)
+    return desktop_path
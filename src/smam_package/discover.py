@@ -0,0 +1,95 @@
+"""
+Discovery of Signal profile directories that are not registered.
+
+Each root (normally ~/.config) is listed with a single os.scandir. Hidden
+entries and symlinks are skipped, directory-ness comes from the d_type that
+scandir already returned, and a candidate is a Signal profile if it holds
+one of PROFILE_MARKERS. Candidate paths are built from the root's canonical
+path, so they need no resolve of their own: the root is resolved once, and
+each candidate costs a few stat calls at most.
+"""
+
+import os
+from typing import Dict, Iterable, List
+
+from .models import AccountTable, canonical_path
+
+# Files that only a Signal Desktop profile has: the message database of a
+# linked profile, or the window state every profile writes on first start.
+PROFILE_MARKERS = (os.path.join("sql", "db.sqlite"), "ephemeral.json")
+
+
+def is_profile(path: str) -> bool:
+    """
+    True if path holds one of PROFILE_MARKERS.
+    """
+    for marker in PROFILE_MARKERS:
+        try:
+            os.stat(os.path.join(path, marker))
+            return True
+        except OSError:
+            continue
+    return False
+
+
+def account_name_for(dir_name: str, default_name: str) -> str:
+    """
+    Suggested account name for a profile directory: "Signal-Work" -> "Work",
+    "Signal" -> default_name, anything else unchanged.
+    """
+    if dir_name == "Signal":
+        return default_name
+    if dir_name.startswith("Signal-") and len(dir_name) > len("Signal-"):
+        return dir_name[len("Signal-"):].replace("_", " ")
+    return dir_name
+
+
+def find_profiles(roots: Iterable[str]) -> List[Dict]:
+    """
+    Signal profiles directly inside the given roots, as account records
+    carrying their identity fields (canonical_dir, st_dev, st_ino).
+    """
+    found = []
+    seen = set()  # canonical paths
+    for root in roots:
+        root = canonical_path(root)
+        if root in seen:
+            continue
+        seen.add(root)
+        try:
+            it = os.scandir(root)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                if entry.name.startswith(".") or entry.is_symlink() or not entry.is_dir():
+                    continue
+                if not is_profile(entry.path):
+                    continue
+                st = entry.stat()
+                found.append({"name": entry.name, "profile_dir": entry.path,
+                              "canonical_dir": entry.path, "st_dev": st.st_dev,
+                              "st_ino": st.st_ino})
+    found.sort(key=lambda record: record["profile_dir"])
+    return found
+
+
+def unregistered(candidates: List[Dict], table: AccountTable, default_name: str) -> List[Dict]:
+    """
+    The candidates no registered account uses, with unique account names
+    ("Work", "Work-2", ...) that do not clash with registered accounts.
+    """
+    records = []
+    names = set()  # account names handed out so far
+    for candidate in candidates:
+        if table.index_of_identity(candidate) is not None:
+            continue
+        base = account_name_for(candidate["name"], default_name)
+        name = base
+        n = 1
+        while name in names or table.index_of(name) is not None:
+            n += 1
+            name = f"{base}-{n}"
+        names.add(name)
+        records.append(dict(candidate, name=name))
+    return records
@@ -0,0 +1,340 @@
+"""
+Filesystem helpers for large Signal profile directories.
+"""
+
+import errno
+import fcntl
+import fnmatch
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence
+
+FICLONE = 0x40049409  # ioctl from linux/fs.h: share all extents of another file
+
+# Parts of a Signal profile that belong to one linked account (database,
+# its key, message attachments) or to one running instance, and so are never
+# copied into a new profile. Patterns match entry names at any depth.
+CLONE_EXCLUDE = (
+    "Singleton*", "sql", "config.json", "attachments.noindex", "stickers.noindex",
+    "badges.noindex", "drafts.noindex", "temp", "logs",
+)
+# Files that are never modified in place, so a new profile can share them
+# through a hard link when reflinks are not available.
+IMMUTABLE_FILES = ("*.bdic",)
+
+# Clone methods, cheapest first
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY_FILE_RANGE = "copy_file_range"
+COPY = "copy"
+
+
+def default_workers() -> int:
+    """
+    Thread count for I/O-bound tree operations: these spend their time in
+    syscalls, so use more threads than CPUs.
+    """
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+class RemovalStats:
+    """
+    What parallel_rmtree() removed and how fast.
+    """
+
+    __slots__ = ("files", "dirs", "bytes", "seconds", "errors")
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = []  # (path, OSError) pairs
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.files} files, {self.dirs} dirs, {self.bytes / 2**20:.1f} MiB "
+                f"in {self.seconds:.2f}s ({self.files_per_second:.0f} files/s, "
+                f"{self.bytes_per_second / 2**20:.1f} MiB/s)")
+
+
+class _Dir:
+    # A directory being removed. 'pending' counts its own scan plus every
+    # subdirectory not yet removed; the directory is rmdir'ed when it hits 0.
+    __slots__ = ("path", "parent", "pending")
+
+    def __init__(self, path: str, parent: Optional["_Dir"]) -> None:
+        self.path = path
+        self.parent = parent
+        self.pending = 1
+
+
+def parallel_rmtree(path, workers: Optional[int] = None,
+                    ignore_errors: bool = False) -> RemovalStats:
+    """
+    Delete a directory tree like shutil.rmtree, but with subdirectories
+    scanned and emptied concurrently by a bounded thread pool. Each directory
+    is listed with os.scandir on an O_NOFOLLOW descriptor and its files are
+    unlinked relative to that descriptor; symlinks are removed, never followed.
+
+    Returns RemovalStats with counts and throughput. Errors are collected;
+    unless ignore_errors is set, the first one is raised after the walk.
+    """
+    root = os.fspath(path)
+    st = os.lstat(root)
+    if stat.S_ISLNK(st.st_mode):
+        raise OSError("Cannot call parallel_rmtree on a symbolic link")
+    if not stat.S_ISDIR(st.st_mode):
+        raise NotADirectoryError(root)
+
+    stats = RemovalStats()
+    lock = threading.Lock()
+    finished = threading.Event()
+    started = time.monotonic()
+
+    def fail(target: str, error: OSError) -> None:
+        with lock:
+            stats.errors.append((target, error))
+
+    def release(node: Optional[_Dir]) -> None:
+        # Drop one pending unit; remove directories that became empty, bottom-up.
+        while node is not None:
+            with lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+            try:
+                os.rmdir(node.path)
+                with lock:
+                    stats.dirs += 1
+            except OSError as e:
+                fail(node.path, e)
+            if node.parent is None:
+                finished.set()
+            node = node.parent
+
+    def scan(node: _Dir) -> None:
+        try:
+            subdirs = []
+            files = nbytes = 0
+            fd = os.open(node.path, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+            try:
+                with os.scandir(fd) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.name)
+                                continue
+                            size = entry.stat(follow_symlinks=False).st_size
+                            os.unlink(entry.name, dir_fd=fd)
+                            files += 1
+                            nbytes += size
+                        except OSError as e:
+                            fail(os.path.join(node.path, entry.name), e)
+            finally:
+                os.close(fd)
+            with lock:
+                stats.files += files
+                stats.bytes += nbytes
+                node.pending += len(subdirs)
+            for name in subdirs:
+                pool.submit(scan, _Dir(os.path.join(node.path, name), node))
+        except OSError as e:
+            fail(node.path, e)
+        finally:
+            release(node)
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        pool.submit(scan, _Dir(root, None))
+        finished.wait()
+
+    stats.seconds = time.monotonic() - started
+    if stats.errors and not ignore_errors:
+        target, error = stats.errors[0]
+        raise OSError(error.errno, f"{error.strerror} ({len(stats.errors)} error(s))", target)
+    return stats
+
+
+class CloneStats:
+    """
+    What clone_tree() created, with the number of files per clone method.
+    """
+
+    __slots__ = ("files", "dirs", "bytes", "seconds", "methods")
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.methods = {}  # clone method -> files
+
+    def __str__(self) -> str:
+        methods = ", ".join(f"{count} {method}" for method, count in sorted(self.methods.items()))
+        return (f"{self.files} files, {self.dirs} dirs, {self.bytes / 2**20:.1f} MiB "
+                f"in {self.seconds:.2f}s" + (f" ({methods})" if methods else ""))
+
+
+# Errors meaning "this filesystem (pair) cannot do that", as opposed to I/O errors
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+                errno.ENOSYS, errno.EPERM, errno.EBADF}
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, use_range: bool) -> str:
+    # Copy file contents in the kernel if possible, else through user space.
+    if use_range and hasattr(os, "copy_file_range"):
+        try:
+            copied = 0
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return COPY_FILE_RANGE
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+    while True:
+        chunk = os.read(src_fd, 1024 * 1024)
+        if not chunk:
+            return COPY
+        os.write(dst_fd, chunk)
+
+
+def _reflink_fd(src_fd: int, dst: str, mode: int) -> bool:
+    dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+        os.unlink(dst)
+        return False
+    finally:
+        os.close(dst_fd)
+
+
+def reflink(src: str, dst: str) -> bool:
+    """
+    Create dst as a copy-on-write clone of src. Returns False (and leaves no
+    dst behind) if the filesystem does not support reflinks.
+    """
+    src_fd = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        st = os.fstat(src_fd)
+        if not _reflink_fd(src_fd, dst, stat.S_IMODE(st.st_mode)):
+            return False
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        return True
+    finally:
+        os.close(src_fd)
+
+
+def clone_file(src: str, dst: str, immutable: bool = False,
+               methods: Sequence[str] = (REFLINK, HARDLINK, COPY_FILE_RANGE)) -> str:
+    """
+    Create dst with the contents of src as cheaply as the filesystem allows:
+    a reflink (FICLONE) shares the data copy-on-write; otherwise an immutable
+    file is hard linked; otherwise the data is copied with copy_file_range,
+    or by read/write as a last resort. Returns the method used.
+    """
+    src_fd = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        st = os.fstat(src_fd)
+        mode = stat.S_IMODE(st.st_mode)
+        method = ""
+        if REFLINK in methods and _reflink_fd(src_fd, dst, mode):
+            method = REFLINK
+        if not method and immutable and HARDLINK in methods:
+            try:
+                os.link(src, dst)
+                return HARDLINK
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED and e.errno != errno.EMLINK:
+                    raise
+        if not method:
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+            try:
+                method = _copy_data(src_fd, dst_fd, st.st_size, COPY_FILE_RANGE in methods)
+            finally:
+                os.close(dst_fd)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        return method
+    finally:
+        os.close(src_fd)
+
+
+def clone_tree(src, dst, exclude: Sequence[str] = CLONE_EXCLUDE,
+               immutable: Sequence[str] = IMMUTABLE_FILES,
+               workers: Optional[int] = None) -> CloneStats:
+    """
+    Recreate the directory tree src at dst (which must not exist yet or be
+    empty), skipping entries whose name matches an exclude pattern. Files are
+    cloned in parallel with clone_file(); files matching an immutable pattern
+    may be hard linked. Symlinks are copied as symlinks.
+
+    Once reflinks or copy_file_range fail as unsupported between the two
+    trees they are not tried again for the remaining files.
+    """
+    src = os.fspath(src)
+    dst = os.fspath(dst)
+    stats = CloneStats()
+    lock = threading.Lock()
+    started = time.monotonic()
+    methods = [REFLINK, HARDLINK, COPY_FILE_RANGE]
+
+    def copy(source: str, target: str, name: str, size: int) -> None:
+        is_immutable = any(fnmatch.fnmatch(name, p) for p in immutable)
+        method = clone_file(source, target, is_immutable, list(methods))
+        with lock:
+            stats.files += 1
+            stats.bytes += size
+            stats.methods[method] = stats.methods.get(method, 0) + 1
+            # Stop trying what this filesystem has just shown it cannot do.
+            if method != REFLINK and REFLINK in methods:
+                methods.remove(REFLINK)
+            if method == COPY and COPY_FILE_RANGE in methods:
+                methods.remove(COPY_FILE_RANGE)
+
+    os.makedirs(dst, exist_ok=True)
+    if os.listdir(dst):
+        raise FileExistsError(errno.EEXIST, "Target directory is not empty", dst)
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        futures = []
+        stack = [(src, dst)]
+        while stack:
+            source_dir, target_dir = stack.pop()
+            with os.scandir(source_dir) as it:
+                for entry in it:
+                    if any(fnmatch.fnmatch(entry.name, p) for p in exclude):
+                        continue
+                    target = os.path.join(target_dir, entry.name)
+                    if entry.is_symlink():
+                        os.symlink(os.readlink(entry.path), target)
+                    elif entry.is_dir():
+                        os.mkdir(target, stat.S_IMODE(entry.stat().st_mode) | stat.S_IRWXU)
+                        stats.dirs += 1
+                        stack.append((entry.path, target))
+                    elif entry.is_file():
+                        futures.append(pool.submit(copy, entry.path, target, entry.name,
+                                                   entry.stat().st_size))
+        for future in futures:
+            future.result()
+    shutil.copymode(src, dst)
+    stats.seconds = time.monotonic() - started
+    return stats
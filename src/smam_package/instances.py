@@ -0,0 +1,172 @@
+"""
+Detection of running Signal instances.
+
+Signal Desktop (Chromium) creates <profile>/SingletonLock while it runs, a
+symlink whose target is "<hostname>-<pid>".
+"""
+
+import os
+import socket
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def lock_owner(profile_dir: str) -> Optional[Tuple[str, int]]:
+    """
+    (hostname, pid) from the profile's SingletonLock, or None if there is no
+    readable lock.
+    """
+    try:
+        target = os.readlink(os.path.join(profile_dir, "SingletonLock"))
+    except OSError:
+        return None
+    host, _, pid = target.rpartition("-")
+    if not host or not pid.isdigit():
+        return None
+    return host, int(pid)
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def running_pid(profile_dir: str) -> Optional[int]:
+    """
+    PID of the Signal instance using profile_dir on this host, or None if
+    none is running. A lock left by a crashed instance is ignored.
+    """
+    owner = lock_owner(profile_dir)
+    if owner is None or owner[0] != socket.gethostname():
+        return None
+    return owner[1] if pid_alive(owner[1]) else None
+
+
+def is_running(profile_dir: str) -> bool:
+    """
+    True if some Signal instance may be using profile_dir. A lock held from
+    another host (a profile on a shared filesystem) counts as running.
+    """
+    owner = lock_owner(profile_dir)
+    if owner is None:
+        return False
+    return owner[0] != socket.gethostname() or pid_alive(owner[1])
+
+
+def read_process_table() -> Dict[int, Tuple[int, float]]:
+    """
+    {pid: (parent pid, CPU seconds used)} for every process, from one pass
+    over /proc/*/stat. Empty where /proc is not available.
+    """
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    table = {}
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return table
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses; fields follow the last ')'.
+        fields = data[data.rindex(b")") + 2:].split()
+        table[pid] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks)
+    return table
+
+
+def children_map(table: Dict[int, Tuple[int, float]]) -> Dict[int, List[int]]:
+    """
+    {pid: child pids} for a table from read_process_table().
+    """
+    children = {}  # type: Dict[int, List[int]]
+    for child, (parent, _) in table.items():
+        children.setdefault(parent, []).append(child)
+    return children
+
+
+def process_tree(pid: int, children: Dict[int, List[int]]) -> List[int]:
+    """
+    pid and all its descendants.
+    """
+    tree = []
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, ()))
+    return tree
+
+
+def tree_cpu_seconds(pids: Iterable[int],
+                     table: Dict[int, Tuple[int, float]]) -> Dict[int, Optional[float]]:
+    """
+    CPU seconds of each pid together with all its descendants (Electron runs
+    renderer and GPU processes as children); None for a pid that is gone.
+    """
+    children = children_map(table)
+    result = {}  # type: Dict[int, Optional[float]]
+    for pid in pids:
+        if pid not in table:
+            result[pid] = None
+            continue
+        result[pid] = sum(table[p][1] for p in process_tree(pid, children))
+    return result
+
+
+def process_start_ticks(pid: int) -> Optional[int]:
+    """
+    Start time of a process in clock ticks since boot (field 22 of
+    /proc/<pid>/stat), or None if it is gone. Together with the PID it
+    identifies a process even after the PID has been reused.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return int(data[data.rindex(b")") + 2:].split()[19])
+
+
+def find_by_cmdline(profile_dirs: Iterable[str]) -> Dict[str, int]:
+    """
+    {profile_dir: pid} for the given profile directories that a process on
+    this host was started with (--user-data-dir=...), from one pass over
+    /proc/*/cmdline. Electron's helper processes carry the same argument, so
+    the process whose parent does not match is returned. Finds instances
+    whose SingletonLock is missing or unreadable.
+    """
+    wanted = {}  # type: Dict[str, str]
+    for profile_dir in profile_dirs:
+        wanted[os.path.realpath(os.path.expanduser(profile_dir))] = profile_dir
+    matches = {}  # type: Dict[int, str]
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                args = f.read().split(b"\0")
+        except OSError:
+            continue
+        for arg in args:
+            if arg.startswith(b"--user-data-dir="):
+                path = os.path.realpath(os.fsdecode(arg[len(b"--user-data-dir="):]))
+                if path in wanted:
+                    matches[pid] = wanted[path]
+                break
+    if not matches:
+        return {}
+    table = read_process_table()
+    found = {}  # type: Dict[str, int]
+    for pid, profile_dir in sorted(matches.items()):
+        parent = table.get(pid, (0, 0.0))[0]
+        if matches.get(parent) != profile_dir and profile_dir not in found:
+            found[profile_dir] = pid
+    return found
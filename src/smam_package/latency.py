@@ -0,0 +1,194 @@
+"""
+Launch latency of each account: how long its Signal takes to become usable.
+
+Samples go into one histogram per account with logarithmic buckets
+(BUCKET_GROWTH apart, starting at BUCKET_BASE seconds), so latency.json stays
+a few hundred bytes per account however many launches it has seen, and any
+quantile is known to within half a bucket (about 9%).
+
+Where a window tool is available (wmctrl or xdotool on X11 or XWayland),
+window_probe() lets the scheduler count an instance as ready when its
+first window appears instead of waiting for its CPU use to settle.
+"""
+
+import fcntl
+import json
+import math
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+
+from .storage import atomic_write
+
+BUCKET_BASE = 0.1            # lower edge of bucket 0, in seconds
+BUCKET_GROWTH = 2 ** 0.25    # ratio between the edges of neighbouring buckets
+BUCKET_COUNT = 64            # the last bucket starts at about 6500s
+
+# window_pids() -> PIDs owning a top-level window
+WindowProbe = Callable[[], Set[int]]
+
+
+def bucket_of(seconds: float) -> int:
+    if seconds <= BUCKET_BASE:
+        return 0
+    index = int(math.log(seconds / BUCKET_BASE) / math.log(BUCKET_GROWTH))
+    return min(index, BUCKET_COUNT - 1)
+
+
+class LatencyHistogram:
+    """
+    Launch latencies of one account: sparse bucket counts plus count, sum,
+    minimum, maximum and the last sample.
+    """
+
+    __slots__ = ("buckets", "count", "total", "min", "max", "last")
+
+    def __init__(self) -> None:
+        self.buckets = {}  # type: Dict[int, int]
+        self.count = 0
+        self.total = 0.0
+        self.min = None  # type: Optional[float]
+        self.max = None  # type: Optional[float]
+        self.last = None  # type: Optional[float]
+
+    def add(self, seconds: float) -> None:
+        seconds = round(seconds, 3)
+        index = bucket_of(seconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        self.last = seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Approximate q-quantile (0 < q <= 1): the geometric middle of the
+        bucket holding it, clamped to the observed minimum and maximum.
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                estimate = BUCKET_BASE * BUCKET_GROWTH ** (index + 0.5)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> Dict:
+        return {"buckets": {str(i): n for i, n in sorted(self.buckets.items())},
+                "count": self.count, "sum": round(self.total, 3), "min": self.min,
+                "max": self.max, "last": self.last}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        hist = cls()
+        hist.buckets = {int(i): int(n) for i, n in data.get("buckets", {}).items()}
+        hist.count = int(data.get("count", sum(hist.buckets.values())))
+        hist.total = float(data.get("sum", 0.0))
+        hist.min = data.get("min")
+        hist.max = data.get("max")
+        hist.last = data.get("last")
+        return hist
+
+
+class LatencyStore:
+    """
+    latency.json: {account name: histogram}. Updates hold an flock on a
+    sibling .lock file and replace the file atomically.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> Dict[str, LatencyHistogram]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return {name: LatencyHistogram.from_dict(h) for name, h in data.items()}
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict[str, LatencyHistogram]]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            histograms = self.load()
+            yield histograms
+            atomic_write(self.path, json.dumps(
+                {name: h.to_dict() for name, h in sorted(histograms.items())}, separators=(",", ":")))
+        finally:
+            os.close(fd)
+
+    def record(self, samples: Dict[str, float]) -> None:
+        """
+        Add one latency sample (in seconds) per account name.
+        """
+        if not samples:
+            return
+        with self._locked() as histograms:
+            for name, seconds in samples.items():
+                histograms.setdefault(name, LatencyHistogram()).add(seconds)
+
+    def reset(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Forget the samples of the named accounts, or of all accounts.
+        """
+        with self._locked() as histograms:
+            for name in list(histograms) if names is None else list(names):
+                histograms.pop(name, None)
+
+
+def _run(args) -> Optional[str]:
+    try:
+        return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              timeout=5, check=True, universal_newlines=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _wmctrl_pids() -> Set[int]:
+    # wmctrl -lp: "<window id> <desktop> <pid> <host> <title>"
+    pids = set()
+    for line in (_run(["wmctrl", "-lp"]) or "").splitlines():
+        fields = line.split(None, 3)
+        if len(fields) >= 3 and fields[2].isdigit():
+            pids.add(int(fields[2]))
+    return pids
+
+
+def _xdotool_pids() -> Set[int]:
+    pids = set()
+    for window in (_run(["xdotool", "search", "--onlyvisible", "--class", "signal"]) or "").split():
+        pid = (_run(["xdotool", "getwindowpid", window]) or "").strip()
+        if pid.isdigit():
+            pids.add(int(pid))
+    return pids
+
+
+def window_probe() -> Optional[WindowProbe]:
+    """
+    A function listing the PIDs that own windows, or None if there is no
+    display or neither wmctrl nor xdotool is installed.
+    """
+    if not os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("wmctrl"):
+        return _wmctrl_pids
+    if shutil.which("xdotool"):
+        return _xdotool_pids
+    return None
@@ -0,0 +1,236 @@
+"""
+In-memory representation of the account registry.
+
+Account is a compact record type for one Signal profile; AccountTable keeps
+the whole registry column-wise with hash indexes on the account name and the
+canonical profile directory, so lookups do not scan the list.
+"""
+
+import copy
+import os
+from typing import Dict, Iterator, List, Optional
+
+# Keys of a stored record that Account keeps in slots rather than in 'extra'.
+CORE_FIELDS = ("name", "profile_dir", "canonical_dir", "st_dev", "st_ino")
+
+
+def canonical_path(profile_dir: str) -> str:
+    """
+    Return the canonical absolute form of a profile directory
+    (user expanded, symlinks resolved).
+    """
+    return os.path.realpath(os.path.expanduser(profile_dir))
+
+
+def profile_identity(profile_dir: str) -> Dict:
+    """
+    Resolve a profile directory once and return the identity fields stored
+    with its record: the canonical path plus st_dev/st_ino if it exists.
+    """
+    canonical = canonical_path(profile_dir)
+    identity = {"canonical_dir": canonical}
+    try:
+        st = os.stat(canonical)
+    except OSError:
+        return identity
+    identity["st_dev"] = st.st_dev
+    identity["st_ino"] = st.st_ino
+    return identity
+
+
+class Account:
+    """
+    One registered Signal profile. The core fields live in slots; any other
+    keys of the stored record are kept in 'extra' so they survive a round trip.
+    canonical_dir/st_dev/st_ino are recorded when the account is added, so
+    matching a directory against the registry needs no per-account resolve.
+    Supports acc["name"]-style access for code written against plain dicts.
+    """
+
+    __slots__ = CORE_FIELDS + ("extra",)
+
+    def __init__(self, name: str, profile_dir: str, canonical_dir: Optional[str] = None,
+                 st_dev: Optional[int] = None, st_ino: Optional[int] = None,
+                 extra: Optional[Dict] = None) -> None:
+        self.name = name
+        self.profile_dir = profile_dir
+        self.canonical_dir = canonical_dir
+        self.st_dev = st_dev
+        self.st_ino = st_ino
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, record: Dict) -> "Account":
+        extra = {k: v for k, v in record.items() if k not in CORE_FIELDS}
+        return cls(record["name"], record["profile_dir"], record.get("canonical_dir"),
+                   record.get("st_dev"), record.get("st_ino"), extra or None)
+
+    def to_dict(self) -> Dict:
+        record = {"name": self.name, "profile_dir": self.profile_dir}
+        for key in CORE_FIELDS[2:]:
+            value = getattr(self, key)
+            if value is not None:
+                record[key] = value
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def __getitem__(self, key: str):
+        if key in CORE_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"Account(name={self.name!r}, profile_dir={self.profile_dir!r})"
+
+
+class AccountTable:
+    """
+    Column-oriented registry: names, profile dirs and their recorded identity
+    are kept in parallel lists (row i is account number i+1 in the menu),
+    with dict indexes from name, from canonical profile directory and from
+    (st_dev, st_ino) to the row. The path indexes are built on the first
+    path lookup; only legacy rows without a recorded canonical_dir cost a
+    resolve at that point.
+    """
+
+    __slots__ = ("names", "profile_dirs", "canonical_dirs", "inodes", "extras",
+                 "_by_name", "_by_path", "_by_inode")
+
+    def __init__(self) -> None:
+        self.names = []  # type: List[str]
+        self.profile_dirs = []  # type: List[str]
+        self.canonical_dirs = []  # type: List[Optional[str]]
+        self.inodes = []  # type: List[Optional[tuple]]  # (st_dev, st_ino)
+        self.extras = []  # type: List[Optional[Dict]]
+        self._by_name = {}  # type: Dict[str, int]
+        self._by_path = None  # type: Optional[Dict[str, int]]
+        self._by_inode = None  # type: Optional[Dict[tuple, int]]
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "AccountTable":
+        table = cls()
+        for record in records:
+            table.append(Account.from_dict(record))
+        return table
+
+    def to_records(self) -> List[Dict]:
+        return [acc.to_dict() for acc in self]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _row(self, i: int) -> Account:
+        # Rows are copies: extra fields may hold nested values, and a caller
+        # changing them must not change the table (which a store may cache).
+        inode = self.inodes[i] or (None, None)
+        extra = self.extras[i]
+        return Account(self.names[i], self.profile_dirs[i], self.canonical_dirs[i],
+                       inode[0], inode[1], copy.deepcopy(extra) if extra else None)
+
+    def __getitem__(self, index: int) -> Account:
+        if not 0 <= index < len(self.names):
+            raise IndexError(index)
+        return self._row(index)
+
+    def __iter__(self) -> Iterator[Account]:
+        for i in range(len(self.names)):
+            yield self._row(i)
+
+    def missing_identity(self) -> int:
+        """
+        Number of rows recorded before canonical paths were stored.
+        """
+        return self.canonical_dirs.count(None)
+
+    def _index_paths(self, i: int) -> None:
+        canonical = self.canonical_dirs[i] or canonical_path(self.profile_dirs[i])
+        self._by_path.setdefault(canonical, i)
+        if self.inodes[i] is not None:
+            self._by_inode.setdefault(self.inodes[i], i)
+
+    def _build_path_indexes(self) -> None:
+        if self._by_path is None:
+            self._by_path = {}
+            self._by_inode = {}
+            for i in range(len(self.names)):
+                self._index_paths(i)
+
+    def index_of(self, name: str) -> Optional[int]:
+        return self._by_name.get(name)
+
+    def index_of_path(self, profile_dir: str) -> Optional[int]:
+        """
+        Row of the account using the same directory as profile_dir: one resolve
+        and one stat of profile_dir, then hash lookups by canonical path and,
+        for bind mounts or other aliases, by (st_dev, st_ino).
+        """
+        return self.index_of_identity(profile_identity(profile_dir))
+
+    def index_of_identity(self, identity: Dict) -> Optional[int]:
+        """
+        Like index_of_path(), for a directory whose identity fields (as from
+        profile_identity()) are already known: no resolve, no stat of it.
+        """
+        self._build_path_indexes()
+        i = self._by_path.get(identity["canonical_dir"])
+        if i is not None or "st_ino" not in identity:
+            return i
+        i = self._by_inode.get((identity["st_dev"], identity["st_ino"]))
+        if i is not None:
+            # Inode numbers are reused after deletion: make sure the recorded
+            # directory still is the one we were asked about.
+            try:
+                st = os.stat(self.profile_dirs[i])
+            except OSError:
+                return None
+            if (st.st_dev, st.st_ino) != (identity["st_dev"], identity["st_ino"]):
+                return None
+        return i
+
+    def get(self, name: str) -> Optional[Account]:
+        i = self.index_of(name)
+        return None if i is None else self._row(i)
+
+    def find_by_profile_dir(self, profile_dir: str) -> Optional[Account]:
+        i = self.index_of_path(profile_dir)
+        return None if i is None else self._row(i)
+
+    def append(self, account: Account) -> int:
+        """
+        Add a row and return its index. Duplicate names keep the first row in the index.
+        """
+        i = len(self.names)
+        self.names.append(account.name)
+        self.profile_dirs.append(account.profile_dir)
+        self.canonical_dirs.append(account.canonical_dir)
+        self.inodes.append(None if account.st_ino is None else (account.st_dev, account.st_ino))
+        self.extras.append(account.extra)
+        self._by_name.setdefault(account.name, i)
+        if self._by_path is not None:
+            self._index_paths(i)
+        return i
+
+    def pop(self, index: int) -> Account:
+        """
+        Remove and return row index. Rows after it shift down, so the indexes are rebuilt.
+        """
+        account = self[index]
+        for column in (self.names, self.profile_dirs, self.canonical_dirs, self.inodes, self.extras):
+            del column[index]
+        self._by_name = {}
+        for i, name in enumerate(self.names):
+            self._by_name.setdefault(name, i)
+        self._by_path = None
+        self._by_inode = None
+        return account
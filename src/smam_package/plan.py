@@ -0,0 +1,205 @@
+"""
+Declarative desired state for the account fleet.
+
+A state file lists every account that should exist:
+
+    {
+      "prune": false,
+      "accounts": [
+        {"name": "Work", "profile_dir": "~/.config/Signal-Work", "launcher": true},
+        {"name": "Personal"}
+      ]
+    }
+
+'profile_dir' defaults to the add_account naming rule. 'launcher' true makes
+sure the .desktop file exists and is current, false makes sure it does not
+exist, and leaving it out leaves launchers alone. With 'prune', registered
+accounts missing from the file are unregistered (their profile data is kept).
+
+compute_plan() diffs the file against the registry, the profile directories
+and ~/.local/share/applications and returns the minimal list of actions,
+grouped so that apply can run them top to bottom: unregistrations free
+profile directories before accounts are repointed to or registered on
+them. A desired directory that would stay in use by another account is a
+PlanError, reported before anything is changed. It reads each involved
+directory with a single os.scandir, and it only reads launchers whose size
+matches the expected content, so an unchanged host costs almost no I/O.
+"""
+
+import json
+import os
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .desktop import desktop_entry, desktop_file_name
+from .models import AccountTable, canonical_path
+
+Action = namedtuple("Action", ["kind", "name", "profile_dir", "detail"])
+
+# Action kinds, in the order compute_plan() returns and apply runs them
+CREATE_DIR = "create_dir"
+UNREGISTER = "unregister"
+REPOINT = "repoint"
+REGISTER = "register"
+WRITE_LAUNCHER = "write_launcher"
+REMOVE_LAUNCHER = "remove_launcher"
+KINDS = (CREATE_DIR, UNREGISTER, REPOINT, REGISTER, WRITE_LAUNCHER, REMOVE_LAUNCHER)
+
+
+class PlanError(ValueError):
+    """
+    The desired state cannot be reached; 'conflicts' lists why, one line each.
+    """
+
+    def __init__(self, conflicts: List[str]) -> None:
+        super().__init__("; ".join(conflicts))
+        self.conflicts = conflicts
+
+
+def load_state(path: str, default_profile_dir: Callable[[str], Path]) -> Tuple[List[Dict], bool]:
+    """
+    Read and validate a state file. The top level may also be a bare list of
+    accounts. Returns (accounts, prune); each account has 'name', an expanded
+    'profile_dir' and 'launcher' (True, False or None). Raises ValueError.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            state = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from e
+    if isinstance(state, list):
+        state = {"accounts": state}
+    if not isinstance(state, dict) or not isinstance(state.get("accounts"), list):
+        raise ValueError(f"{path}: expected an object with an 'accounts' list.")
+
+    accounts = []
+    names = set()
+    dirs = set()
+    for number, entry in enumerate(state["accounts"], start=1):
+        name = str(entry.get("name") or "").strip() if isinstance(entry, dict) else ""
+        if not name:
+            raise ValueError(f"{path}: account {number} has no name.")
+        if name in names:
+            raise ValueError(f"{path}: account '{name}' is listed twice.")
+        profile_dir = os.path.abspath(os.path.expanduser(
+            entry.get("profile_dir") or str(default_profile_dir(name))))
+        if profile_dir in dirs:
+            raise ValueError(f"{path}: profile directory {profile_dir} is listed twice.")
+        launcher = entry.get("launcher")
+        if launcher is not None and not isinstance(launcher, bool):
+            raise ValueError(f"{path}: 'launcher' of '{name}' must be true or false.")
+        names.add(name)
+        dirs.add(profile_dir)
+        accounts.append({"name": name, "profile_dir": profile_dir, "launcher": launcher})
+    return accounts, bool(state.get("prune", False))
+
+
+def _scan(directory: str) -> Dict[str, os.DirEntry]:
+    try:
+        with os.scandir(directory) as it:
+            return {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        return {}
+
+
+def _same_dir(wanted: str, profile_dir: str, canonical_dir: Optional[str]) -> bool:
+    # Cheap string comparisons first; resolve only if they disagree.
+    if wanted in (os.path.normpath(profile_dir), canonical_dir):
+        return True
+    return canonical_path(wanted) == (canonical_dir or canonical_path(profile_dir))
+
+
+def _launcher_current(entry: os.DirEntry, expected: str) -> bool:
+    data = expected.encode("utf-8")
+    if entry.stat().st_size != len(data):
+        return False
+    with open(entry.path, "rb") as f:
+        return f.read() == data
+
+
+def compute_plan(desired: List[Dict], table: AccountTable, applications_dir: Path,
+                 prune: bool = False) -> List[Action]:
+    """
+    Return the actions that bring the registry, profile directories and
+    launchers in line with the desired accounts, ordered by KINDS. An empty
+    list means the host already matches. Raises PlanError if a desired
+    profile directory belongs to another account that keeps it.
+    """
+    actions = {kind: [] for kind in KINDS}  # type: Dict[str, List[Action]]
+    launchers = _scan(str(applications_dir))
+    parents = {}  # type: Dict[str, Dict[str, os.DirEntry]]
+    wanted = {acc["name"] for acc in desired}
+    # Canonical profile directory -> the account holding it once the plan has run
+    owners = {}  # type: Dict[str, str]
+    moving = []  # type: List[Dict]
+
+    def dir_exists(path: str) -> bool:
+        parent, base = os.path.split(path)
+        if parent not in parents:
+            parents[parent] = _scan(parent)
+        entry = parents[parent].get(base)
+        return entry is not None and entry.is_dir()
+
+    for current in table:
+        if current.name in wanted:
+            continue
+        if prune:
+            actions[UNREGISTER].append(Action(UNREGISTER, current.name, current.profile_dir, ""))
+        else:
+            owners[current.canonical_dir or canonical_path(current.profile_dir)] = current.name
+
+    for acc in desired:
+        name, profile_dir = acc["name"], acc["profile_dir"]
+        if not dir_exists(profile_dir):
+            actions[CREATE_DIR].append(Action(CREATE_DIR, name, profile_dir, ""))
+
+        current = table.get(name)
+        if current is None:
+            actions[REGISTER].append(Action(REGISTER, name, profile_dir, ""))
+            moving.append(acc)
+        elif not _same_dir(profile_dir, current.profile_dir, current.canonical_dir):
+            actions[REPOINT].append(Action(REPOINT, name, profile_dir, f"was {current.profile_dir}"))
+            moving.append(acc)
+        else:
+            owners[current.canonical_dir or canonical_path(current.profile_dir)] = name
+
+        entry = launchers.get(desktop_file_name(name))
+        if acc["launcher"] is True:
+            if entry is None:
+                actions[WRITE_LAUNCHER].append(Action(WRITE_LAUNCHER, name, profile_dir, "missing"))
+            elif not _launcher_current(entry, desktop_entry(name, profile_dir)):
+                actions[WRITE_LAUNCHER].append(Action(WRITE_LAUNCHER, name, profile_dir, "outdated"))
+        elif acc["launcher"] is False and entry is not None:
+            actions[REMOVE_LAUNCHER].append(Action(REMOVE_LAUNCHER, name, profile_dir, entry.path))
+
+    # Only accounts that change directory can collide; unchanged ones are
+    # consistent with the registry already.
+    conflicts = []
+    for acc in moving:
+        canonical = canonical_path(acc["profile_dir"])
+        owner = owners.setdefault(canonical, acc["name"])
+        if owner != acc["name"]:
+            keeps = ("is listed with the same directory" if owner in wanted
+                     else "stays registered on it")
+            conflicts.append(f"'{acc['name']}' wants {acc['profile_dir']}, but '{owner}' {keeps}.")
+    if conflicts:
+        raise PlanError(conflicts)
+    return [action for kind in KINDS for action in actions[kind]]
+
+
+def describe(action: Action) -> str:
+    """
+    One human-readable line for an action.
+    """
+    text = {
+        CREATE_DIR: "create profile directory {profile_dir}",
+        REGISTER: "register '{name}' -> {profile_dir}",
+        REPOINT: "point '{name}' to {profile_dir}",
+        WRITE_LAUNCHER: "write launcher for '{name}'",
+        REMOVE_LAUNCHER: "remove launcher of '{name}'",
+        UNREGISTER: "unregister '{name}' (profile data is kept)",
+    }[action.kind].format(name=action.name, profile_dir=action.profile_dir)
+    if action.detail:
+        text += f" ({action.detail})"
+    return text
@@ -0,0 +1,154 @@
+"""
+Page-cache prewarming before a Signal launch.
+
+A cold start (for example the first after a reboot) spends most of its time
+waiting for reads of the Electron binary, resources/app.asar and the
+profile's sql/ and IndexedDB/ files, one page fault at a time. prewarm()
+asks the kernel to read all of them ahead with
+posix_fadvise(POSIX_FADV_WILLNEED), many files in parallel, so the reads
+are queued together and Signal later finds them in the page cache. Where
+posix_fadvise is missing the files are read instead.
+
+evict() does the opposite (POSIX_FADV_DONTNEED) and exists for
+benchmarks/bench_prewarm.py; it only drops pages that are not dirty.
+"""
+
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+# Profile subdirectories read during startup
+PROFILE_DIRS = ("sql", "IndexedDB")
+# Files next to the Signal binary that Electron maps at startup
+INSTALL_SUFFIXES = (".so", ".pak", ".dat", ".bin")
+
+_READ_CHUNK = 1 << 20
+
+
+class PrewarmResult:
+    """
+    Files and bytes submitted for readahead.
+    """
+
+    __slots__ = ("files", "bytes", "seconds", "errors")
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = 0
+
+    def __str__(self) -> str:
+        return f"{self.files} files, {self.bytes / 2**20:.1f} MiB in {self.seconds:.2f}s"
+
+
+def signal_files(executable: str = "signal-desktop") -> List[str]:
+    """
+    The Signal binary (through any wrapper symlink), its resources/app.asar
+    and the shared libraries and data files in its directory. Empty if
+    Signal is not on PATH.
+    """
+    found = shutil.which(executable)
+    if not found:
+        return []
+    binary = os.path.realpath(found)
+    install_dir = os.path.dirname(binary)
+    files = [binary]
+    asar = os.path.join(install_dir, "resources", "app.asar")
+    if os.path.isfile(asar):
+        files.append(asar)
+    try:
+        with os.scandir(install_dir) as it:
+            for entry in it:
+                if (entry.name.endswith(INSTALL_SUFFIXES) or ".so." in entry.name) \
+                        and entry.is_file():
+                    files.append(entry.path)
+    except OSError:
+        pass
+    return files
+
+
+def profile_files(profile_dir: str) -> List[str]:
+    """
+    Regular files under the profile's PROFILE_DIRS.
+    """
+    files = []
+    for name in PROFILE_DIRS:
+        for root, _, names in os.walk(os.path.join(profile_dir, name)):
+            files.extend(os.path.join(root, n) for n in names)
+    return files
+
+
+def _advise(path: str, advice: Optional[int]) -> int:
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    try:
+        size = os.fstat(fd).st_size
+        if advice is not None:
+            os.posix_fadvise(fd, 0, 0, advice)
+        else:
+            while os.read(fd, _READ_CHUNK):
+                pass
+        return size
+    finally:
+        os.close(fd)
+
+
+def _run(paths: Iterable[str], advice: Optional[int], workers: int) -> PrewarmResult:
+    result = PrewarmResult()
+    started = time.monotonic()
+
+    def one(path: str) -> Optional[int]:
+        try:
+            return _advise(path, advice)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for size in pool.map(one, paths):
+            if size is None:
+                result.errors += 1
+            else:
+                result.files += 1
+                result.bytes += size
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def prewarm(paths: Iterable[str], workers: int = 8) -> PrewarmResult:
+    """
+    Start readahead of every file, workers files at a time.
+    """
+    return _run(paths, getattr(os, "POSIX_FADV_WILLNEED", None), workers)
+
+
+def launch_files(profile_dir: str, executable: str = "signal-desktop") -> List[str]:
+    """
+    Everything a launch of executable with profile_dir reads early on.
+    """
+    return signal_files(executable) + profile_files(profile_dir)
+
+
+def prewarm_in_background(profile_dir: str, workers: int = 8,
+                          executable: str = "signal-desktop") -> threading.Thread:
+    """
+    Prewarm launch_files(profile_dir, executable) from a daemon thread, so it
+    runs alongside the launch instead of delaying it.
+    """
+    thread = threading.Thread(target=lambda: prewarm(launch_files(profile_dir, executable),
+                                                     workers),
+                              name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def evict(paths: Iterable[str], workers: int = 8) -> PrewarmResult:
+    """
+    Drop the files' clean pages from the page cache. Does nothing where
+    posix_fadvise is not available.
+    """
+    if not hasattr(os, "POSIX_FADV_DONTNEED"):
+        return PrewarmResult()
+    return _run(paths, os.POSIX_FADV_DONTNEED, workers)
@@ -0,0 +1,138 @@
+"""
+Purging Electron caches from profiles.
+
+Every account record may carry a 'cache_policy':
+
+    {"purge": true, "max_age_days": 14, "keep": ["GPUCache"]}
+
+'purge' false exempts the account, 'max_age_days' only removes cache files
+not modified for that many days (0, the default, empties the caches), and
+'keep' names cache directories to leave alone. Profiles whose Signal is
+running are always skipped: Chromium keeps its cache index in memory.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .fsutil import parallel_rmtree
+from .instances import is_running
+
+CACHE_DIRS = (
+    "Cache", "Code Cache", "GPUCache", "DawnCache", "DawnGraphiteCache", "DawnWebGPUCache",
+    os.path.join("Service Worker", "CacheStorage"), os.path.join("Service Worker", "ScriptCache"),
+)
+DEFAULT_POLICY = {"purge": True, "max_age_days": 0, "keep": []}
+
+# progress(name, result) after each profile
+PurgeProgress = Callable[[str, "PurgeResult"], None]
+
+
+class PurgeResult:
+    """
+    What was (or, in a dry run, would be) removed from one profile.
+    skipped holds the reason a profile was left alone.
+    """
+
+    __slots__ = ("files", "bytes", "skipped", "errors")
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.skipped = None  # type: Optional[str]
+        self.errors = 0
+
+
+def validate_policy(policy: Dict) -> Dict:
+    """
+    Complete a cache policy with defaults. Raises ValueError for unknown
+    keys or wrong types.
+    """
+    unknown = set(policy) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown cache policy field(s): {', '.join(sorted(unknown))}.")
+    merged = dict(DEFAULT_POLICY, **policy)
+    if not isinstance(merged["purge"], bool):
+        raise ValueError("'purge' must be true or false.")
+    age = merged["max_age_days"]
+    # bool is an int subclass, but true/false is not a number of days.
+    if isinstance(age, bool) or not isinstance(age, (int, float)) or age < 0:
+        raise ValueError("'max_age_days' must be a number >= 0.")
+    if not isinstance(merged["keep"], list) or not all(k in CACHE_DIRS for k in merged["keep"]):
+        raise ValueError(f"'keep' must list cache directories out of: {', '.join(CACHE_DIRS)}.")
+    return merged
+
+
+def _purge_old(directory: str, cutoff: float, dry_run: bool, result: PurgeResult) -> None:
+    try:
+        it = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    _purge_old(entry.path, cutoff, dry_run, result)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    os.unlink(entry.path)
+                result.files += 1
+                result.bytes += st.st_size
+            except OSError:
+                result.errors += 1
+
+
+def purge_profile(profile_dir: str, policy: Optional[Dict] = None,
+                  dry_run: bool = False) -> PurgeResult:
+    """
+    Remove cache files from one profile according to its policy.
+    """
+    policy = validate_policy(policy or {})
+    result = PurgeResult()
+    if not policy["purge"]:
+        result.skipped = "policy"
+        return result
+    if is_running(profile_dir):
+        result.skipped = "running"
+        return result
+    cutoff = time.time() - policy["max_age_days"] * 86400
+    for name in CACHE_DIRS:
+        if name in policy["keep"]:
+            continue
+        path = os.path.join(profile_dir, name)
+        if not os.path.isdir(path) or os.path.islink(path):
+            continue
+        if policy["max_age_days"] or dry_run:
+            _purge_old(path, cutoff, dry_run, result)
+        else:
+            stats = parallel_rmtree(path, workers=4, ignore_errors=True)
+            result.files += stats.files
+            result.bytes += stats.bytes
+            result.errors += len(stats.errors)
+    return result
+
+
+def purge_all(accounts: Iterable[Dict], dry_run: bool = False, workers: int = 4,
+              progress: Optional[PurgeProgress] = None) -> List[Tuple[Dict, PurgeResult]]:
+    """
+    Purge the caches of many accounts in parallel, one profile per worker.
+    Results come back in the order of accounts.
+    """
+    accounts = list(accounts)
+
+    def run(acc: Dict) -> PurgeResult:
+        try:
+            result = purge_profile(acc["profile_dir"], acc.get("cache_policy"), dry_run)
+        except ValueError as e:
+            result = PurgeResult()
+            result.skipped = f"invalid cache_policy: {e}"
+        if progress:
+            progress(acc["name"], result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(zip(accounts, pool.map(run, accounts)))
@@ -0,0 +1,81 @@
+"""
+Finding what the registry, the profile directories and the launchers
+disagree about.
+
+Three kinds of orphans:
+
+  - a Signal-*.desktop launcher in the applications directory that belongs
+    to no registered account,
+  - a Signal profile (a Signal-* directory in the profiles root, where
+    add_account creates profiles, holding one of discover.PROFILE_MARKERS)
+    that no registered account uses,
+  - a registered account whose profile directory does not exist.
+
+find_orphans() lists the applications directory and the profiles root
+once each and looks accounts up by the indexes of one AccountTable.
+"""
+
+import os
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, List
+
+from .discover import is_profile
+from .models import AccountTable, canonical_path
+
+Orphan = namedtuple("Orphan", ["kind", "name", "path"])
+
+LAUNCHER = "launcher"
+PROFILE_DIR = "profile_dir"
+ACCOUNT = "account"
+
+
+def find_orphans(table: AccountTable, applications_dir: Path, profiles_root: Path,
+                 launcher_name: Callable[[str], str]) -> List[Orphan]:
+    """
+    Return all orphans. launcher_name(account name) gives the file name of an
+    account's launcher. For profile directories and launchers, 'name' is
+    the entry name; for accounts it is the account name.
+    """
+    orphans = []  # type: List[Orphan]
+
+    # 1) Launchers: one scandir, names compared with what each account would use.
+    expected = {launcher_name(acc.name) for acc in table}
+    try:
+        with os.scandir(str(applications_dir)) as it:
+            for entry in it:
+                if (entry.name.startswith("Signal-") and entry.name.endswith(".desktop")
+                        and entry.name not in expected):
+                    orphans.append(Orphan(LAUNCHER, entry.name, entry.path))
+    except FileNotFoundError:
+        pass
+
+    # 2) Profile directories: one scandir of the resolved root, identity lookups.
+    root = canonical_path(str(profiles_root))
+    present = set()
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                present.add(entry.path)
+                # Anything that is not recognizably a Signal profile is left alone.
+                if not entry.name.startswith("Signal-") or not is_profile(entry.path):
+                    continue
+                st = entry.stat()
+                identity = {"canonical_dir": entry.path, "st_dev": st.st_dev, "st_ino": st.st_ino}
+                if table.index_of_identity(identity) is None:
+                    orphans.append(Orphan(PROFILE_DIR, entry.name, entry.path))
+    except FileNotFoundError:
+        pass
+
+    # 3) Accounts: directories under the root are known from the scan above.
+    for acc in table:
+        canonical = acc.canonical_dir or canonical_path(acc.profile_dir)
+        if os.path.dirname(canonical) == root:
+            exists = canonical in present
+        else:
+            exists = os.path.isdir(canonical)
+        if not exists:
+            orphans.append(Orphan(ACCOUNT, acc.name, acc.profile_dir))
+    return orphans
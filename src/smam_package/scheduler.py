@@ -0,0 +1,175 @@
+"""
+Staggered launching of several Signal instances.
+
+Starting many Electron instances at once makes them all compete for CPU
+and disk, so each takes longer than it would alone. batch_launch() starts
+them in order with at most max_parallel instances starting at the same
+time. An instance counts as ready once its process tree has used less
+than settle_cpu of a core for settle_time seconds (measured from
+/proc/<pid>/stat). Before each start it also waits until the 1-minute load
+average per CPU is below max_load and at least min_stagger seconds have
+passed since the previous start.
+
+If a windows() function is given (see latency.window_probe), an instance is
+also ready as soon as a process in its tree owns a window; ready_by tells
+which of the two happened first.
+"""
+
+import os
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from .instances import children_map, is_running, process_tree, read_process_table, tree_cpu_seconds
+
+# Launch states
+WAITING = "waiting"
+STARTING = "starting"
+READY = "ready"
+TIMEOUT = "timeout"          # never settled; counted as ready
+EXITED = "exited"            # exited before settling
+ALREADY_RUNNING = "already running"
+FAILED = "failed"            # could not be started
+
+# What made an instance count as ready
+SETTLED = "cpu"
+WINDOW = "window"
+
+# progress(result) after every state change
+LaunchProgress = Callable[["LaunchResult"], None]
+
+
+class LaunchResult:
+    """
+    One account in a batch launch. Times are seconds since the batch began.
+    """
+
+    __slots__ = ("name", "state", "started", "ready", "ready_by", "error", "process",
+                 "_last_cpu", "_last_sample", "_quiet_since")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.state = WAITING
+        self.started = None  # type: Optional[float]
+        self.ready = None  # type: Optional[float]
+        self.ready_by = None  # type: Optional[str]
+        self.error = None  # type: Optional[str]
+        self.process = None  # type: Optional[subprocess.Popen]
+        self._last_cpu = 0.0
+        self._last_sample = 0.0
+        self._quiet_since = None  # type: Optional[float]
+
+    @property
+    def time_to_ready(self) -> Optional[float]:
+        if self.started is None or self.ready is None:
+            return None
+        return self.ready - self.started
+
+
+class BatchReport:
+    """
+    Results in launch order and the time until the last instance was ready.
+    """
+
+    __slots__ = ("results", "seconds")
+
+    def __init__(self, results: List[LaunchResult], seconds: float) -> None:
+        self.results = results
+        self.seconds = seconds
+
+
+def load_per_cpu() -> float:
+    """
+    1-minute load average divided by the number of CPUs (0 if unknown).
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+def batch_launch(accounts: List[Dict], start: Callable[[Dict], subprocess.Popen],
+                 max_parallel: int = 2, max_load: float = 1.0, min_stagger: float = 0.5,
+                 settle_cpu: float = 0.1, settle_time: float = 2.0, timeout: float = 60.0,
+                 poll: float = 0.25, progress: Optional[LaunchProgress] = None,
+                 running: Optional[Callable[[Dict], bool]] = None,
+                 windows: Optional[Callable[[], Set[int]]] = None) -> BatchReport:
+    """
+    Start Signal for each account (start(acc) returns the Popen) under the
+    limits described in the module docstring. max_parallel 0 means no
+    limit. Accounts for which running(acc) is true are skipped; by default
+    that checks the profile's SingletonLock. Returns when every instance is
+    ready, timed out or gone.
+    """
+    running = running or (lambda acc: is_running(acc["profile_dir"]))
+    began = time.monotonic()
+    results = [LaunchResult(acc["name"]) for acc in accounts]
+    queue = list(zip(accounts, results))
+    starting = []  # type: List[LaunchResult]
+    last_start = None  # type: Optional[float]
+
+    def change(result: LaunchResult, state: str) -> None:
+        result.state = state
+        if progress:
+            progress(result)
+
+    while queue or starting:
+        now = time.monotonic() - began
+
+        # 1) Start the next instance if the limits allow it.
+        if (queue and (not max_parallel or len(starting) < max_parallel)
+                and (last_start is None or now - last_start >= min_stagger)
+                and (not starting or load_per_cpu() < max_load)):
+            acc, result = queue.pop(0)
+            if running(acc):
+                change(result, ALREADY_RUNNING)
+                continue
+            try:
+                result.process = start(acc)
+            except OSError as e:
+                result.error = str(e)
+                change(result, FAILED)
+                continue
+            result.started = result._last_sample = last_start = now
+            starting.append(result)
+            change(result, STARTING)
+            continue
+
+        # 2) Check which starting instances have settled.
+        if starting:
+            table = read_process_table()
+            cpu = tree_cpu_seconds([r.process.pid for r in starting], table)
+            shown = windows() if windows else set()
+            children = children_map(table) if shown else {}
+            now = time.monotonic() - began
+            for result in list(starting):
+                used = cpu.get(result.process.pid)
+                if used is None or result.process.poll() is not None:
+                    result.ready = now
+                    starting.remove(result)
+                    change(result, EXITED)
+                    continue
+                if shown and shown.intersection(process_tree(result.process.pid, children)):
+                    result.ready, result.ready_by = now, WINDOW
+                    starting.remove(result)
+                    change(result, READY)
+                    continue
+                elapsed = now - result._last_sample
+                rate = (used - result._last_cpu) / elapsed if elapsed > 0 else 1.0
+                result._last_cpu, result._last_sample = used, now
+                if rate >= settle_cpu:
+                    result._quiet_since = None
+                elif result._quiet_since is None:
+                    result._quiet_since = now
+                if result._quiet_since is not None and now - result._quiet_since >= settle_time:
+                    result.ready, result.ready_by = result._quiet_since, SETTLED
+                    starting.remove(result)
+                    change(result, READY)
+                elif now - result.started >= timeout:
+                    result.ready = now
+                    starting.remove(result)
+                    change(result, TIMEOUT)
+        time.sleep(poll)
+
+    ready_times = [r.ready for r in results if r.ready is not None]
+    return BatchReport(results, max(ready_times) if ready_times else 0.0)
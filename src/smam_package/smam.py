@@ -1,47 +1,124 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
 import shutil
+import argparse
+import time
 from pathlib import Path
 import subprocess
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
+
+from . import (backup, bulk, chunkstore, dedup, discover, latency, plan, prewarm, purge,
+               reconcile, scheduler, supervisor)
+from .desktop import applications_dir, desktop_file_name, write_desktop_file
+from .fsutil import RemovalStats, clone_tree, parallel_rmtree
+from .instances import is_running
+from .models import canonical_path, profile_identity
+from .trash import Trash
+from .usage import ProfileUsage, UsageCache, format_size, measure
+from .storage import (AccountStore, CorruptStoreError, DuplicateAccountError,
+                      JournaledJsonAccountStore, JsonAccountStore, SqliteAccountStore,
+                      fold_journal, migrate_json_to_sqlite)
 
 # Where we store the info about multiple Signal profiles
 MANAGER_CONFIG_DIR = Path.home() / ".config" / "signal_account_manager"
 ACCOUNTS_JSON = MANAGER_CONFIG_DIR / "accounts.json"
+ACCOUNTS_JOURNAL = MANAGER_CONFIG_DIR / "accounts.journal"
+ACCOUNTS_DB = MANAGER_CONFIG_DIR / "accounts.db"
+TRASH_ROOTS_FILE = MANAGER_CONFIG_DIR / "trash_roots.json"  # where deleted profiles wait for reclaim
+RECLAIM_LOCK = MANAGER_CONFIG_DIR / "reclaim.lock"
+RECLAIM_LOG = MANAGER_CONFIG_DIR / "reclaim.log"   # errors of background reclaimers
+DU_CACHE = MANAGER_CONFIG_DIR / "du_cache.json"    # per-directory scan results of 'smam du'
+DU_TOTALS = MANAGER_CONFIG_DIR / "du_totals.json"  # last measured size of every profile
+HASH_CACHE = MANAGER_CONFIG_DIR / "hash_cache.db"  # attachment digests for 'smam dedup'
+BACKUP_DIR = MANAGER_CONFIG_DIR / "backups"         # default destination of 'smam backup'
+REPO_DIR = MANAGER_CONFIG_DIR / "repo"              # default chunk repository of 'smam repo'
+INSTANCES_JSON = MANAGER_CONFIG_DIR / "instances.json"  # PIDs of the instances smam started
+LOGS_DIR = MANAGER_CONFIG_DIR / "logs"                  # output of launched instances, per account
+LATENCY_JSON = MANAGER_CONFIG_DIR / "latency.json"      # launch latency histograms, per account
+
+# Storage backend: "json", "journal" or "sqlite". Empty means whichever of
+# accounts.db / accounts.journal already exists, plain json otherwise.
+STORE_BACKEND = os.environ.get("SMAM_STORE", "")
 
 DEFAULT_SIGNAL_DIR = Path.home() / ".config" / "Signal"  # The standard Signal Desktop config dir
 DEFAULT_ACCOUNT_NAME = "Default"                        # Label for the automatically-detected default
 
+# Directories searched for unregistered profiles: ~/.config, the Flatpak
+# config dir, and any listed in SMAM_DISCOVERY_ROOTS (os.pathsep-separated).
+DISCOVERY_ROOTS = [Path.home() / ".config",
+                   Path.home() / ".var" / "app" / "org.signal.Signal" / "config"] + [
+    Path(p) for p in os.environ.get("SMAM_DISCOVERY_ROOTS", "").split(os.pathsep) if p]
+
+# Exit statuses of the non-interactive subcommands
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2  # also what argparse uses for bad arguments
+EXIT_NOT_FOUND = 3
+EXIT_EXISTS = 4
+
+OUTPUT_FORMATS = ("text", "ndjson", "tsv")
+
+_store = None  # type: Optional[AccountStore]
+
+def get_store() -> AccountStore:
+    """
+    Return the account store selected by STORE_BACKEND, creating it on first use.
+    Switching to sqlite imports an existing accounts.json once.
+    """
+    global _store
+    if _store is None:
+        backend = STORE_BACKEND
+        if not backend:
+            if ACCOUNTS_DB.exists():
+                backend = "sqlite"
+            elif ACCOUNTS_JOURNAL.exists():
+                backend = "journal"
+            else:
+                backend = "json"
+        if backend == "sqlite":
+            if not ACCOUNTS_DB.exists() and (ACCOUNTS_JSON.exists() or ACCOUNTS_JOURNAL.exists()):
+                count = migrate_json_to_sqlite(ACCOUNTS_JSON, ACCOUNTS_DB, ACCOUNTS_JOURNAL)
+                if count is not None:
+                    print(f"Migrated {count} account(s) from {ACCOUNTS_JSON} to {ACCOUNTS_DB}.",
+                          file=sys.stderr)
+            _store = SqliteAccountStore(ACCOUNTS_DB)
+        elif backend == "journal":
+            _store = JournaledJsonAccountStore(ACCOUNTS_JSON, ACCOUNTS_JOURNAL)
+        elif backend == "json":
+            # Changes recorded in a journal would be invisible to the plain store.
+            if fold_journal(ACCOUNTS_JSON, ACCOUNTS_JOURNAL):
+                print(f"Folded {ACCOUNTS_JOURNAL} into {ACCOUNTS_JSON}.", file=sys.stderr)
+            _store = JsonAccountStore(ACCOUNTS_JSON)
+        else:
+            raise ValueError(f"Unknown SMAM_STORE backend: {backend!r}")
+    return _store
+
 def ensure_config_dir() -> None:
     """
-    Ensure the config directory and accounts.json file exist.
-    Creates the file if it does not exist.
+    Ensure the config directory and the account store exist.
+    Creates the store if it does not exist.
     """
     MANAGER_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-    if not ACCOUNTS_JSON.exists():
-        with open(ACCOUNTS_JSON, "w", encoding="utf-8") as f:
-            json.dump([], f)
+    get_store().ensure()
 
 def load_accounts() -> List[Dict[str, str]]:
     """
-    Load the list of accounts from JSON.
+    Load the list of accounts from the store.
     Returns a list of dictionaries with 'name' and 'profile_dir'.
     """
-    with open(ACCOUNTS_JSON, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
+    return get_store().load()
 
-def save_accounts(accounts: List[Dict[str, str]]) -> None:
+def save_accounts(accounts: List[Dict[str, str]], expected_version=None) -> None:
     """
-    Save the list of accounts to JSON.
+    Save the full list of accounts to the store.
     Each account is a Dict with at least 'name' and 'profile_dir'.
+    Pass the version from get_store().load_versioned() as expected_version to
+    fail with ConcurrentModificationError instead of overwriting someone else's changes.
     """
-    with open(ACCOUNTS_JSON, "w", encoding="utf-8") as f:
-        json.dump(accounts, f, indent=2)
+    get_store().save(accounts, expected_version=expected_version)
 
 def is_signal_installed() -> bool:
     """
@@ -54,90 +131,137 @@ def auto_add_default_signal() -> None:
     """
     If the default Signal directory exists and is not in our accounts list,
     add it automatically as the 'Default' account.
+    The check is a single index lookup on the stored canonical paths.
     """
     if not DEFAULT_SIGNAL_DIR.exists():
         return  # Default directory doesn't exist, so nothing to do
 
-    accounts = load_accounts()
+    store = get_store()
 
     # Check if we already have an entry that uses ~/.config/Signal
-    for acc in accounts:
-        # Compare absolute paths
-        if Path(acc["profile_dir"]).resolve() == DEFAULT_SIGNAL_DIR.resolve():
-            return  # Already added
+    if store.find_by_profile_dir(str(DEFAULT_SIGNAL_DIR)) is not None:
+        return  # Already added
 
     # If we're here, ~/.config/Signal exists but isn't in the list
     new_account = {
         "name": DEFAULT_ACCOUNT_NAME,
         "profile_dir": str(DEFAULT_SIGNAL_DIR)
     }
-    accounts.append(new_account)
-    save_accounts(accounts)
+    try:
+        store.add(new_account)
+    except DuplicateAccountError as e:
+        print(f"Could not add the default Signal directory: {e}")
+        return
     print(f"Detected existing default Signal directory and added it as '{DEFAULT_ACCOUNT_NAME}' account.")
 
+def discover_profiles(roots: Optional[List[str]] = None, dry_run: bool = False) -> List[Dict]:
+    """
+    Find Signal profiles in the discovery roots that no account uses and
+    register them all with one store write. Returns the new records.
+    """
+    candidates = discover.find_profiles(roots or [str(p) for p in DISCOVERY_ROOTS])
+    store = get_store()
+    records = discover.unregistered(candidates, store.load_table(), DEFAULT_ACCOUNT_NAME)
+    if records and not dry_run:
+        store.add_many(records)
+    return records
+
+def find_unregistered() -> None:
+    """
+    Interactive discovery: show unregistered profiles and offer to add them.
+    """
+    records = discover_profiles(dry_run=True)
+    if not records:
+        print("No unregistered Signal profiles found.")
+        return
+    print("Unregistered Signal profiles:")
+    for i, record in enumerate(records, start=1):
+        print(f"  {i}) {record['name']} -> {record['profile_dir']}")
+    if input("Add all of them? (y/n): ").lower() != 'y':
+        return
+    try:
+        get_store().add_many(records)
+    except DuplicateAccountError as e:
+        print(f"Could not add the profiles: {e}")
+        return
+    print(f"Added {len(records)} account(s).")
+
 def list_accounts() -> None:
     """
     Print the list of existing accounts to the console.
     """
-    accounts = load_accounts()
-    if not accounts:
+    table = get_store().load_table()
+    if not table:
         print("No accounts found.")
     else:
+        sizes = UsageCache(DU_CACHE, DU_TOTALS).totals()
         print("Existing accounts:")
-        for i, acc in enumerate(accounts, start=1):
-            print(f"  {i}) {acc['name']} -> {acc['profile_dir']}")
+        for i, acc in enumerate(table, start=1):
+            print(format_account(acc, "text", i, sizes.get(acc.canonical_dir or "")))
+
+def _tsv_field(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def format_account(acc: Dict[str, str], fmt: str, number: int,
+                   usage: Optional[ProfileUsage] = None) -> str:
+    """
+    Render one account record as a line of output in the given format:
+    'text' (same as the menu, with the last measured size if known),
+    'ndjson' (the full record as one JSON object) or 'tsv' (name and
+    profile_dir, tab-separated, with \\t/\\n escaped).
+    """
+    if fmt == "ndjson":
+        return json.dumps(acc, ensure_ascii=False)
+    if fmt == "tsv":
+        return f"{_tsv_field(acc['name'])}\t{_tsv_field(acc['profile_dir'])}"
+    line = f"  {number}) {acc['name']} -> {acc['profile_dir']}"
+    if usage is not None:
+        line += f" ({format_size(usage.total)})"
+    return line
+
+def stream_accounts(records: Iterable[Dict[str, str]], fmt: str, start: int = 1, out=None,
+                    sizes: Optional[Dict[str, ProfileUsage]] = None) -> int:
+    """
+    Write records to out (stdout by default) one line at a time as they are
+    produced. Returns the number of records written. sizes maps canonical
+    profile directories to their last measured usage.
+    """
+    count = 0
+    sizes = sizes or {}
+    write = (out or sys.stdout).write
+    for count, acc in enumerate(records, start=1):
+        usage = sizes.get(acc.get("canonical_dir") or "")
+        write(format_account(acc, fmt, start + count - 1, usage) + "\n")
+    return count
 
 def create_desktop_icon(account_name: str, profile_dir_str: str) -> None:
     """
     Create a .desktop file for the given account so the user can launch Signal
     with this profile directly from their application menu or desktop.
     """
-    # Where we'll place the .desktop file (typical location in many Linux distros)
-    applications_dir = Path.home() / ".local" / "share" / "applications"
-    applications_dir.mkdir(parents=True, exist_ok=True)
-
-    # File name might be "Signal-Work.desktop" for example
-    sanitized_name = account_name.replace(" ", "_")
-    desktop_path = applications_dir / f"Signal-{sanitized_name}.desktop"
-
-    # .desktop file content
-    desktop_file_content = f"""[Desktop Entry]
-Name=Signal - {account_name}
-Comment=Launch Signal for the '{account_name}' profile
-Exec=signal-desktop --user-data-dir="{profile_dir_str}"
-Terminal=false
-Type=Application
-Icon=signal-desktop
-Categories=Network;InstantMessaging;"""
-
-    # Write the .desktop file
-    with open(desktop_path, "w", encoding="utf-8") as f:
-        f.write(desktop_file_content)
-
-    # Make it executable
-    desktop_path.chmod(0o755)
-
+    desktop_path = write_desktop_file(account_name, profile_dir_str)
     print(f"Created a desktop launcher: {desktop_path}")
 
 def add_account() -> None:
     """
-    Add a new account by creating a new profile directory and storing it in JSON.
+    Add a new account by creating a new profile directory and storing it in the registry.
     After adding, optionally create a desktop icon.
     """
-    accounts = load_accounts()
     name = input("Enter a label for this new account (e.g., 'Work', 'Personal'): ").strip()
+    profile_dir_str = str(default_profile_dir(name))
 
-    profile_dir = Path.home() / f".config/Signal-{name.replace(' ', '_')}"
-    profile_dir_str = str(profile_dir)
-
-    if profile_dir.exists():
+    if Path(profile_dir_str).exists():
         print(f"Directory {profile_dir_str} already exists. "
               "If it’s a valid Signal profile, you can add it anyway or choose a different name.")
-    else:
-        profile_dir.mkdir(parents=True, exist_ok=True)
 
-    accounts.append({"name": name, "profile_dir": profile_dir_str})
-    save_accounts(accounts)
+    template = input("Copy settings and caches from a template profile? "
+                     "(directory, or leave empty for a blank profile): ").strip()
+
+    try:
+        register_account(name, template=os.path.expanduser(template) if template else None)
+    except (ValueError, OSError) as e:
+        print(f"Could not add account: {e}")
+        return
     print(f"Account '{name}' added. When you first launch it, you must link it with your phone.")
 
     # Ask if user wants to create a .desktop launcher
@@ -147,44 +271,258 @@ def add_account() -> None:
     else:
         print("Skipping desktop launcher creation.")
 
+def default_profile_dir(name: str) -> Path:
+    """
+    Profile directory used for a new account: ~/.config/Signal-<name>, with
+    spaces in the name replaced by underscores.
+    """
+    return Path.home() / f".config/Signal-{name.replace(' ', '_')}"
+
+def register_account(name: str, profile_dir: Optional[str] = None,
+                     desktop_icon: bool = False, template: Optional[str] = None) -> Dict[str, str]:
+    """
+    Non-interactive core of add_account(): create the profile directory if
+    needed, add the account to the store and optionally create its desktop
+    launcher. Returns the stored record.
+
+    With a template, the new profile starts as a clone of that profile
+    directory, minus its linked account (database, attachments, lock files).
+    Files are reflinked where the filesystem supports it, so this is cheap
+    even for large templates.
+
+    Raises ValueError for an empty name, a template that is not a directory
+    or a non-empty target, DuplicateAccountError (a ValueError) if the name or
+    the directory is already registered, and OSError if cloning fails.
+    """
+    if not name:
+        raise ValueError("Account name must not be empty.")
+    store = get_store()
+    profile_dir_str = profile_dir or str(default_profile_dir(name))
+
+    if store.get(name) is not None:
+        raise DuplicateAccountError(f"An account named '{name}' already exists.")
+    other = store.find_by_profile_dir(profile_dir_str)
+    if other is not None:
+        raise DuplicateAccountError(
+            f"Profile directory {profile_dir_str} is already used by '{other['name']}'.")
+
+    if template:
+        if not os.path.isdir(template):
+            raise ValueError(f"Template profile {template} is not a directory.")
+        if Path(profile_dir_str).exists() and any(Path(profile_dir_str).iterdir()):
+            raise ValueError(f"Cannot clone a template into {profile_dir_str}: it is not empty.")
+    created = not os.path.lexists(profile_dir_str)
+    record = {"name": name, "profile_dir": profile_dir_str}
+    try:
+        if template:
+            stats = clone_tree(template, profile_dir_str)
+            print(f"Cloned template {template}: {stats}")
+        else:
+            Path(profile_dir_str).mkdir(parents=True, exist_ok=True)
+        store.add(record)
+    except FileExistsError:
+        # clone_tree() found the target filled meanwhile: nothing in it is ours.
+        raise
+    except BaseException:
+        # Take back what this call put on disk, and nothing that was there before.
+        _discard_new_profile(profile_dir_str, created, cloned_into=bool(template))
+        raise
+
+    if desktop_icon:
+        create_desktop_icon(name, profile_dir_str)
+    return record
+
+def _discard_new_profile(profile_dir: str, created: bool, cloned_into: bool) -> None:
+    # A directory we created goes entirely; in an existing (empty) one we
+    # only remove what a clone put there.
+    if not os.path.isdir(profile_dir) or os.path.islink(profile_dir):
+        return
+    if created:
+        parallel_rmtree(profile_dir, ignore_errors=True)
+    elif cloned_into:
+        with os.scandir(profile_dir) as it:
+            entries = list(it)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                parallel_rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+
+def launch_account(acc) -> subprocess.Popen:
+    """
+    Start Signal Desktop with the account's profile directory, detached from
+    this process and with its output in LOGS_DIR/<name>.log.
+    """
+    return supervisor.spawn_detached(["signal-desktop", f"--user-data-dir={acc['profile_dir']}"],
+                                     LOGS_DIR / supervisor.log_file_name(acc["name"]))
+
+def get_instances() -> supervisor.InstanceRegistry:
+    """
+    The registry of the Signal instances smam started.
+    """
+    return supervisor.InstanceRegistry(INSTANCES_JSON)
+
+def start_tracked(acc) -> subprocess.Popen:
+    """
+    launch_account() and record the new instance in the registry.
+    """
+    process = launch_account(acc)
+    get_instances().record(acc["name"], process.pid, acc["profile_dir"])
+    return process
+
 def select_account() -> None:
     """
     Allow the user to select an existing account and launch Signal with that profile.
     """
-    accounts = load_accounts()
-    if not accounts:
+    table = get_store().load_table()
+    if not table:
         print("No accounts to select.")
         return
 
     list_accounts()
-    choice = input("Enter the number of the account you want to launch: ").strip()
+    choice = input("Enter the number of the account you want to launch "
+                   "(several separated by commas, or 'a' for all): ").strip()
     try:
-        idx = int(choice) - 1
-        acc = accounts[idx]
+        if choice.lower() == 'a':
+            accounts = list(table)
+        else:
+            accounts = [table[int(part) - 1] for part in choice.split(",")]
     except (ValueError, IndexError):
         print("Invalid choice.")
         return
 
-    profile_dir = acc["profile_dir"]
-    print(f"Launching Signal for account '{acc['name']}' using directory {profile_dir} ...")
-    subprocess.Popen(["signal-desktop", f"--user-data-dir={profile_dir}"])
-    print("Signal launched. You can close this script or continue to manage other accounts.")
+    launch_batch(accounts)
+    print("You can close this script or continue to manage other accounts.")
+
+def _print_launch_progress(result: scheduler.LaunchResult) -> None:
+    if result.state == scheduler.STARTING:
+        print(f"Starting '{result.name}' ...")
+    elif result.state in (scheduler.READY, scheduler.TIMEOUT):
+        note = {scheduler.TIMEOUT: " (did not settle)",
+                scheduler.WINDOW: " (window shown)"}.get(result.ready_by or result.state, "")
+        print(f"'{result.name}' ready after {result.time_to_ready:.1f}s{note}.")
+    elif result.state == scheduler.FAILED:
+        print(f"Could not start '{result.name}': {result.error}")
+    else:
+        print(f"'{result.name}': {result.state}.")
+
+def launch_batch(accounts, max_parallel: int = 2, max_load: float = 1.0,
+                 timeout: float = 60.0, warm: bool = False) -> scheduler.BatchReport:
+    """
+    Launch accounts one after another with a concurrency limit and a stagger
+    driven by system load and by each instance settling down (or showing
+    its window). The time each instance took to become ready is added to
+    its latency histogram. With warm, the Signal binary and the profile's
+    databases are prewarmed into the page cache alongside each start.
+    """
+    registry = get_instances()
+
+    def start(acc) -> subprocess.Popen:
+        if warm:
+            prewarm.prewarm_in_background(acc["profile_dir"])
+        return start_tracked(acc)
+
+    report = scheduler.batch_launch([acc.to_dict() for acc in accounts], start,
+                                    max_parallel=max_parallel, max_load=max_load,
+                                    timeout=timeout, progress=_print_launch_progress,
+                                    running=lambda acc: supervisor.find_instance(acc, registry)
+                                    is not None, windows=latency.window_probe())
+    latency.LatencyStore(LATENCY_JSON).record(
+        {r.name: r.time_to_ready for r in report.results if r.state == scheduler.READY})
+    if len(report.results) > 1:
+        ready = sum(1 for r in report.results if r.state in (scheduler.READY, scheduler.TIMEOUT))
+        print(f"{ready} of {len(report.results)} instance(s) ready after {report.seconds:.1f}s.")
+    return report
 
 def get_desktop_file_path(account_name: str) -> Path:
     """
     Given an account name, return the expected path for its .desktop file in
     ~/.local/share/applications.
     """
-    sanitized_name = account_name.replace(" ", "_")
-    return Path.home() / ".local" / "share" / "applications" / f"Signal-{sanitized_name}.desktop"
+    return applications_dir() / desktop_file_name(account_name)
+
+def get_trash() -> Trash:
+    """
+    The trash that deleted profile directories are moved into.
+    """
+    return Trash(TRASH_ROOTS_FILE, RECLAIM_LOCK)
+
+def start_background_reclaim() -> None:
+    """
+    Start a detached 'smam reclaim' process if there is something in the
+    trash and no reclaimer is running yet. Its output goes to RECLAIM_LOG.
+    """
+    trash = get_trash()
+    if not trash.pending() or trash.is_reclaiming():
+        return
+    supervisor.spawn_detached([sys.executable, "-m", "smam_package.smam", "reclaim", "--quiet"],
+                              RECLAIM_LOG)
+
+def _print_reclaim_progress(done: int, total: int, path: Path,
+                            stats: Optional[RemovalStats]) -> None:
+    print(f"[{done}/{total}] Reclaimed {path}" + (f": {stats}" if stats else ""))
+
+def remove_account(acc, remove_profile: bool = False, wait: bool = False) -> bool:
+    """
+    Non-interactive core of delete_account(): optionally remove the profile
+    directory, remove the .desktop file if there is one, and drop the account
+    from the store. Returns False if any of the file removals failed.
+
+    The profile directory is renamed into the trash right away and its
+    contents are deleted by a background reclaimer (or before returning,
+    with wait=True).
+    """
+    ok = True
+    trashed = False
+
+    # 1) Optionally remove the profile directory
+    if remove_profile:
+        try:
+            target = get_trash().move(acc["profile_dir"])
+            trashed = True
+            print(f"Moved directory {acc['profile_dir']} to {target}")
+        except FileNotFoundError as e:
+            print(f"Could not remove directory: {e}")
+            ok = False
+        except OSError:
+            # Cannot be renamed within its filesystem (e.g. it is a mount point).
+            try:
+                stats = parallel_rmtree(acc["profile_dir"])
+                print(f"Removed directory: {acc['profile_dir']} ({stats})")
+            except Exception as e:
+                print(f"Could not remove directory: {e}")
+                ok = False
+
+    # 2) Remove the desktop icon if it exists
+    desktop_file_path = get_desktop_file_path(acc["name"])
+    if desktop_file_path.exists():
+        try:
+            desktop_file_path.unlink()
+            print(f"Removed desktop icon: {desktop_file_path}")
+        except Exception as e:
+            print(f"Could not remove desktop icon: {e}")
+            ok = False
+
+    # 3) Remove from our account store
+    get_store().remove(acc["name"])
+    print(f"Account '{acc['name']}' removed.")
+
+    # 4) Reclaim the disk space
+    if trashed:
+        if wait:
+            get_trash().reclaim(progress=_print_reclaim_progress)
+        else:
+            start_background_reclaim()
+            print("Its files are being deleted in the background.")
+    return ok
 
 def delete_account() -> None:
     """
     Delete an account from the manager, optionally removing its profile directory.
     Also remove the corresponding .desktop file if it was created.
     """
-    accounts = load_accounts()
-    if not accounts:
+    table = get_store().load_table()
+    if not table:
         print("No accounts to delete.")
         return
 
@@ -192,46 +530,1002 @@ def delete_account() -> None:
     choice = input("Enter the number of the account to delete: ").strip()
     try:
         idx = int(choice) - 1
-        acc = accounts[idx]
+        acc = table[idx]
     except (ValueError, IndexError):
         print("Invalid choice.")
         return
 
-    confirm = input(f"Are you sure you want to delete '{acc['name']}' from the manager? (y/n): ").lower()
+    confirm = input(f"Are you sure you want to delete '{acc.name}' from the manager? (y/n): ").lower()
     if confirm == 'y':
-        # 1) Optionally remove the profile directory
         rm_dir = input("Remove the profile directory from disk as well? (y/n): ").lower()
-        if rm_dir == 'y':
-            try:
-                shutil.rmtree(acc["profile_dir"])
-                print(f"Removed directory: {acc['profile_dir']}")
-            except Exception as e:
-                print(f"Could not remove directory: {e}")
+        remove_account(acc, remove_profile=(rm_dir == 'y'))
+    else:
+        print("Deletion cancelled.")
 
-        # 2) Remove the desktop icon if it exists
-        desktop_file_path = get_desktop_file_path(acc["name"])
-        if desktop_file_path.exists():
-            try:
-                desktop_file_path.unlink()
-                print(f"Removed desktop icon: {desktop_file_path}")
-            except Exception as e:
-                print(f"Could not remove desktop icon: {e}")
+def cmd_list(args: argparse.Namespace) -> int:
+    """
+    'smam list': stream the registry, paginated and filtered.
+    """
+    records = get_store().iter_accounts(offset=args.offset, limit=args.limit,
+                                        name_glob=args.name, path_glob=args.path)
+    sizes = UsageCache(DU_CACHE, DU_TOTALS).totals() if args.format == "text" else None
+    count = stream_accounts(records, args.format, start=args.offset + 1, sizes=sizes)
+    if count == 0 and args.format == "text":
+        print("No accounts found.")
+    return EXIT_OK
+
+def _lookup(names: List[str]):
+    """
+    Resolve account names against one snapshot of the registry.
+    Returns (found accounts, missing names).
+    """
+    table = get_store().load_table()
+    found, missing = [], []
+    for name in names:
+        acc = table.get(name)
+        if acc is None:
+            missing.append(name)
+        else:
+            found.append(acc)
+    for name in missing:
+        print(f"No account named '{name}'.", file=sys.stderr)
+    return found, missing
+
+def cmd_add(args: argparse.Namespace) -> int:
+    """
+    'smam add NAME': register a new account without prompting.
+    """
+    try:
+        register_account(args.name, args.profile_dir, desktop_icon=args.desktop_icon,
+                         template=args.template)
+    except DuplicateAccountError as e:
+        print(e, file=sys.stderr)
+        return EXIT_EXISTS
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+    except OSError as e:
+        print(f"Could not clone the template: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    print(f"Account '{args.name}' added. When you first launch it, you must link it with your phone.")
+    return EXIT_OK
 
-        # 3) Remove from our JSON store
-        del accounts[idx]
-        save_accounts(accounts)
-        print(f"Account '{acc['name']}' removed.")
+def cmd_launch(args: argparse.Namespace) -> int:
+    """
+    'smam launch NAME...': start Signal for each named account.
+    """
+    if not is_signal_installed():
+        print("Signal Desktop is not found on this system (signal-desktop not on PATH).", file=sys.stderr)
+        return EXIT_FAILURE
+    if args.all:
+        found = list(get_store().load_table())
+    elif args.names:
+        found, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
     else:
-        print("Deletion cancelled.")
+        print("Name at least one account, or use --all.", file=sys.stderr)
+        return EXIT_USAGE
+    if not args.no_wait:
+        report = launch_batch(found, max_parallel=args.parallel, max_load=args.max_load,
+                              timeout=args.timeout, warm=args.prewarm)
+        failed = [r for r in report.results if r.state in (scheduler.FAILED, scheduler.EXITED)]
+        return EXIT_OK if not failed else EXIT_FAILURE
+    for acc in found:
+        if args.prewarm:
+            prewarm.prewarm(prewarm.launch_files(acc.profile_dir))
+        try:
+            supervisor.launch(acc, launch_account, get_instances())
+        except supervisor.AlreadyRunningError as e:
+            print(e)
+            continue
+        print(f"Launched Signal for account '{acc.name}'.")
+    return EXIT_OK
+
+def cmd_prewarm(args: argparse.Namespace) -> int:
+    """
+    'smam prewarm': read the Signal binary and the accounts' databases into
+    the page cache ahead of a launch, e.g. from a login script.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts = list(get_store().load_table())
+    paths = prewarm.signal_files()
+    for acc in accounts:
+        paths.extend(prewarm.profile_files(acc.profile_dir))
+    result = prewarm.prewarm(paths, workers=args.workers)
+    print(f"Prewarmed {result}.")
+    return EXIT_OK
+
+def cmd_latency(args: argparse.Namespace) -> int:
+    """
+    'smam latency': show how long each account took to become ready after
+    launch (median, 95th percentile and worst), or forget the samples.
+    """
+    if args.names:
+        _, missing = _lookup(args.names)
+        if missing and not args.reset:
+            return EXIT_NOT_FOUND
+    store = latency.LatencyStore(LATENCY_JSON)
+    if args.reset:
+        store.reset(args.names or None)
+        print("Launch latency samples forgotten.")
+        return EXIT_OK
+    histograms = store.load()
+    names = args.names or sorted(histograms)
+    for name in names:
+        hist = histograms.get(name)
+        if hist is None:
+            if args.format == "text":
+                print(f"{name}: no launches measured")
+            continue
+        p50, p95 = hist.quantile(0.5), hist.quantile(0.95)
+        if args.format == "ndjson":
+            print(json.dumps({"name": name, "launches": hist.count, "p50": round(p50, 2),
+                              "p95": round(p95, 2), "max": round(hist.max, 2),
+                              "last": round(hist.last, 2)}, ensure_ascii=False))
+            continue
+        print(f"{name}: p50 {p50:.1f}s, p95 {p95:.1f}s, max {hist.max:.1f}s, "
+              f"last {hist.last:.1f}s ({hist.count} launches)")
+    return EXIT_OK
+
+def _format_uptime(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d{hours:02d}h"
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{secs:02d}s"
+
+def cmd_status(args: argparse.Namespace) -> int:
+    """
+    'smam status': show which accounts have a running Signal instance.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts = list(get_store().load_table())
+    now = time.time()
+    for st in supervisor.status(accounts, get_instances()):
+        if args.format == "ndjson":
+            print(json.dumps(st.to_dict(), ensure_ascii=False))
+            continue
+        if not st.running:
+            print(f"{st.name}: stopped")
+            continue
+        details = [f"PID {st.pid}"]
+        if st.started is not None:
+            details.append(f"up {_format_uptime(now - st.started)}")
+        else:
+            details.append(f"found by {st.source}")
+        if st.restarts:
+            details.append(f"{st.restarts} restart(s)")
+        print(f"{st.name}: running ({', '.join(details)})")
+    return EXIT_OK
+
+def _print_supervise_progress(name: str, event: str, detail: str) -> None:
+    print(f"{time.strftime('%H:%M:%S')} {name}: {event}" + (f" ({detail})" if detail else ""))
+
+def cmd_supervise(args: argparse.Namespace) -> int:
+    """
+    'smam supervise': start the accounts' instances and restart them when
+    they crash, until all of them have been closed.
+    """
+    if not is_signal_installed():
+        print("Signal Desktop is not found on this system (signal-desktop not on PATH).", file=sys.stderr)
+        return EXIT_FAILURE
+    if args.all:
+        accounts = list(get_store().load_table())
+    elif args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        print("Name at least one account, or use --all.", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        supervisor.supervise([acc.to_dict() for acc in accounts], launch_account, get_instances(),
+                             max_restarts=args.max_restarts, backoff=args.backoff,
+                             progress=_print_supervise_progress)
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+def cmd_delete(args: argparse.Namespace) -> int:
+    """
+    'smam delete NAME...': remove accounts without asking for confirmation.
+    """
+    found, missing = _lookup(args.names)
+    if missing:
+        return EXIT_NOT_FOUND
+    ok = True
+    for acc in found:
+        ok = remove_account(acc, remove_profile=args.remove_profile, wait=args.wait) and ok
+    return EXIT_OK if ok else EXIT_FAILURE
+
+def cmd_reclaim(args: argparse.Namespace) -> int:
+    """
+    'smam reclaim': delete the contents of the trash, resuming whatever an
+    earlier (possibly crashed) run left behind.
+    """
+    trash = get_trash()
+    if args.status:
+        pending = trash.pending()
+        state = "running" if trash.is_reclaiming() else "idle"
+        print(f"Reclaimer {state}, {len(pending)} directory(ies) pending.")
+        for path in pending:
+            print(f"  {path}")
+        return EXIT_OK
+    done = trash.reclaim(progress=None if args.quiet else _print_reclaim_progress)
+    if done is None:
+        if not args.quiet:
+            print("Another reclaim is already running.")
+        return EXIT_OK
+    left = len(trash.pending())
+    if not args.quiet:
+        print(f"Reclaimed {done} directory(ies), {left} left.")
+    return EXIT_OK if not left else EXIT_FAILURE
+
+def cmd_du(args: argparse.Namespace) -> int:
+    """
+    'smam du': measure profile directories, largest first, with a breakdown
+    by top-level subdirectory. Unchanged subtrees are taken from the cache.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts, missing = list(get_store().load_table()), []
+    cache = UsageCache(DU_CACHE, DU_TOTALS)
+    if not args.names:
+        cache.forget({acc.canonical_dir or canonical_path(acc.profile_dir) for acc in accounts})
+
+    results = []
+    ok = True
+    for acc in accounts:
+        profile_dir = acc.canonical_dir or canonical_path(acc.profile_dir)
+        try:
+            results.append((acc, cache.scan(profile_dir, workers=args.workers, rescan=args.rescan)))
+        except OSError as e:
+            print(f"{acc.name}: cannot measure {acc.profile_dir}: {e}", file=sys.stderr)
+            ok = False
+    cache.save()
+
+    results.sort(key=lambda item: item[1].total, reverse=True)
+    for acc, usage in results:
+        if args.format == "ndjson":
+            print(json.dumps(dict(usage.to_dict(), name=acc.name, profile_dir=acc.profile_dir),
+                             ensure_ascii=False))
+            continue
+        print(f"{format_size(usage.total):>10}  {acc.name} -> {acc.profile_dir} ({usage.files} files)")
+        for top, size in sorted(usage.by_dir.items(), key=lambda item: item[1], reverse=True):
+            if size:
+                print(f"{format_size(size):>10}      {top}")
+    if args.format == "text" and len(results) > 1:
+        print(f"{format_size(sum(u.total for _, u in results)):>10}  total")
+    return EXIT_OK if ok else EXIT_FAILURE
+
+def cmd_dedup(args: argparse.Namespace) -> int:
+    """
+    'smam dedup': replace identical attachments in different profiles with
+    links to a single copy.
+    """
+    profile_dirs = [acc.canonical_dir or canonical_path(acc.profile_dir)
+                    for acc in get_store().load_table()]
+    cache = dedup.HashCache(HASH_CACHE)
+    try:
+        report = dedup.dedup(profile_dirs, cache, dry_run=args.dry_run,
+                             workers=args.workers, min_size=args.min_size)
+    finally:
+        cache.close()
+    for path, error in report.failed:
+        print(f"Could not deduplicate {path}: {error}", file=sys.stderr)
+    verb = "Would free" if args.dry_run else "Freed"
+    methods = ", ".join(f"{count} {method}" for method, count in sorted(report.methods.items()))
+    print(f"Checked {report.files} file(s) in {len(profile_dirs)} profile(s): hashed "
+          f"{report.hashed}, {report.cached} from cache.")
+    print(f"{report.duplicates} duplicate(s)" + (f" ({methods})" if methods else "")
+          + f". {verb} {format_size(report.bytes_saved)}.")
+    return EXIT_OK if not report.failed else EXIT_FAILURE
+
+def cmd_backup(args: argparse.Namespace) -> int:
+    """
+    'smam backup': archive the profiles of the named accounts (default: all),
+    storing only files that changed since their previous backup.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts = list(get_store().load_table())
+    dest = Path(os.path.expanduser(args.dest))
+    ok = True
+    for acc in accounts:
+        if is_running(acc.profile_dir):
+            print(f"Warning: Signal seems to be running for '{acc.name}'; "
+                  "its database may be backed up mid-write.", file=sys.stderr)
+        record = acc.to_dict()
+        try:
+            result = backup.backup_profile(record, dest, workers=args.workers, full=args.full)
+        except OSError as e:
+            print(f"Could not back up '{acc.name}': {e}", file=sys.stderr)
+            ok = False
+            continue
+        record["last_backup"] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "manifest": str(result.manifest),
+            "files": result.files,
+            "changed": result.changed,
+        }
+        get_store().put(record)
+        print(f"Backed up '{acc.name}': {result.changed} of {result.files} file(s) changed, "
+              f"{format_size(result.bytes_in)} -> {format_size(result.bytes_out)} "
+              f"in {result.seconds:.1f}s ({result.archive})")
+    return EXIT_OK if ok else EXIT_FAILURE
+
+def cmd_restore(args: argparse.Namespace) -> int:
+    """
+    'smam restore NAME': rebuild a profile from its newest backup (or the
+    given manifest) and register the account again.
+    """
+    if args.manifest:
+        manifest = Path(args.manifest)
+    else:
+        manifest = backup.latest_manifest(
+            backup.account_backup_dir(Path(os.path.expanduser(args.dest)), args.name))
+        if manifest is None:
+            print(f"No backup of '{args.name}' found in {args.dest}.", file=sys.stderr)
+            return EXIT_NOT_FOUND
+    current = get_store().get(args.name)
+    try:
+        saved = backup.read_manifest(manifest)["account"]
+        target = os.path.expanduser(args.to or saved["profile_dir"])
+        if current is not None and canonical_path(current["profile_dir"]) != canonical_path(target):
+            print(f"Account '{args.name}' is registered with another profile directory "
+                  f"({current['profile_dir']}).", file=sys.stderr)
+            return EXIT_EXISTS
+        record = backup.restore_profile(manifest, target)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not restore '{args.name}': {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    record.update(name=args.name, profile_dir=target,
+                  last_backup=(current or {}).get("last_backup") or {"manifest": str(manifest)})
+    try:
+        get_store().put(record)
+    except DuplicateAccountError as e:
+        print(e, file=sys.stderr)
+        return EXIT_EXISTS
+    print(f"Restored '{args.name}' into {target}.")
+    return EXIT_OK
+
+def cmd_repo_snapshot(args: argparse.Namespace) -> int:
+    """
+    'smam repo snapshot': store the profiles of the named accounts (default:
+    all) in the chunk repository as one snapshot.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts = list(get_store().load_table())
+    repo = chunkstore.ChunkRepository(os.path.expanduser(args.repo))
+    try:
+        result = repo.snapshot([acc.to_dict() for acc in accounts], workers=args.workers)
+    except OSError as e:
+        print(f"Could not create the snapshot: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    ratio = result.logical / result.stored if result.stored else 0.0
+    print(f"Snapshot {result.path.name}: {len(accounts)} profile(s), {result.files} file(s), "
+          f"{format_size(result.logical)}; read {format_size(result.read)}, stored "
+          f"{result.new_chunks} new chunk(s), {format_size(result.stored)}"
+          + (f" ({ratio:.1f}x smaller)" if ratio else "") + f" in {result.seconds:.1f}s.")
+    return EXIT_OK
+
+def cmd_repo_list(args: argparse.Namespace) -> int:
+    """
+    'smam repo list': show snapshots and repository size.
+    """
+    repo = chunkstore.ChunkRepository(os.path.expanduser(args.repo))
+    for path in repo.snapshots():
+        profiles = repo.load_snapshot(path)["profiles"]
+        size = sum(entry[0] for p in profiles.values() for entry in p["files"].values())
+        print(f"{path.stem}  {len(profiles)} profile(s), {format_size(size)}: "
+              + ", ".join(sorted(profiles)))
+    count, size = repo.stats()
+    print(f"{count} chunk(s), {format_size(size)} on disk.")
+    return EXIT_OK
+
+def cmd_repo_restore(args: argparse.Namespace) -> int:
+    """
+    'smam repo restore NAME': rebuild a profile from a snapshot (default: the
+    newest one containing it) and register the account again.
+    """
+    repo = chunkstore.ChunkRepository(os.path.expanduser(args.repo))
+    if args.snapshot:
+        snapshot = repo.root / "snapshots" / f"{args.snapshot}.json"
+    else:
+        snapshot = next((path for path in reversed(repo.snapshots())
+                         if args.name in repo.load_snapshot(path)["profiles"]), None)
+        if snapshot is None:
+            print(f"No snapshot contains '{args.name}'.", file=sys.stderr)
+            return EXIT_NOT_FOUND
+    current = get_store().get(args.name)
+    try:
+        saved = repo.load_snapshot(snapshot)["profiles"][args.name]["account"]
+        target = os.path.expanduser(args.to or saved["profile_dir"])
+        if current is not None and canonical_path(current["profile_dir"]) != canonical_path(target):
+            print(f"Account '{args.name}' is registered with another profile directory "
+                  f"({current['profile_dir']}).", file=sys.stderr)
+            return EXIT_EXISTS
+        record = repo.restore(snapshot, args.name, target)
+    except KeyError:
+        print(f"Snapshot {snapshot.stem} does not contain '{args.name}'.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+    except (OSError, ValueError) as e:
+        print(f"Could not restore '{args.name}': {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    record.update(name=args.name, profile_dir=target)
+    try:
+        get_store().put(record)
+    except DuplicateAccountError as e:
+        print(e, file=sys.stderr)
+        return EXIT_EXISTS
+    print(f"Restored '{args.name}' from snapshot {snapshot.stem} into {target}.")
+    return EXIT_OK
+
+def cmd_purge(args: argparse.Namespace) -> int:
+    """
+    'smam purge': delete Electron caches of the named accounts (default: all)
+    following each account's cache_policy, skipping running instances.
+    """
+    if args.names:
+        accounts, missing = _lookup(args.names)
+        if missing:
+            return EXIT_NOT_FOUND
+    else:
+        accounts = list(get_store().load_table())
+    results = purge.purge_all([acc.to_dict() for acc in accounts], dry_run=args.dry_run,
+                              workers=args.workers)
+    verb = "would free" if args.dry_run else "freed"
+    total = 0
+    for acc, result in results:
+        if result.skipped:
+            print(f"{acc['name']}: skipped ({result.skipped})")
+            continue
+        total += result.bytes
+        line = f"{acc['name']}: {verb} {format_size(result.bytes)} in {result.files} file(s)"
+        if result.errors:
+            line += f", {result.errors} error(s)"
+        print(line)
+    print(f"Total: {verb} {format_size(total)}.")
+    return EXIT_OK if not any(result.errors for _, result in results) else EXIT_FAILURE
+
+def cmd_policy(args: argparse.Namespace) -> int:
+    """
+    'smam policy NAME': show or change the cache purge policy of an account.
+    """
+    found, missing = _lookup([args.name])
+    if missing:
+        return EXIT_NOT_FOUND
+    record = found[0].to_dict()
+    policy = dict(record.get("cache_policy") or {})
+    if args.reset:
+        policy = {}
+    if args.never:
+        policy["purge"] = False
+    if args.always:
+        policy["purge"] = True
+    if args.max_age_days is not None:
+        policy["max_age_days"] = args.max_age_days
+    if args.keep is not None:
+        policy["keep"] = args.keep
+    try:
+        effective = purge.validate_policy(policy)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+    if args.reset or args.never or args.always or args.max_age_days is not None or args.keep is not None:
+        if policy:
+            record["cache_policy"] = policy
+        else:
+            record.pop("cache_policy", None)
+        get_store().put(record)
+    print(f"{args.name}: " + json.dumps(effective))
+    return EXIT_OK
+
+def cmd_discover(args: argparse.Namespace) -> int:
+    """
+    'smam discover': register Signal profiles found in the discovery roots.
+    """
+    try:
+        records = discover_profiles(args.roots, dry_run=args.dry_run)
+    except DuplicateAccountError as e:
+        # Someone registered one of them in the meantime.
+        print(e, file=sys.stderr)
+        return EXIT_EXISTS
+    verb = "Would add" if args.dry_run else "Added"
+    for record in records:
+        print(f"{verb} '{record['name']}' -> {record['profile_dir']}")
+    print(f"{verb} {len(records)} account(s).")
+    return EXIT_OK
+
+def find_orphans() -> List[reconcile.Orphan]:
+    """
+    Launchers, Signal-* profile directories and registry entries that do not
+    belong together, using the same naming rules as add_account().
+    """
+    return reconcile.find_orphans(get_store().load_table(), applications_dir(),
+                                  default_profile_dir("x").parent,
+                                  lambda name: get_desktop_file_path(name).name)
+
+def fix_orphans(orphans: List[reconcile.Orphan], delete_dirs: bool = False) -> bool:
+    """
+    Remove orphaned launchers, unregister accounts whose directory is gone
+    (with their launchers) and register orphaned profile directories as
+    accounts, or, only with delete_dirs, move them to the trash. Returns
+    False if anything failed.
+    """
+    ok = True
+    store = get_store()
+
+    # 1) Accounts first, in one write, so their launchers become orphans too.
+    gone = {o.name for o in orphans if o.kind == reconcile.ACCOUNT}
+    if gone:
+        def _drop(accounts: List[Dict[str, str]]) -> None:
+            accounts[:] = [acc for acc in accounts if acc["name"] not in gone]
+        store.update(_drop)
+        print(f"Unregistered {len(gone)} account(s) without a profile directory.")
+    launchers = [Path(o.path) for o in orphans if o.kind == reconcile.LAUNCHER]
+    launchers += [get_desktop_file_path(name) for name in gone]
+    for path in launchers:
+        try:
+            path.unlink()
+            print(f"Removed launcher {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove launcher {path}: {e}")
+            ok = False
+
+    # 2) Profile directories
+    dirs = [o for o in orphans if o.kind == reconcile.PROFILE_DIR]
+    if dirs and not delete_dirs:
+        candidates = [dict(profile_identity(o.path), name=o.name, profile_dir=o.path) for o in dirs]
+        records = discover.unregistered(candidates, store.load_table(), DEFAULT_ACCOUNT_NAME)
+        store.add_many(records)
+        for record in records:
+            print(f"Registered '{record['name']}' -> {record['profile_dir']}")
+    elif dirs:
+        trash = get_trash()
+        for o in dirs:
+            try:
+                print(f"Moved {o.path} to {trash.move(o.path)}")
+            except OSError as e:
+                print(f"Could not remove {o.path}: {e}")
+                ok = False
+        start_background_reclaim()
+    return ok
+
+def cmd_reconcile(args: argparse.Namespace) -> int:
+    """
+    'smam reconcile': report (and with --fix, repair) launchers, profile
+    directories and registry entries that are out of sync.
+    """
+    orphans = find_orphans()
+    sections = (
+        (reconcile.LAUNCHER, "Launchers without an account:"),
+        (reconcile.PROFILE_DIR, "Profile directories without an account:"),
+        (reconcile.ACCOUNT, "Accounts whose profile directory is missing:"),
+    )
+    for kind, title in sections:
+        items = [o for o in orphans if o.kind == kind]
+        if not items:
+            continue
+        print(title)
+        for o in items:
+            if kind == reconcile.PROFILE_DIR:
+                print(f"  {format_size(measure(o.path).total):>10}  {o.path}")
+            elif kind == reconcile.ACCOUNT:
+                print(f"  {o.name} -> {o.path}")
+            else:
+                print(f"  {o.path}")
+    if not orphans:
+        print("Registry, profile directories and launchers are in sync.")
+        return EXIT_OK
+    if not args.fix:
+        print("Run with --fix to repair (orphaned profile directories are registered as accounts; "
+              "add --delete-dirs to move them to the trash instead).")
+        return EXIT_FAILURE
+    return EXIT_OK if fix_orphans(orphans, delete_dirs=args.delete_dirs) else EXIT_FAILURE
+
+def _report_progress(done: int, total: int, name: str, error: Optional[str]) -> None:
+    status = "ok" if error is None else f"FAILED: {error}"
+    print(f"[{done}/{total}] {name}: {status}", file=sys.stderr)
+
+def cmd_import(args: argparse.Namespace) -> int:
+    """
+    'smam import FILE': register every account listed in a manifest ('-' for stdin)
+    as one batch.
+    """
+    fmt = args.format or ("ndjson" if args.file == "-" else bulk.detect_format(args.file))
+    try:
+        f = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8", newline="")
+        with f:
+            entries = bulk.read_manifest(f, fmt)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        report = bulk.import_manifest(entries, get_store(), default_profile_dir,
+                                      workers=args.workers, progress=_report_progress,
+                                      dry_run=args.dry_run)
+    except DuplicateAccountError as e:
+        # Another process registered a clashing account after validation.
+        print(f"Nothing imported: {e}", file=sys.stderr)
+        return EXIT_EXISTS
+    verb = "Would import" if args.dry_run else "Imported"
+    print(f"{verb} {len(report.imported)} account(s), {len(report.failed)} failed.")
+    return EXIT_OK if not report.failed else EXIT_FAILURE
+
+def cmd_export(args: argparse.Namespace) -> int:
+    """
+    'smam export [FILE]': stream every account record to FILE or stdout.
+    """
+    to_stdout = args.file in (None, "-")
+    try:
+        out = sys.stdout if to_stdout else open(args.file, "w", encoding="utf-8", newline="")
+    except OSError as e:
+        print(f"Cannot write export file: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    records = get_store().iter_accounts()
+    try:
+        if args.format == "csv":
+            bulk.export_csv(records, out)
+        else:
+            stream_accounts(records, args.format, out=out)
+    finally:
+        if not to_stdout:
+            out.close()
+    return EXIT_OK
+
+def _repoint_accounts(actions: List[plan.Action]) -> int:
+    """
+    Point the accounts of REPOINT actions at their new profile directories
+    with one store write, so accounts can swap directories. Returns the
+    number of actions that failed.
+    """
+    store = get_store()
+    records = []
+    failed = 0
+    for action in actions:
+        print(f"- {plan.describe(action)}")
+        record = store.get(action.name)
+        if record is None:
+            # Removed since the plan was computed; re-run apply to register it again.
+            print(f"  skipped: account '{action.name}' no longer exists", file=sys.stderr)
+            failed += 1
+            continue
+        for key in ("canonical_dir", "st_dev", "st_ino"):
+            record.pop(key, None)
+        record["profile_dir"] = action.profile_dir
+        records.append(record)
+    try:
+        store.put_many(records)
+    except (OSError, ValueError) as e:
+        print(f"  failed: {e}", file=sys.stderr)
+        return len(actions)
+    return failed
+
+def apply_plan(actions: List[plan.Action]) -> int:
+    """
+    Carry out the actions from plan.compute_plan() using the same primitives
+    as the menu, in the order given. Every action is attempted; returns the
+    number that failed.
+    """
+    failed = 0
+    repoints = [action for action in actions if action.kind == plan.REPOINT]
+    for action in actions:
+        if action.kind == plan.REPOINT:
+            if action is repoints[0]:
+                failed += _repoint_accounts(repoints)
+            continue
+        print(f"- {plan.describe(action)}")
+        try:
+            if action.kind == plan.CREATE_DIR:
+                Path(action.profile_dir).mkdir(parents=True, exist_ok=True)
+            elif action.kind == plan.UNREGISTER:
+                remove_account({"name": action.name, "profile_dir": action.profile_dir})
+            elif action.kind == plan.REGISTER:
+                register_account(action.name, action.profile_dir)
+            elif action.kind == plan.WRITE_LAUNCHER:
+                create_desktop_icon(action.name, action.profile_dir)
+            elif action.kind == plan.REMOVE_LAUNCHER:
+                get_desktop_file_path(action.name).unlink()
+        except (OSError, ValueError) as e:
+            print(f"  failed: {e}", file=sys.stderr)
+            failed += 1
+    return failed
+
+def _compute_plan(state_file: str):
+    desired, prune = plan.load_state(state_file, default_profile_dir)
+    return plan.compute_plan(desired, get_store().load_table(), applications_dir(), prune)
+
+def cmd_plan(args: argparse.Namespace) -> int:
+    """
+    'smam plan STATE': show what 'smam apply STATE' would change.
+    """
+    try:
+        actions = _compute_plan(args.state)
+    except plan.PlanError as e:
+        print(f"Cannot reach the state in {args.state}:", file=sys.stderr)
+        for conflict in e.conflicts:
+            print(f"- {conflict}", file=sys.stderr)
+        return EXIT_EXISTS
+    except (OSError, ValueError) as e:
+        print(f"Cannot read state file: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not actions:
+        print("No changes. The host matches the state file.")
+    for action in actions:
+        print(f"- {plan.describe(action)}")
+    return EXIT_OK
+
+def cmd_apply(args: argparse.Namespace) -> int:
+    """
+    'smam apply STATE': make the registry, profile directories and launchers
+    match the state file. Safe to rerun.
+    """
+    try:
+        actions = _compute_plan(args.state)
+    except plan.PlanError as e:
+        print(f"Cannot reach the state in {args.state}:", file=sys.stderr)
+        for conflict in e.conflicts:
+            print(f"- {conflict}", file=sys.stderr)
+        return EXIT_EXISTS
+    except (OSError, ValueError) as e:
+        print(f"Cannot read state file: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not actions:
+        print("No changes. The host matches the state file.")
+        return EXIT_OK
+    failed = apply_plan(actions)
+    print(f"Applied {len(actions) - failed} change(s), {failed} failed.")
+    return EXIT_OK if not failed else EXIT_FAILURE
+
+def non_negative_int(value: str) -> int:
+    """
+    argparse type for counts and offsets: a usage error instead of a traceback
+    for negative numbers.
+    """
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Argument parser for the non-interactive subcommands.
+    """
+    parser = argparse.ArgumentParser(
+        prog="smam",
+        description="Signal Multi Account Manager. Run without arguments for the interactive menu.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    p = commands.add_parser("list", help="list registered accounts")
+    p.add_argument("--limit", type=non_negative_int, default=None, help="print at most N accounts")
+    p.add_argument("--offset", type=non_negative_int, default=0, help="skip the first N matching accounts")
+    p.add_argument("--name", metavar="GLOB", help="only accounts whose name matches GLOB")
+    p.add_argument("--path", metavar="GLOB", help="only accounts whose profile_dir matches GLOB")
+    p.add_argument("--format", choices=OUTPUT_FORMATS, default="text")
+    p.set_defaults(func=cmd_list)
+
+    p = commands.add_parser("add", help="register a new account")
+    p.add_argument("name")
+    p.add_argument("--profile-dir", help="profile directory (default: ~/.config/Signal-NAME)")
+    p.add_argument("--desktop-icon", action="store_true", help="also create a desktop launcher")
+    p.add_argument("--template", metavar="DIR",
+                   help="start from a copy of this profile (settings, caches, dictionaries)")
+    p.set_defaults(func=cmd_add)
+
+    p = commands.add_parser("launch", help="launch Signal for one or more accounts")
+    p.add_argument("names", nargs="*", metavar="NAME")
+    p.add_argument("--all", action="store_true", help="launch every registered account")
+    p.add_argument("--parallel", type=non_negative_int, default=2,
+                   help="instances allowed to start at the same time (default: 2, 0: no limit)")
+    p.add_argument("--max-load", type=float, default=1.0,
+                   help="wait while the load average per CPU is above this (default: 1.0)")
+    p.add_argument("--timeout", type=float, default=60.0,
+                   help="seconds after which a starting instance counts as ready (default: 60)")
+    p.add_argument("--no-wait", action="store_true",
+                   help="return right after starting, without waiting for readiness")
+    p.add_argument("--prewarm", action="store_true",
+                   help="read Signal and the profile databases into the page cache while starting")
+    p.set_defaults(func=cmd_launch)
+
+    p = commands.add_parser("prewarm", help="read Signal and profile databases into the page cache")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to prewarm (default: all)")
+    p.add_argument("--workers", type=int, default=8, help="files submitted in parallel (default: 8)")
+    p.set_defaults(func=cmd_prewarm)
+
+    p = commands.add_parser("latency", help="show how long accounts take to become ready")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to show (default: all measured)")
+    p.add_argument("--reset", action="store_true", help="forget the samples instead")
+    p.add_argument("--format", choices=("text", "ndjson"), default="text")
+    p.set_defaults(func=cmd_latency)
+
+    p = commands.add_parser("status", help="show which accounts have Signal running")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to show (default: all)")
+    p.add_argument("--format", choices=("text", "ndjson"), default="text")
+    p.set_defaults(func=cmd_status)
+
+    p = commands.add_parser("supervise", help="launch accounts and restart them when they crash")
+    p.add_argument("names", nargs="*", metavar="NAME")
+    p.add_argument("--all", action="store_true", help="supervise every registered account")
+    p.add_argument("--max-restarts", type=non_negative_int, default=5,
+                   help="consecutive crashes after which an account is given up (default: 5)")
+    p.add_argument("--backoff", type=float, default=1.0, metavar="SECONDS",
+                   help="delay before the first restart, doubled for each further crash (default: 1)")
+    p.set_defaults(func=cmd_supervise)
+
+    p = commands.add_parser("delete", help="remove accounts from the manager")
+    p.add_argument("names", nargs="+", metavar="NAME")
+    p.add_argument("--remove-profile", action="store_true",
+                   help="also delete the profile directories from disk")
+    p.add_argument("--wait", action="store_true",
+                   help="delete profile files before returning instead of in the background")
+    p.set_defaults(func=cmd_delete)
+
+    p = commands.add_parser("discover", help="register Signal profiles that are not registered yet")
+    p.add_argument("--root", dest="roots", action="append", metavar="DIR",
+                   help="directory to search (repeatable; default: ~/.config and SMAM_DISCOVERY_ROOTS)")
+    p.add_argument("--dry-run", action="store_true", help="only show what would be added")
+    p.set_defaults(func=cmd_discover)
+
+    p = commands.add_parser("du", help="show disk usage of profile directories")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to measure (default: all)")
+    p.add_argument("--rescan", action="store_true", help="ignore cached results and walk everything")
+    p.add_argument("--workers", type=int, default=None, help="directories scanned in parallel")
+    p.add_argument("--format", choices=("text", "ndjson"), default="text")
+    p.set_defaults(func=cmd_du)
+
+    p = commands.add_parser("dedup", help="link identical attachments across profiles")
+    p.add_argument("--dry-run", action="store_true", help="only report what would be freed")
+    p.add_argument("--workers", type=int, default=None, help="files hashed in parallel")
+    p.add_argument("--min-size", type=int, default=dedup.MIN_SIZE, metavar="BYTES",
+                   help=f"ignore smaller files (default: {dedup.MIN_SIZE})")
+    p.set_defaults(func=cmd_dedup)
+
+    p = commands.add_parser("backup", help="incrementally back up profile directories")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to back up (default: all)")
+    p.add_argument("--dest", default=str(BACKUP_DIR), help=f"backup directory (default: {BACKUP_DIR})")
+    p.add_argument("--full", action="store_true", help="store every file, not only changed ones")
+    p.add_argument("--workers", type=int, default=None, help="compression processes (default: CPUs)")
+    p.set_defaults(func=cmd_backup)
+
+    p = commands.add_parser("restore", help="rebuild a profile from its backups and register it")
+    p.add_argument("name")
+    p.add_argument("--dest", default=str(BACKUP_DIR), help=f"backup directory (default: {BACKUP_DIR})")
+    p.add_argument("--manifest", help="restore this manifest instead of the newest one")
+    p.add_argument("--to", metavar="DIR", help="profile directory to restore into "
+                   "(default: the backed-up one)")
+    p.set_defaults(func=cmd_restore)
+
+    p = commands.add_parser("repo", help="deduplicating snapshots of all profiles")
+    p.add_argument("--repo", default=str(REPO_DIR), help=f"repository directory (default: {REPO_DIR})")
+    repo_commands = p.add_subparsers(dest="repo_command", metavar="ACTION")
+    repo_commands.required = True
+    r = repo_commands.add_parser("snapshot", help="store the current profiles as a snapshot")
+    r.add_argument("names", nargs="*", metavar="NAME", help="accounts to include (default: all)")
+    r.add_argument("--workers", type=int, default=None, help="files chunked in parallel")
+    r.set_defaults(func=cmd_repo_snapshot)
+    r = repo_commands.add_parser("list", help="show snapshots")
+    r.set_defaults(func=cmd_repo_list)
+    r = repo_commands.add_parser("restore", help="rebuild a profile from a snapshot and register it")
+    r.add_argument("name")
+    r.add_argument("--snapshot", help="snapshot id as shown by 'repo list' (default: newest)")
+    r.add_argument("--to", metavar="DIR", help="profile directory to restore into")
+    r.set_defaults(func=cmd_repo_restore)
+
+    p = commands.add_parser("purge", help="delete Electron caches (profiles in use are skipped)")
+    p.add_argument("names", nargs="*", metavar="NAME", help="accounts to purge (default: all)")
+    p.add_argument("--dry-run", action="store_true", help="only show how much would be freed")
+    p.add_argument("--workers", type=int, default=4, help="profiles purged in parallel (default: 4)")
+    p.set_defaults(func=cmd_purge)
+
+    p = commands.add_parser("policy", help="show or set the cache purge policy of an account")
+    p.add_argument("name")
+    p.add_argument("--max-age-days", type=float, metavar="DAYS",
+                   help="only purge cache files older than DAYS (0: all)")
+    p.add_argument("--keep", nargs="*", metavar="DIR", choices=purge.CACHE_DIRS,
+                   help="cache directories never to purge")
+    p.add_argument("--never", action="store_true", help="exempt this account from purging")
+    p.add_argument("--always", action="store_true", help="purge this account again")
+    p.add_argument("--reset", action="store_true", help="go back to the default policy")
+    p.set_defaults(func=cmd_policy)
 
-def main() -> None:
+    p = commands.add_parser("reconcile", aliases=["gc"],
+                            help="find launchers, profile directories and accounts that are out of sync")
+    p.add_argument("--fix", action="store_true",
+                   help="remove orphaned launchers, unregister accounts without a directory "
+                        "and register orphaned profile directories as accounts")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--adopt", action="store_true",
+                      help="with --fix, register orphaned profile directories (the default)")
+    mode.add_argument("--delete-dirs", action="store_true",
+                      help="with --fix, move orphaned profile directories to the trash instead")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = commands.add_parser("reclaim", help="delete trashed profile directories")
+    p.add_argument("--status", action="store_true", help="only show what is pending")
+    p.add_argument("--quiet", action="store_true", help="no progress output")
+    p.set_defaults(func=cmd_reclaim)
+
+    p = commands.add_parser("import", help="register accounts from an NDJSON, JSON or CSV manifest")
+    p.add_argument("file", help="manifest file, '-' for stdin")
+    p.add_argument("--format", choices=bulk.MANIFEST_FORMATS,
+                   help="manifest format (default: from the file extension, NDJSON for stdin)")
+    p.add_argument("--workers", type=int, default=8,
+                   help="profile directories and launchers created in parallel (default: 8)")
+    p.add_argument("--dry-run", action="store_true", help="only validate the manifest")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("export", help="write all account records")
+    p.add_argument("file", nargs="?", help="output file (default: stdout)")
+    p.add_argument("--format", choices=OUTPUT_FORMATS + ("csv",), default="ndjson")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("plan", help="show changes needed to match a desired-state file")
+    p.add_argument("state", help="JSON file describing every account")
+    p.set_defaults(func=cmd_plan)
+
+    p = commands.add_parser("apply", help="make this host match a desired-state file")
+    p.add_argument("state", help="JSON file describing every account")
+    p.set_defaults(func=cmd_apply)
+
+    return parser
+
+def run_command(argv: List[str]) -> int:
+    """
+    Parse argv, run the selected subcommand and return its exit status.
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        ensure_config_dir()
+        return args.func(args)
+    except CorruptStoreError as e:
+        print(f"Cannot read the account registry: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    except BrokenPipeError:
+        # The reader went away (e.g. '| head'); stop quietly.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return EXIT_FAILURE
+
+def interactive_menu() -> None:
     """
     Main interactive menu that drives the script:
     1) Ensure config and check Signal installation
     2) Optionally auto-detect default config
     3) Show menu to list, add, select, or delete accounts
     """
-    ensure_config_dir()
+    try:
+        ensure_config_dir()
+        get_store().backfill_identity()
+    except CorruptStoreError as e:
+        print(f"Cannot read the account registry: {e}")
+        return
 
     if not is_signal_installed():
         print("Signal Desktop is not found on this system (signal-desktop not on PATH).")
@@ -239,6 +1533,7 @@ def main() -> None:
         return
 
     auto_add_default_signal()
+    start_background_reclaim()  # finish deletions an earlier session left behind
 
     while True:
         print("\n=== Signal Multi Account Manager ===")
@@ -246,7 +1541,8 @@ def main() -> None:
         print("2) Add a new account")
         print("3) Select (launch) an account")
         print("4) Delete an account")
-        print("5) Exit")
+        print("5) Find unregistered profiles")
+        print("6) Exit")
         choice = input("Enter choice: ").strip()
 
         if choice == '1':
@@ -258,9 +1554,24 @@ def main() -> None:
         elif choice == '4':
             delete_account()
         elif choice == '5':
+            find_unregistered()
+        elif choice == '6':
             break
         else:
             print("Invalid choice. Please try again.")
-            
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the 'smam' command. Without arguments it runs the
+    interactive menu; with a subcommand it runs that non-interactively and
+    returns its exit status.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv:
+        return run_command(argv)
+    interactive_menu()
+    return EXIT_OK
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
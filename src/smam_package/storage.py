@@ -0,0 +1,942 @@
+"""
+Storage backends for the Signal Multi Account Manager account registry.
+
+The registry is an ordered list of account records (dicts with at least
+'name' and 'profile_dir'). smam.py only talks to it through the AccountStore
+interface, so the on-disk format can be swapped without touching the menu code.
+
+All backends are safe to use from several smam processes at once: the JSON
+stores serialize writers with an advisory fcntl lock and replace files
+atomically, the SQLite store relies on SQLite's own locking.
+"""
+
+import fcntl
+import fnmatch
+import itertools
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .models import Account, AccountTable, canonical_path, profile_identity
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses"])
+
+
+class DuplicateAccountError(ValueError):
+    """
+    Raised when an account with the same name or profile directory is already registered.
+    """
+
+
+class ConcurrentModificationError(RuntimeError):
+    """
+    Raised by save() when the store changed since the version the caller loaded.
+    """
+
+
+class CorruptStoreError(ValueError):
+    """
+    Raised when the registry file exists but cannot be parsed. Writers must not
+    overwrite it blindly, or every account would be lost.
+    """
+
+
+class AccountStore:
+    """
+    Base class for account registry backends.
+    Subclasses must implement load() and save(); the single-record operations
+    default to a read-modify-write through update() and should be overridden
+    with something cheaper where the backend allows it.
+    """
+
+    def ensure(self) -> None:
+        """
+        Create the backing storage if it does not exist yet.
+        """
+
+    def load(self) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+    def load_table(self) -> AccountTable:
+        """
+        Return the registry as an indexed AccountTable. Treat it as read-only;
+        change the registry through the store.
+        """
+        return AccountTable.from_records(self.load())
+
+    def iter_accounts(self, offset: int = 0, limit: Optional[int] = None,
+                      name_glob: Optional[str] = None,
+                      path_glob: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """
+        Lazily yield account records in registry order, optionally filtered by
+        shell-style globs on name and profile_dir, skipping the first offset
+        matches and stopping after limit of them.
+        """
+        return _paginate(_filtered(self.load(), name_glob, path_glob), offset, limit)
+
+    def load_versioned(self) -> Tuple[List[Dict[str, str]], Any]:
+        """
+        Return the accounts together with an opaque version token that can be
+        passed to save(expected_version=...) for an optimistic concurrency check.
+        """
+        return self.load(), None
+
+    def save(self, accounts: List[Dict[str, str]], expected_version: Any = None) -> None:
+        """
+        Replace the whole account list. If expected_version is given and the
+        store changed since that version was loaded, ConcurrentModificationError
+        is raised and nothing is written.
+        """
+        raise NotImplementedError
+
+    def update(self, mutate: Callable[[List[Dict[str, str]]], Any]) -> Any:
+        """
+        Read-modify-write the account list as one transaction: mutate() gets
+        the current accounts and changes them in place, then they are saved.
+        Returns whatever mutate() returned.
+        """
+        accounts, version = self.load_versioned()
+        result = mutate(accounts)
+        self.save(accounts, expected_version=version)
+        return result
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Return hit/miss counters of the in-process cache (zero for uncached backends).
+        """
+        return CacheInfo(0, 0)
+
+    def backfill_identity(self) -> int:
+        """
+        Record canonical_dir/st_dev/st_ino for accounts added before they were
+        stored. Resolves only those legacy entries, once; returns how many.
+        """
+        if not self.load_table().missing_identity():
+            return 0
+
+        def _fill(accounts: List[Dict[str, str]]) -> int:
+            missing = [acc for acc in accounts if "canonical_dir" not in acc]
+            for acc in missing:
+                acc.update(profile_identity(acc["profile_dir"]))
+            return len(missing)
+        return self.update(_fill)
+
+    def get(self, name: str) -> Optional[Dict[str, str]]:
+        """
+        Return the account with the given name, or None.
+        """
+        for acc in self.load():
+            if acc["name"] == name:
+                return acc
+        return None
+
+    def find_by_profile_dir(self, profile_dir: str) -> Optional[Dict[str, str]]:
+        """
+        Return the account whose profile directory is the same directory as
+        profile_dir (compared canonically), or None.
+        """
+        wanted = canonical_path(profile_dir)
+        for acc in self.load():
+            if canonical_path(acc["profile_dir"]) == wanted:
+                return acc
+        return None
+
+    def add(self, account: Dict[str, str]) -> None:
+        """
+        Append a single account. Raises DuplicateAccountError if the name or
+        the profile directory is already registered.
+        """
+        account = _identified(account)
+
+        def _add(accounts: List[Dict[str, str]]) -> None:
+            _check_duplicate(accounts, account)
+            accounts.append(account)
+        self.update(_add)
+
+    def add_many(self, accounts: List[Dict[str, str]]) -> None:
+        """
+        Append several accounts with a single write. All or nothing: if any
+        of them clashes with the registry or with another one in the batch,
+        DuplicateAccountError is raised and nothing is stored.
+        """
+        batch = [_identified(acc) for acc in accounts]
+
+        def _add(existing: List[Dict[str, str]]) -> None:
+            _check_batch(AccountTable.from_records(existing), batch)
+            existing.extend(batch)
+        self.update(_add)
+
+    def put(self, account: Dict[str, str]) -> None:
+        """
+        Replace the stored record of the account with the same name (or append
+        it if there is none). Identity fields are recomputed when the record
+        comes without them.
+        """
+        account = _identified(account)
+
+        def _replace(accounts: List[Dict[str, str]]) -> None:
+            _check_put(AccountTable.from_records(accounts), account)
+            _put(accounts, account)
+        self.update(_replace)
+
+    def put_many(self, accounts: List[Dict[str, str]]) -> None:
+        """
+        put() several records with a single write. The registry is checked as
+        a whole afterwards, so accounts may trade profile directories in one
+        call; if two accounts would end up on one directory,
+        DuplicateAccountError is raised and nothing is stored.
+        """
+        batch = [_identified(acc) for acc in accounts]
+
+        def _replace(existing: List[Dict[str, str]]) -> None:
+            for acc in batch:
+                _put(existing, acc)
+            _check_batch(AccountTable(), [_identified(acc) for acc in existing])
+        self.update(_replace)
+
+    def remove(self, name: str) -> bool:
+        """
+        Remove the first account with the given name.
+        Returns True if an account was removed.
+        """
+        def _remove(accounts: List[Dict[str, str]]) -> bool:
+            return _delete(accounts, name)
+        return self.update(_remove)
+
+
+def _filtered(records, name_glob: Optional[str], path_glob: Optional[str]) -> Iterator[Dict[str, str]]:
+    for record in records:
+        if name_glob is not None and not fnmatch.fnmatchcase(record["name"], name_glob):
+            continue
+        if path_glob is not None and not fnmatch.fnmatchcase(record["profile_dir"], path_glob):
+            continue
+        yield record
+
+
+def _paginate(records, offset: int, limit: Optional[int]) -> Iterator[Dict[str, str]]:
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must not be negative")
+    stop = None if limit is None else offset + limit
+    return itertools.islice(records, offset, stop)
+
+
+def iter_json_array(f, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array from a text file one at a
+    time, reading chunk_size characters at a time, so the first element is
+    available without parsing the whole file. An empty file yields nothing.
+    Anything json.loads() would reject (a missing or doubled comma, a
+    truncated array, data after it) raises CorruptStoreError when reached.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    # What comes next: "[" (start), an element or "]" (first), an element
+    # (item), "," or "]" (separator), nothing but whitespace (end).
+    expect = "start"
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                if expect not in ("start", "end"):
+                    raise CorruptStoreError("JSON array is truncated.")
+                return
+            chunk = f.read(chunk_size)
+            buf, pos, eof = chunk, 0, not chunk
+            continue
+        char = buf[pos]
+        if expect == "start":
+            if char != "[":
+                raise CorruptStoreError("Expected a JSON array.")
+            expect = "first"
+            pos += 1
+        elif expect == "end":
+            raise CorruptStoreError("Unexpected data after the JSON array.")
+        elif expect == "separator" or (expect == "first" and char == "]"):
+            if char == "]":
+                expect = "end"
+            elif char == "," and expect == "separator":
+                expect = "item"
+            else:
+                raise CorruptStoreError(f"Expected ',' or ']' in JSON array, found {char!r}.")
+            pos += 1
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # A number cut off by the end of the buffer ("-1" of "-1.5")
+                # continues in the next chunk; a delimiter after it settles that.
+                complete = eof or (end < len(buf) and buf[end] in " \t\r\n,]")
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise CorruptStoreError(f"Invalid JSON array element: {e}") from e
+                complete = False  # most likely the element continues in the next chunk
+            if not complete:
+                chunk = f.read(chunk_size)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                continue
+            yield item
+            pos = end
+            expect = "separator"
+
+
+def _identified(account: Dict[str, str]) -> Dict[str, str]:
+    # Resolve the profile directory once, at add time, and keep the result in the record.
+    if "canonical_dir" in account:
+        return account
+    record = dict(account)
+    record.update(profile_identity(account["profile_dir"]))
+    return record
+
+
+def _check_duplicate(accounts: List[Dict[str, str]], account: Dict[str, str]) -> None:
+    _check_duplicate_in_table(AccountTable.from_records(accounts), account)
+
+
+def _check_duplicate_in_table(table: AccountTable, account: Dict[str, str]) -> None:
+    if table.index_of(account["name"]) is not None:
+        raise DuplicateAccountError(f"An account named '{account['name']}' already exists.")
+    # The record already carries its identity (see _identified): no resolve.
+    i = table.index_of_identity(account)
+    if i is not None:
+        raise DuplicateAccountError(
+            f"Profile directory {account['profile_dir']} is already used by '{table[i].name}'.")
+
+
+def _check_put(table: AccountTable, account: Dict[str, str]) -> None:
+    other = table.find_by_profile_dir(account["profile_dir"])
+    if other is not None and other.name != account["name"]:
+        raise DuplicateAccountError(
+            f"Profile directory {account['profile_dir']} is already used by '{other.name}'.")
+
+
+def _check_batch(table: AccountTable, batch: List[Dict[str, str]]) -> None:
+    for acc in batch:
+        _check_duplicate_in_table(table, acc)
+        table.append(Account.from_dict(acc))
+
+
+def _put(accounts: List[Dict[str, str]], account: Dict[str, str]) -> None:
+    # Replace the account with the same name in place, or append it.
+    for i, acc in enumerate(accounts):
+        if acc["name"] == account["name"]:
+            accounts[i] = account
+            return
+    accounts.append(account)
+
+
+def _delete(accounts: List[Dict[str, str]], name: str) -> bool:
+    for i, acc in enumerate(accounts):
+        if acc["name"] == name:
+            del accounts[i]
+            return True
+    return False
+
+
+def _file_key(path: Path) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, data: str) -> None:
+    """
+    Replace path with data via a temporary file, fsync and os.replace, so
+    readers see either the old or the new content, never a truncated file.
+    The file keeps its permission bits if it already exists.
+    """
+    path = Path(path)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.replace(tmp, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+class JsonAccountStore(AccountStore):
+    """
+    The original storage format: a single JSON list in accounts.json.
+
+    Writers hold an exclusive flock on accounts.json.lock and replace the file
+    atomically; readers hold a shared lock. The version token is the file's
+    (st_ino, st_mtime_ns, st_size), which changes on every atomic replace.
+
+    The parsed registry is cached in-process as an AccountTable under the
+    same key, so repeated load() calls only re-parse when the file was
+    actually changed, and get()/find_by_profile_dir() are index lookups.
+    Our own writes invalidate the cache.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self._lock = threading.RLock()
+        self._lock_fd = None  # type: Optional[int]
+        self._lock_depth = 0
+        self._lock_exclusive = False
+        self._cache = None  # type: Optional[AccountTable]
+        self._cache_key = None  # type: Optional[Tuple]
+        self._hits = 0
+        self._misses = 0
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        # Reentrant: nested calls in the same thread reuse the flock taken by
+        # the outermost one (upgrading it to exclusive if needed).
+        with self._lock:
+            if self._lock_depth == 0:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._lock_fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_exclusive = exclusive
+            elif exclusive and not self._lock_exclusive:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                self._lock_exclusive = True
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    os.close(self._lock_fd)  # releases the flock
+                    self._lock_fd = None
+
+    def ensure(self) -> None:
+        with self._locked(exclusive=True):
+            if not self.path.exists():
+                atomic_write(self.path, "[]")
+
+    def _stat_key(self) -> Tuple:
+        return _file_key(self.path)
+
+    def _read(self) -> List[Dict[str, str]]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = f.read()
+        if not data.strip():
+            return []
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError as e:
+            raise CorruptStoreError(f"{self.path} is not valid JSON ({e}); refusing to touch it.") from e
+
+    def load_table(self) -> AccountTable:
+        with self._locked(exclusive=False):
+            key = self._stat_key()
+            if self._cache is not None and key == self._cache_key:
+                self._hits += 1
+            else:
+                self._misses += 1
+                self._cache = AccountTable.from_records(self._read())
+                self._cache_key = key
+            return self._cache
+
+    def load(self) -> List[Dict[str, str]]:
+        # Fresh dicts: callers are free to mutate what they get back.
+        return self.load_table().to_records()
+
+    def iter_accounts(self, offset: int = 0, limit: Optional[int] = None,
+                      name_glob: Optional[str] = None,
+                      path_glob: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        # Serve from the cache when it is current; otherwise stream-parse the
+        # file instead of loading it all, so the first record comes out at once.
+        # The lock is only held to pick the source: writers replace the file
+        # atomically, so a table or an open file stays a consistent snapshot,
+        # and a consumer that stops reading (smam list | less) blocks nobody.
+        table = f = None
+        with self._locked(exclusive=False):
+            if self._cache is not None and self._stat_key() == self._cache_key:
+                self._hits += 1
+                table = self._cache
+            else:
+                f = open(self.path, "r", encoding="utf-8")
+        if table is not None:
+            records = (acc.to_dict() for acc in table)
+            yield from _paginate(_filtered(records, name_glob, path_glob), offset, limit)
+            return
+        with f:
+            yield from _paginate(_filtered(iter_json_array(f), name_glob, path_glob),
+                                 offset, limit)
+
+    def get(self, name: str) -> Optional[Dict[str, str]]:
+        acc = self.load_table().get(name)
+        return None if acc is None else acc.to_dict()
+
+    def find_by_profile_dir(self, profile_dir: str) -> Optional[Dict[str, str]]:
+        acc = self.load_table().find_by_profile_dir(profile_dir)
+        return None if acc is None else acc.to_dict()
+
+    def load_versioned(self) -> Tuple[List[Dict[str, str]], Any]:
+        with self._locked(exclusive=False):
+            accounts = self.load()
+            return accounts, self._cache_key
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached account list.
+        """
+        with self._lock:
+            self._cache = None
+            self._cache_key = None
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self._hits, self._misses)
+
+    def save(self, accounts: List[Dict[str, str]], expected_version: Any = None) -> None:
+        with self._locked(exclusive=True):
+            if expected_version is not None and self._stat_key() != expected_version:
+                raise ConcurrentModificationError(
+                    f"{self.path} was modified by another process; reload and retry.")
+            self.invalidate()
+            self._write(accounts)
+
+    def _write(self, accounts: List[Dict[str, str]]) -> None:
+        atomic_write(self.path, json.dumps(accounts, indent=2))
+
+    def update(self, mutate: Callable[[List[Dict[str, str]]], Any]) -> Any:
+        with self._locked(exclusive=True):
+            return super().update(mutate)
+
+    def add(self, account: Dict[str, str]) -> None:
+        account = _identified(account)
+        with self._locked(exclusive=True):
+            table = self.load_table()
+            _check_duplicate_in_table(table, account)
+            self.save(table.to_records() + [account])
+
+
+class JournaledJsonAccountStore(JsonAccountStore):
+    """
+    accounts.json used as a snapshot plus an append-only operation journal.
+    add() and remove() append one small JSON line to the journal instead of
+    rewriting the whole list; load() replays the journal on top of the snapshot.
+    Once the journal grows past compact_threshold bytes, a background thread
+    folds it back into the snapshot.
+
+    Journal operations are idempotent ("put" replaces by name, "delete" ignores
+    missing names), so replaying a journal over a snapshot that already
+    contains its effects is harmless. A torn trailing line from a crash is ignored.
+    """
+
+    COMPACT_THRESHOLD = 256 * 1024
+
+    def __init__(self, path: Path, journal_path: Path,
+                 compact_threshold: int = COMPACT_THRESHOLD) -> None:
+        super().__init__(path)
+        self.journal_path = Path(journal_path)
+        self.compact_threshold = compact_threshold
+        self._compactor = None  # type: Optional[threading.Thread]
+
+    def ensure(self) -> None:
+        with self._locked(exclusive=True):
+            super().ensure()
+            self.journal_path.touch(exist_ok=True)
+
+    def _stat_key(self) -> Tuple:
+        try:
+            journal_key = _file_key(self.journal_path)
+        except FileNotFoundError:
+            journal_key = None
+        return (_file_key(self.path), journal_key)
+
+    def _read(self) -> List[Dict[str, str]]:
+        return self._replay(super()._read())
+
+    def iter_accounts(self, offset: int = 0, limit: Optional[int] = None,
+                      name_glob: Optional[str] = None,
+                      path_glob: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        # The journal may rewrite any record, so the snapshot cannot be streamed as is.
+        return AccountStore.iter_accounts(self, offset, limit, name_glob, path_glob)
+
+    def _replay(self, accounts: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        try:
+            f = open(self.journal_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return accounts
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write left behind by a crash
+                if entry["op"] == "put":
+                    _put(accounts, entry["account"])
+                elif entry["op"] == "delete":
+                    _delete(accounts, entry["name"])
+        return accounts
+
+    def _write(self, accounts: List[Dict[str, str]]) -> None:
+        # Snapshot first, then drop the journal: a crash in between only
+        # leaves a journal whose replay is a no-op.
+        super()._write(accounts)
+        os.truncate(str(self.journal_path), 0)
+
+    def add(self, account: Dict[str, str]) -> None:
+        account = _identified(account)
+        with self._locked(exclusive=True):
+            _check_duplicate_in_table(self.load_table(), account)
+            self._append([{"op": "put", "account": account}])
+
+    def add_many(self, accounts: List[Dict[str, str]]) -> None:
+        batch = [_identified(acc) for acc in accounts]
+        with self._locked(exclusive=True):
+            table = self.load_table()
+            # Check against a copy: the cached table must stay untouched.
+            _check_batch(AccountTable.from_records(table.to_records()), batch)
+            self._append([{"op": "put", "account": acc} for acc in batch])
+
+    def put(self, account: Dict[str, str]) -> None:
+        account = _identified(account)
+        with self._locked(exclusive=True):
+            _check_put(self.load_table(), account)
+            self._append([{"op": "put", "account": account}])
+
+    def remove(self, name: str) -> bool:
+        with self._locked(exclusive=True):
+            if self.load_table().index_of(name) is None:
+                return False
+            self._append([{"op": "delete", "name": name}])
+            return True
+
+    def _append(self, entries: List[Dict]) -> None:
+        # All entries go out in one write() so a batch lands together.
+        self.invalidate()
+        line = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        with open(self.journal_path, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                # Terminate a torn line left by a crash so it cannot swallow this entry.
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if size >= self.compact_threshold:
+            self._start_compaction()
+
+    def _start_compaction(self) -> None:
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        # Not a daemon thread: the interpreter waits for a running compaction on exit.
+        self._compactor = threading.Thread(target=self.compact, name="smam-compact")
+        self._compactor.start()
+
+    def compact(self) -> None:
+        """
+        Fold the journal into the snapshot and empty the journal.
+        """
+        with self._locked(exclusive=True):
+            self.save(self.load())
+
+
+class SqliteAccountStore(AccountStore):
+    """
+    SQLite-backed registry. Every record is a row with unique indexes on the
+    account name and on the canonical profile directory, so lookups, inserts
+    and deletes touch O(log n) pages instead of rewriting the whole list.
+    The full record is kept as JSON in the 'data' column so extra fields
+    survive a round trip.
+
+    The database runs in WAL mode; every write is a BEGIN IMMEDIATE
+    transaction that bumps PRAGMA user_version, which doubles as the
+    version token for optimistic checks.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            name          TEXT NOT NULL,
+            profile_dir   TEXT NOT NULL,
+            canonical_dir TEXT NOT NULL,
+            data          TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS accounts_name ON accounts(name);
+        CREATE UNIQUE INDEX IF NOT EXISTS accounts_canonical_dir ON accounts(canonical_dir);
+    """
+
+    BUSY_TIMEOUT = 30.0
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._conn = None  # type: Optional[sqlite3.Connection]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Switching to WAL can fail with SQLITE_BUSY without waiting on the
+            # busy timeout, so processes starting together set up the database
+            # one at a time under an flock, retrying while it is busy.
+            lock_fd = os.open(str(self.path) + ".init.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                # isolation_level=None: we issue BEGIN/COMMIT ourselves.
+                conn = sqlite3.connect(str(self.path), timeout=self.BUSY_TIMEOUT,
+                                       isolation_level=None)
+                try:
+                    self._retry_busy(lambda: conn.execute("PRAGMA journal_mode=WAL"))
+                    self._retry_busy(lambda: conn.executescript(self.SCHEMA))
+                except BaseException:
+                    conn.close()
+                    raise
+            finally:
+                os.close(lock_fd)
+            self._conn = conn
+        return self._conn
+
+    def _retry_busy(self, statement: Callable[[], Any]) -> Any:
+        deadline = time.monotonic() + self.BUSY_TIMEOUT
+        delay = 0.01
+        while True:
+            try:
+                return statement()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                if time.monotonic() >= deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    @contextmanager
+    def _transaction(self, expected_version: Any = None) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if expected_version is not None and version != expected_version:
+                raise ConcurrentModificationError(
+                    f"{self.path} was modified by another process; reload and retry.")
+            yield conn
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ensure(self) -> None:
+        self._connect()
+
+    def close(self, checkpoint: bool = False) -> None:
+        """
+        Close the connection; the next call reconnects. With checkpoint, the
+        database is first switched out of WAL mode so that it is a single
+        self-contained file afterwards.
+        """
+        if self._conn is None:
+            return
+        try:
+            if checkpoint:
+                self._conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _row(account: Dict[str, str]):
+        # The stored record carries its identity too, so load_table() never resolves.
+        account = _identified(account)
+        return (account["name"], account["profile_dir"], account["canonical_dir"],
+                json.dumps(account))
+
+    def load(self) -> List[Dict[str, str]]:
+        rows = self._connect().execute("SELECT data FROM accounts ORDER BY id")
+        return [json.loads(data) for (data,) in rows]
+
+    def load_versioned(self) -> Tuple[List[Dict[str, str]], Any]:
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            return self.load(), version
+        finally:
+            conn.execute("COMMIT")
+
+    def iter_accounts(self, offset: int = 0, limit: Optional[int] = None,
+                      name_glob: Optional[str] = None,
+                      path_glob: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        # Filtering and paging happen in SQL; rows are decoded as the cursor advances.
+        where = []
+        params = []  # type: List[Any]
+        if name_glob is not None:
+            where.append("name GLOB ?")
+            params.append(name_glob)
+        if path_glob is not None:
+            where.append("profile_dir GLOB ?")
+            params.append(path_glob)
+        sql = "SELECT data FROM accounts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        for (data,) in self._connect().execute(sql, params):
+            yield json.loads(data)
+
+    def _replace_all(self, conn: sqlite3.Connection, accounts: List[Dict[str, str]]) -> None:
+        try:
+            conn.execute("DELETE FROM accounts")
+            conn.executemany(
+                "INSERT INTO accounts (name, profile_dir, canonical_dir, data) VALUES (?, ?, ?, ?)",
+                [self._row(acc) for acc in accounts])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateAccountError(str(e)) from e
+
+    def save(self, accounts: List[Dict[str, str]], expected_version: Any = None) -> None:
+        with self._transaction(expected_version) as conn:
+            self._replace_all(conn, accounts)
+
+    def update(self, mutate: Callable[[List[Dict[str, str]]], Any]) -> Any:
+        with self._transaction() as conn:
+            accounts = self.load()
+            result = mutate(accounts)
+            self._replace_all(conn, accounts)
+        return result
+
+    def get(self, name: str) -> Optional[Dict[str, str]]:
+        row = self._connect().execute(
+            "SELECT data FROM accounts WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_profile_dir(self, profile_dir: str) -> Optional[Dict[str, str]]:
+        row = self._connect().execute(
+            "SELECT data FROM accounts WHERE canonical_dir = ?",
+            (canonical_path(profile_dir),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, account: Dict[str, str]) -> None:
+        account = _identified(account)
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO accounts (name, profile_dir, canonical_dir, data) VALUES (?, ?, ?, ?)",
+                    self._row(account))
+        except sqlite3.IntegrityError:
+            _check_duplicate(self.load(), account)
+            raise
+
+    def add_many(self, accounts: List[Dict[str, str]]) -> None:
+        batch = [_identified(acc) for acc in accounts]
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO accounts (name, profile_dir, canonical_dir, data) VALUES (?, ?, ?, ?)",
+                    [self._row(acc) for acc in batch])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateAccountError(str(e)) from e
+
+    def put(self, account: Dict[str, str]) -> None:
+        account = _identified(account)
+        try:
+            with self._transaction() as conn:
+                cur = conn.execute(
+                    "UPDATE accounts SET profile_dir = ?, canonical_dir = ?, data = ? WHERE name = ?",
+                    self._row(account)[1:] + (account["name"],))
+                if cur.rowcount == 0:
+                    conn.execute(
+                        "INSERT INTO accounts (name, profile_dir, canonical_dir, data) VALUES (?, ?, ?, ?)",
+                        self._row(account))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateAccountError(str(e)) from e
+
+    def remove(self, name: str) -> bool:
+        with self._transaction() as conn:
+            cur = conn.execute("DELETE FROM accounts WHERE name = ?", (name,))
+        return cur.rowcount > 0
+
+
+def migrate_json_to_sqlite(json_path: Path, db_path: Path,
+                           journal_path: Optional[Path] = None) -> Optional[int]:
+    """
+    One-shot import of an existing accounts.json into a new SQLite database
+    at db_path. If journal_path exists, the journal is replayed on top of
+    the snapshot so journaled changes are imported too.
+
+    The database is filled under a temporary name and renamed to db_path
+    only after the import committed, so a failed migration leaves no
+    database behind and runs again next time. The JSON file and the journal
+    are renamed to '<name>.migrated' afterwards. All of it happens under the
+    JSON store's lock; returns None if another process created db_path
+    meanwhile, otherwise the number of imported accounts.
+    """
+    json_path, db_path = Path(json_path), Path(db_path)
+    if journal_path is not None and Path(journal_path).exists():
+        source = JournaledJsonAccountStore(json_path, journal_path)  # type: JsonAccountStore
+    else:
+        journal_path = None
+        source = JsonAccountStore(json_path)
+    with source._locked(exclusive=True):
+        if db_path.exists():
+            return None
+        accounts = source.load()
+        tmp = db_path.with_name(f".{db_path.name}.migrating.{os.getpid()}")
+        store = SqliteAccountStore(tmp)
+        try:
+            imported = 0
+            with store._transaction() as conn:
+                for acc in accounts:
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO accounts (name, profile_dir, canonical_dir, data) "
+                        "VALUES (?, ?, ?, ?)", store._row(acc))
+                    imported += cur.rowcount
+            store.close(checkpoint=True)
+            os.replace(str(tmp), str(db_path))
+        finally:
+            store.close()
+            for suffix in ("", "-wal", "-shm", ".init.lock"):
+                try:
+                    os.unlink(str(tmp) + suffix)
+                except FileNotFoundError:
+                    pass
+        _fsync_dir(db_path.parent)
+        if json_path.exists():
+            json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        if journal_path is not None:
+            journal_path = Path(journal_path)
+            journal_path.rename(journal_path.with_name(journal_path.name + ".migrated"))
+    return imported
+
+
+def fold_journal(json_path: Path, journal_path: Path) -> bool:
+    """
+    Compact an existing journal into accounts.json and delete it, so the
+    registry can be read as plain JSON again. Returns True if there was a
+    journal.
+    """
+    journal_path = Path(journal_path)
+    if not journal_path.exists():
+        return False
+    store = JournaledJsonAccountStore(json_path, journal_path)
+    with store._locked(exclusive=True):
+        store.compact()
+        journal_path.unlink()
+    return True
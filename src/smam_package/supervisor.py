@@ -0,0 +1,350 @@
+"""
+Tracking and supervision of the Signal instances smam starts.
+
+InstanceRegistry keeps instances.json with, for each account, the PID smam
+started, that process's start time in clock ticks (so a PID reused by an
+unrelated process is not mistaken for Signal), the wall-clock start time and
+the number of restarts. An account's live instance is found by, in order:
+the tracked PID, the profile's SingletonLock, and a /proc scan for
+--user-data-dir.
+
+supervise() restarts instances that crash. A crash is a non-zero exit of a
+child, or, for an instance smam did not start itself, a SingletonLock left
+behind (Chromium removes it on a clean exit). Closing Signal normally is not
+a crash. Consecutive crashes are restarted after an exponentially growing
+delay, and given up on after max_restarts.
+
+spawn_detached() starts an instance outside smam's session and terminal,
+with its output in a log file, and reaps it from a daemon thread, so a
+long-running smam neither collects zombies nor takes Signal down with it
+on Ctrl-C.
+"""
+
+import fcntl
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from .instances import find_by_cmdline, lock_owner, pid_alive, process_start_ticks, running_pid
+from .storage import atomic_write
+
+# How a live instance was found
+TRACKED = "tracked"
+LOCK = "lock"
+PROCESS = "process"
+
+# Supervision events
+STARTED = "started"
+ADOPTED = "adopted"        # already running when supervision began
+STOPPED = "stopped"        # closed normally; not restarted
+CRASHED = "crashed"
+RESTARTING = "restarting"
+GAVE_UP = "gave up"
+
+# progress(name, event, detail) for supervision events
+SuperviseProgress = Callable[[str, str, str], None]
+
+LOG_MAX_BYTES = 1 << 20  # a log this large is rotated to <name>.log.1 before the next launch
+
+
+class AlreadyRunningError(Exception):
+    """
+    Raised when an account's profile is already in use by a live instance.
+    """
+
+    def __init__(self, name: str, pid: int) -> None:
+        super().__init__(f"Signal for account '{name}' is already running (PID {pid}).")
+        self.name = name
+        self.pid = pid
+
+
+class InstanceStatus:
+    """
+    Whether an account's Signal is running, and what smam knows about it.
+    pid and source are None when it is not running; started and restarts
+    come from the registry and are only known for instances smam started.
+    """
+
+    __slots__ = ("name", "profile_dir", "pid", "source", "started", "restarts")
+
+    def __init__(self, name: str, profile_dir: str, pid: Optional[int] = None,
+                 source: Optional[str] = None, started: Optional[float] = None,
+                 restarts: int = 0) -> None:
+        self.name = name
+        self.profile_dir = profile_dir
+        self.pid = pid
+        self.source = source
+        self.started = started
+        self.restarts = restarts
+
+    @property
+    def running(self) -> bool:
+        return self.pid is not None
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "profile_dir": self.profile_dir, "running": self.running,
+                "pid": self.pid, "source": self.source, "started": self.started,
+                "restarts": self.restarts}
+
+
+class InstanceRegistry:
+    """
+    instances.json: {account name: {"pid", "start_ticks", "started",
+    "profile_dir", "restarts"}}. Updates hold an flock on a sibling .lock
+    file and replace the file atomically.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict[str, Dict]]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            entries = self.load()
+            yield entries
+            atomic_write(self.path, json.dumps(entries, indent=2))
+        finally:
+            os.close(fd)
+
+    def record(self, name: str, pid: int, profile_dir: str, restarts: int = 0) -> None:
+        """
+        Remember that smam started pid for the account.
+        """
+        with self._locked() as entries:
+            entries[name] = {"pid": pid, "start_ticks": process_start_ticks(pid),
+                             "started": time.time(), "profile_dir": profile_dir,
+                             "restarts": restarts}
+
+    def forget(self, name: str) -> None:
+        with self._locked() as entries:
+            entries.pop(name, None)
+
+    def prune(self) -> None:
+        """
+        Drop entries whose process is gone.
+        """
+        with self._locked() as entries:
+            for name in [n for n, e in entries.items() if tracked_pid(e) is None]:
+                del entries[name]
+
+
+def tracked_pid(entry: Dict) -> Optional[int]:
+    """
+    The registry entry's PID if that process is still the one smam started.
+    """
+    pid = entry.get("pid")
+    if not isinstance(pid, int) or not pid_alive(pid):
+        return None
+    ticks = entry.get("start_ticks")
+    if ticks is not None and process_start_ticks(pid) != ticks:
+        return None
+    return pid
+
+
+def status(accounts: List[Dict], registry: InstanceRegistry) -> List[InstanceStatus]:
+    """
+    The status of each account, in the order given. /proc is scanned once,
+    and only for accounts found neither by tracked PID nor by lock.
+    """
+    entries = registry.load()
+    results = []
+    unresolved = []
+    for acc in accounts:
+        entry = entries.get(acc["name"])
+        if entry and entry.get("profile_dir") != acc["profile_dir"]:
+            entry = None
+        result = InstanceStatus(acc["name"], acc["profile_dir"])
+        if entry:
+            result.started = entry.get("started")
+            result.restarts = entry.get("restarts", 0)
+        pid = tracked_pid(entry) if entry else None
+        if pid is not None:
+            result.pid, result.source = pid, TRACKED
+        else:
+            result.started = None
+            pid = running_pid(acc["profile_dir"])
+            if pid is not None:
+                result.pid, result.source = pid, LOCK
+            else:
+                unresolved.append(result)
+        results.append(result)
+    if unresolved:
+        found = find_by_cmdline(r.profile_dir for r in unresolved)
+        for result in unresolved:
+            pid = found.get(result.profile_dir)
+            if pid is not None:
+                result.pid, result.source = pid, PROCESS
+    return results
+
+
+def find_instance(acc: Dict, registry: InstanceRegistry) -> Optional[int]:
+    """
+    PID of the live instance using the account's profile, or None.
+    """
+    return status([acc], registry)[0].pid
+
+
+def launch(acc: Dict, start: Callable[[Dict], subprocess.Popen], registry: InstanceRegistry,
+           restarts: int = 0) -> subprocess.Popen:
+    """
+    Start Signal for the account unless it already runs, and record the PID.
+    Raises AlreadyRunningError, or OSError from start().
+    """
+    pid = find_instance(acc, registry)
+    if pid is not None:
+        raise AlreadyRunningError(acc["name"], pid)
+    process = start(acc)
+    registry.record(acc["name"], process.pid, acc["profile_dir"], restarts)
+    return process
+
+
+def log_file_name(account_name: str) -> str:
+    """
+    File name of an account's launch log, e.g. "Work.log".
+    """
+    return re.sub(r"[^\w.-]", "_", account_name) + ".log"
+
+
+def _open_log(log_path: Path) -> int:
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if os.stat(log_path).st_size > LOG_MAX_BYTES:
+            os.replace(str(log_path), str(log_path) + ".1")
+    except FileNotFoundError:
+        pass
+    return os.open(str(log_path), os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o600)
+
+
+def reap_in_background(process: subprocess.Popen) -> threading.Thread:
+    """
+    Wait for the process from a daemon thread so it does not stay a zombie
+    after it exits. poll() and returncode keep working for other callers.
+    """
+    thread = threading.Thread(target=process.wait, name=f"reap-{process.pid}", daemon=True)
+    thread.start()
+    return thread
+
+
+def spawn_detached(args: Sequence[str], log_path: Path) -> subprocess.Popen:
+    """
+    Start args in a new session with stdin from /dev/null, stdout and stderr
+    appended to log_path and no other inherited file descriptors, and reap
+    it in the background.
+    """
+    fd = _open_log(Path(log_path))
+    try:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        os.write(fd, f"--- {stamp} {' '.join(args)}\n".encode())
+        process = subprocess.Popen(list(args), stdin=subprocess.DEVNULL, stdout=fd, stderr=fd,
+                                   close_fds=True, start_new_session=True)
+    finally:
+        os.close(fd)
+    reap_in_background(process)
+    return process
+
+
+class _Supervised:
+    __slots__ = ("acc", "process", "pid", "started", "crashes", "restart_at")
+
+    def __init__(self, acc: Dict) -> None:
+        self.acc = acc
+        self.process = None  # type: Optional[subprocess.Popen]
+        self.pid = None  # type: Optional[int]
+        self.started = 0.0
+        self.crashes = 0
+        self.restart_at = None  # type: Optional[float]
+
+
+def supervise(accounts: List[Dict], start: Callable[[Dict], subprocess.Popen],
+              registry: InstanceRegistry, max_restarts: int = 5, backoff: float = 1.0,
+              max_backoff: float = 60.0, stable_after: float = 300.0, poll: float = 1.0,
+              progress: Optional[SuperviseProgress] = None,
+              stop: Optional[threading.Event] = None) -> None:
+    """
+    Start (or adopt) an instance for each account and restart it when it
+    crashes: after backoff seconds, doubling with each further crash up to
+    max_backoff. An instance that ran for stable_after seconds resets the
+    count. Returns when no instance is left to watch, or when stop is set.
+    """
+    stop = stop or threading.Event()
+
+    def report(item: _Supervised, event: str, detail: str = "") -> None:
+        if progress:
+            progress(item.acc["name"], event, detail)
+
+    def begin(item: _Supervised) -> bool:
+        try:
+            item.process = launch(item.acc, start, registry, restarts=item.crashes)
+        except AlreadyRunningError as e:
+            item.process, item.pid = None, e.pid
+            report(item, ADOPTED, f"PID {e.pid}")
+        except OSError as e:
+            report(item, GAVE_UP, str(e))
+            return False
+        else:
+            item.pid = item.process.pid
+            report(item, STARTED, f"PID {item.pid}")
+        item.started = time.monotonic()
+        return True
+
+    watched = [item for item in (_Supervised(acc) for acc in accounts) if begin(item)]
+    while watched and not stop.is_set():
+        now = time.monotonic()
+        for item in list(watched):
+            # 1) Restart instances whose backoff has passed.
+            if item.restart_at is not None:
+                if now >= item.restart_at:
+                    item.restart_at = None
+                    if not begin(item):
+                        watched.remove(item)
+                continue
+
+            # 2) Check whether the instance is still alive and how it ended.
+            if item.process is not None:
+                code = item.process.poll()
+                if code is None:
+                    continue
+                crashed = code != 0
+                detail = f"exit status {code}" if code >= 0 else f"signal {-code}"
+            else:
+                if pid_alive(item.pid):
+                    continue
+                crashed = lock_owner(item.acc["profile_dir"]) is not None
+                detail = "stale SingletonLock" if crashed else ""
+
+            if not crashed:
+                registry.forget(item.acc["name"])
+                report(item, STOPPED, detail)
+                watched.remove(item)
+                continue
+            if now - item.started >= stable_after:
+                item.crashes = 0
+            item.crashes += 1
+            report(item, CRASHED, detail)
+            if item.crashes > max_restarts:
+                registry.forget(item.acc["name"])
+                report(item, GAVE_UP, f"{max_restarts} restarts")
+                watched.remove(item)
+                continue
+            delay = min(max_backoff, backoff * 2 ** (item.crashes - 1))
+            item.restart_at = now + delay
+            report(item, RESTARTING, f"in {delay:g}s")
+        stop.wait(poll)
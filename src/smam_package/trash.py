@@ -0,0 +1,161 @@
+"""
+Deferred deletion of profile directories.
+
+Removing a Signal profile with years of attachments can take minutes, so
+delete_account() does not remove it in place. The directory is renamed into a
+'.smam-trash' directory next to it, which is an O(1) operation on the same
+filesystem, and the contents are reclaimed afterwards, normally by a background
+'smam reclaim' process. Anything left in a trash directory (for example after
+a crash) is picked up by the next reclaim run.
+"""
+
+import errno
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Set
+
+from .fsutil import RemovalStats, parallel_rmtree
+from .storage import atomic_write
+
+TRASH_DIR_NAME = ".smam-trash"
+
+# remove(path) deletes one trashed directory tree, optionally reporting stats
+RemoveFunc = Callable[[Path], Optional[RemovalStats]]
+# progress(done, total, path, stats) is called after each trashed directory is gone
+ReclaimProgress = Callable[[int, int, Path, Optional[RemovalStats]], None]
+
+
+class Trash:
+    """
+    The set of trash directories used by this manager. Their locations are
+    remembered in roots_file so a reclaimer can find all of them; lock_path
+    makes sure only one reclaimer runs at a time.
+    """
+
+    def __init__(self, roots_file: Path, lock_path: Path) -> None:
+        self.roots_file = Path(roots_file)
+        self.lock_path = Path(lock_path)
+
+    def roots(self) -> List[Path]:
+        try:
+            with open(self.roots_file, "r", encoding="utf-8") as f:
+                return [Path(p) for p in json.load(f)]
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _remember_root(self, root: Path) -> None:
+        roots = self.roots()
+        if root not in roots:
+            self.roots_file.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.roots_file, json.dumps([str(p) for p in roots + [root]], indent=2))
+
+    def move(self, profile_dir: str) -> Path:
+        """
+        Atomically move profile_dir into the trash directory of its parent and
+        return the new location. Raises OSError if that is not possible
+        (for example EXDEV when the profile is a mount point of its own).
+        """
+        source = Path(os.path.abspath(os.path.expanduser(profile_dir)))
+        if source.is_symlink():
+            raise OSError(errno.ELOOP, "Refusing to trash a symbolic link", str(source))
+        if not source.is_dir():
+            raise FileNotFoundError(errno.ENOENT, "No such directory", str(source))
+        root = source.parent / TRASH_DIR_NAME
+        root.mkdir(mode=0o700, exist_ok=True)
+        self._remember_root(root)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = root / f"{source.name}.{stamp}.{os.getpid()}"
+        n = 0
+        while target.exists():
+            n += 1
+            target = root / f"{source.name}.{stamp}.{os.getpid()}.{n}"
+        os.rename(str(source), str(target))
+        return target
+
+    def pending(self) -> List[Path]:
+        """
+        Trashed directories that still have to be reclaimed.
+        """
+        entries = []
+        for root in self.roots():
+            try:
+                with os.scandir(str(root)) as it:
+                    entries.extend(Path(e.path) for e in it)
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def is_reclaiming(self) -> bool:
+        """
+        True if some process currently holds the reclaim lock.
+        """
+        fd = self._try_lock()
+        if fd is None:
+            return True
+        os.close(fd)
+        return False
+
+    def _try_lock(self) -> Optional[int]:
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def reclaim(self, remove: RemoveFunc = parallel_rmtree,
+                progress: Optional[ReclaimProgress] = None) -> Optional[int]:
+        """
+        Delete everything in the trash, including directories trashed while
+        this runs (their deleters see the lock and start no reclaimer of
+        their own). Returns the number of directories reclaimed, or None if
+        another process is already reclaiming. Directories that fail to
+        delete stay in the trash for the next run.
+        """
+        fd = self._try_lock()
+        if fd is None:
+            return None
+        failed = set()  # type: Set[Path]
+        done = 0
+        while True:
+            try:
+                done = self._drain(remove, progress, failed, done)
+            finally:
+                os.close(fd)
+            # Something trashed between the last check and the unlock found
+            # the lock still held; take over again unless another reclaimer did.
+            if not [e for e in self.pending() if e not in failed]:
+                return done
+            fd = self._try_lock()
+            if fd is None:
+                return done
+
+    def _drain(self, remove: RemoveFunc, progress: Optional[ReclaimProgress],
+               failed: Set[Path], done: int) -> int:
+        # Re-read the trash after each pass: deleters that see the reclaim
+        # lock held leave their directory to this run.
+        total = done
+        while True:
+            entries = [e for e in self.pending() if e not in failed]
+            if not entries:
+                return done
+            total += len(entries)
+            for entry in entries:
+                stats = None
+                try:
+                    if entry.is_dir() and not entry.is_symlink():
+                        stats = remove(entry)
+                    else:
+                        entry.unlink()
+                except OSError:
+                    failed.add(entry)
+                    total -= 1
+                    continue
+                done += 1
+                if progress:
+                    progress(done, total, entry, stats)
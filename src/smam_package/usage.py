@@ -0,0 +1,232 @@
+"""
+Disk usage of Signal profiles, broken down by top-level subdirectory
+(attachments.noindex, sql, Cache, GPUCache, ...).
+
+Profiles are walked with os.scandir on a thread pool. What was found in each
+directory is cached together with the directory's mtime and inode, and a
+directory whose mtime has not changed since the last scan is not listed
+again: only its subdirectories are stat'ed to find changes further down. A
+file growing in place does not change its directory's mtime, so directories
+with fewer than SMALL_DIR_FILES files (where databases and logs live) are
+always re-read; the large directories (attachments, caches) are append-only
+in practice. '--rescan' ignores the cache.
+
+Sizes are allocated blocks including directories, like du; a file with several hard links inside
+one profile is counted once.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from .fsutil import default_workers
+from .storage import atomic_write
+
+SMALL_DIR_FILES = 32
+TOP_LEVEL = "."  # key for files directly inside the profile directory
+
+# A cached directory is [mtime_ns, st_ino, bytes, files, subdir names,
+# [[st_dev, st_ino, bytes], ...] for files with several links].
+
+
+class ProfileUsage:
+    """
+    Size of one profile: total bytes and files, and bytes per top-level entry.
+    """
+
+    __slots__ = ("total", "files", "by_dir", "scanned_at")
+
+    def __init__(self, total: int = 0, files: int = 0,
+                 by_dir: Optional[Dict[str, int]] = None, scanned_at: float = 0.0) -> None:
+        self.total = total
+        self.files = files
+        self.by_dir = by_dir or {}
+        self.scanned_at = scanned_at
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ProfileUsage":
+        return cls(data["total"], data["files"], data.get("by_dir"), data.get("scanned_at", 0.0))
+
+    def to_dict(self) -> Dict:
+        return {"total": self.total, "files": self.files, "by_dir": self.by_dir,
+                "scanned_at": self.scanned_at}
+
+
+def format_size(n: float) -> str:
+    """
+    Human-readable size, e.g. "1.4 GiB".
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def _walk(root: str, cached: Dict[str, list], workers: int) -> Dict[str, list]:
+    # Scan every directory below root, reusing cached entries where allowed,
+    # and return the fresh entries for all directories found.
+    found = {}  # type: Dict[str, list]
+    lock = threading.Lock()
+    finished = threading.Event()
+    pending = [1]
+    errors = []  # type: list
+
+    def visit(path: str, st: os.stat_result) -> None:
+        try:
+            entry = cached.get(path)
+            if (entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_ino
+                    or entry[3] < SMALL_DIR_FILES):
+                entry = _read_dir(path, st)
+                children = entry.pop()
+            else:
+                children = []
+                for name in entry[4]:
+                    try:
+                        children.append((name, os.lstat(os.path.join(path, name))))
+                    except FileNotFoundError:
+                        pass
+            with lock:
+                found[path] = entry
+                pending[0] += len(children)
+            for name, child_st in children:
+                pool.submit(visit, os.path.join(path, name), child_st)
+        except OSError as e:
+            with lock:
+                errors.append(e)
+        finally:
+            with lock:
+                pending[0] -= 1
+                if not pending[0]:
+                    finished.set()
+
+    root_st = os.lstat(root)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pool.submit(visit, root, root_st)
+        finished.wait()
+    if errors and root not in found:
+        raise errors[0]
+    return found
+
+
+def _read_dir(path: str, st: os.stat_result) -> list:
+    # List one directory: returns a cache entry with the (name, stat) pairs of
+    # its subdirectories appended, for the caller to pop.
+    nbytes = st.st_blocks * 512
+    files = 0
+    subdirs = []  # (name, stat) pairs
+    linked = []  # [st_dev, st_ino, bytes] per file
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                est = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.name, est))
+                continue
+            files += 1
+            if est.st_nlink > 1:
+                linked.append([est.st_dev, est.st_ino, est.st_blocks * 512])
+            else:
+                nbytes += est.st_blocks * 512
+    return [st.st_mtime_ns, st.st_ino, nbytes, files,
+            [name for name, _ in subdirs], linked, subdirs]
+
+
+def _summarize(root: str, found: Dict[str, list]) -> ProfileUsage:
+    usage = ProfileUsage(scanned_at=time.time())
+    seen = set()  # (st_dev, st_ino) pairs
+    prefix = len(root) + 1
+    for path, entry in found.items():
+        top = path[prefix:].split(os.sep, 1)[0] if len(path) > len(root) else TOP_LEVEL
+        nbytes = entry[2]
+        for dev, ino, size in entry[5]:
+            if (dev, ino) not in seen:
+                seen.add((dev, ino))
+                nbytes += size
+        usage.total += nbytes
+        usage.files += entry[3]
+        usage.by_dir[top] = usage.by_dir.get(top, 0) + nbytes
+    return usage
+
+
+def measure(path: str, workers: Optional[int] = None) -> ProfileUsage:
+    """
+    Usage of any directory tree, without the cache.
+    """
+    return _summarize(path, _walk(path, {}, workers or default_workers()))
+
+
+class UsageCache:
+    """
+    Per-directory scan cache (cache_file) and the last totals of every
+    profile (totals_file, small enough to read on every 'list').
+    """
+
+    def __init__(self, cache_file, totals_file) -> None:
+        self.cache_file = cache_file
+        self.totals_file = totals_file
+        self._dirs = None  # type: Optional[Dict[str, Dict[str, list]]]
+        self._totals = None  # type: Optional[Dict[str, Dict]]
+
+    @staticmethod
+    def _read(path) -> Dict:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def totals(self) -> Dict[str, ProfileUsage]:
+        """
+        Last known usage per profile directory, without scanning anything.
+        """
+        if self._totals is None:
+            self._totals = self._read(self.totals_file)
+        return {path: ProfileUsage.from_dict(data) for path, data in self._totals.items()}
+
+    def get(self, profile_dir: str) -> Optional[ProfileUsage]:
+        if self._totals is None:
+            self._totals = self._read(self.totals_file)
+        data = self._totals.get(profile_dir)
+        return ProfileUsage.from_dict(data) if data else None
+
+    def scan(self, profile_dir: str, workers: Optional[int] = None,
+             rescan: bool = False) -> ProfileUsage:
+        """
+        Measure a profile directory (an absolute, canonical path), updating
+        the cache in memory. Call save() afterwards.
+        """
+        if self._dirs is None:
+            self._dirs = self._read(self.cache_file)
+        if self._totals is None:
+            self._totals = self._read(self.totals_file)
+        cached = {} if rescan else self._dirs.get(profile_dir, {})
+        found = _walk(profile_dir, cached, workers or default_workers())
+        usage = _summarize(profile_dir, found)
+        self._dirs[profile_dir] = found
+        self._totals[profile_dir] = usage.to_dict()
+        return usage
+
+    def forget(self, keep: Set[str]) -> None:
+        """
+        Drop cached data of profiles not in keep (e.g. deleted accounts).
+        """
+        if self._dirs is None:
+            self._dirs = self._read(self.cache_file)
+        if self._totals is None:
+            self._totals = self._read(self.totals_file)
+        for data in (self._dirs, self._totals):
+            for path in [p for p in data if p not in keep]:
+                del data[path]
+
+    def save(self) -> None:
+        if self._dirs is not None:
+            atomic_write(self.cache_file, json.dumps(self._dirs, separators=(",", ":")))
+        if self._totals is not None:
+            atomic_write(self.totals_file, json.dumps(self._totals, indent=2))
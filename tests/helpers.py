@@ -0,0 +1,57 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import smam
+
+
+class SmamHomeTestCase(unittest.TestCase):
+    """
+    Runs smam against a throwaway home directory: HOME and every path
+    constant of smam.py under the real home point into a temporary
+    directory, and the cached store is reset. Subclasses pick the storage
+    backend with 'backend' ("" lets smam choose, as without SMAM_STORE).
+    """
+
+    backend = ""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.home = Path(self.tmp.name)
+        self.config = self.home / ".config"
+        real_home = Path.home()
+        patches = [mock.patch.dict(os.environ, {"HOME": str(self.home)}),
+                   mock.patch.object(smam, "_store", None),
+                   mock.patch.object(smam, "STORE_BACKEND", self.backend)]
+        for name, value in vars(smam).items():
+            if isinstance(value, Path) and real_home in value.parents:
+                patches.append(mock.patch.object(smam, name, self.home / value.relative_to(real_home)))
+        patches.append(mock.patch.object(smam, "DISCOVERY_ROOTS", [self.config]))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.tmp.cleanup)
+        smam.ensure_config_dir()
+
+    def quietly(self, func, *args, **kwargs):
+        """
+        Call func with its stdout and stderr discarded.
+        """
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return func(*args, **kwargs)
+
+    def run_cli(self, *argv):
+        """
+        Run 'smam ARGV...' and return (exit status, stdout, stderr).
+        """
+        out, err = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                status = smam.main(list(argv))
+            except SystemExit as e:
+                status = e.code
+        return status, out.getvalue(), err.getvalue()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from smam_package import backup
+
+
+def snapshot(root: Path):
+    """
+    Everything a restore must reproduce: per path its kind, content or link
+    target, permission bits and (for files) mtime.
+    """
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, str(root))
+            st = os.lstat(path)
+            if os.path.islink(path):
+                tree[rel] = ("link", os.readlink(path))
+            elif os.path.isdir(path):
+                tree[rel] = ("dir",)
+            else:
+                with open(path, "rb") as f:
+                    tree[rel] = ("file", f.read(), st.st_mode & 0o7777, st.st_mtime_ns)
+    return tree
+
+
+class BackupRestoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.profile = self.dir / "Signal-Work"
+        (self.profile / "sql").mkdir(parents=True)
+        (self.profile / "sql" / "db.sqlite").write_bytes(os.urandom(200000))
+        (self.profile / "config.json").write_text('{"key": "k"}')
+        os.chmod(str(self.profile / "config.json"), 0o600)
+        (self.profile / "attachments.noindex" / "ab").mkdir(parents=True)
+        (self.profile / "attachments.noindex" / "ab" / "old").write_bytes(b"a" * 5000)
+        (self.profile / "empty").mkdir()
+        (self.profile / "Cache").mkdir()
+        (self.profile / "Cache" / "data_0").write_bytes(b"cache")
+        (self.profile / "link").symlink_to("config.json")
+        self.record = {"name": "Work", "profile_dir": str(self.profile), "color": "blue"}
+        self.dest = self.dir / "backups"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_backup_then_restore(self):
+        first = backup.backup_profile(self.record, self.dest, workers=2)
+        self.assertEqual(first.changed, first.files)
+
+        # Change, add and delete files between the two runs.
+        (self.profile / "sql" / "db.sqlite").write_bytes(os.urandom(300000))
+        os.utime(str(self.profile / "sql" / "db.sqlite"), ns=(10**18, 10**18))
+        (self.profile / "attachments.noindex" / "ab" / "new").write_bytes(b"n" * 7000)
+        (self.profile / "config.json").unlink()
+        (self.profile / "config.json").write_text('{"key": "k2"}')
+        os.utime(str(self.profile / "config.json"), ns=(2 * 10**18, 2 * 10**18))
+        (self.profile / "attachments.noindex" / "ab" / "old").unlink()
+
+        second = backup.backup_profile(self.record, self.dest, workers=2)
+        self.assertEqual(second.changed, 3)
+        self.assertEqual(backup.latest_manifest(backup.account_backup_dir(self.dest, "Work")),
+                         second.manifest)
+
+        target = self.dir / "restored"
+        account = backup.restore_profile(second.manifest, str(target))
+        self.assertEqual(account, {"name": "Work", "profile_dir": str(self.profile), "color": "blue"})
+        expected = snapshot(self.profile)
+        del expected["Cache"], expected[os.path.join("Cache", "data_0")]
+        self.assertEqual(snapshot(target), expected)
+
+    def test_unchanged_profile_stores_nothing_new(self):
+        backup.backup_profile(self.record, self.dest, workers=2)
+        again = backup.backup_profile(self.record, self.dest, workers=2)
+        self.assertEqual(again.changed, 0)
+        full = backup.backup_profile(self.record, self.dest, workers=2, full=True)
+        self.assertEqual(full.changed, full.files)
+
+    def test_restore_refuses_a_non_empty_target(self):
+        result = backup.backup_profile(self.record, self.dest, workers=2)
+        target = self.dir / "restored"
+        target.mkdir()
+        (target / "precious").write_text("keep")
+        with self.assertRaises(ValueError):
+            backup.restore_profile(result.manifest, str(target))
+        self.assertEqual(os.listdir(str(target)), ["precious"])
+
+    def test_missing_archive_data_is_reported(self):
+        backup.backup_profile(self.record, self.dest, workers=2)
+        (self.profile / "config.json").write_text('{"key": "changed"}')
+        os.utime(str(self.profile / "config.json"), ns=(10**18, 10**18))
+        second = backup.backup_profile(self.record, self.dest, workers=2)
+        # Replace the newest archive with an empty one.
+        second.archive.write_bytes(b"\0" * 1024)
+        with self.assertRaises(ValueError):
+            backup.restore_profile(second.manifest, str(self.dir / "restored"))
+
+
+if __name__ == "__main__":
+    unittest.main()
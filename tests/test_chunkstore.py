@@ -0,0 +1,137 @@
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import chunkstore
+from smam_package.chunkstore import MAX_CHUNK, MIN_CHUNK, ChunkRepository, find_cut, iter_chunks
+
+from .test_backup import snapshot as tree_snapshot
+
+
+def random_bytes(size: int, seed: int) -> bytes:
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
+
+
+class FindCutTest(unittest.TestCase):
+
+    def test_short_tail_is_one_chunk(self):
+        data = random_bytes(MIN_CHUNK, 1)
+        self.assertEqual(find_cut(data, 0, len(data)), MIN_CHUNK)
+        self.assertEqual(find_cut(data, 100, len(data)), MIN_CHUNK - 100)
+
+    def test_cut_stays_within_bounds(self):
+        data = random_bytes(4 * MAX_CHUNK, 2)
+        pos = 0
+        while pos < len(data):
+            n = find_cut(data, pos, len(data))
+            self.assertLessEqual(n, MAX_CHUNK)
+            if len(data) - pos > MIN_CHUNK:
+                self.assertGreater(n, MIN_CHUNK)
+            pos += n
+        self.assertEqual(pos, len(data))
+
+    def test_uniform_data_is_cut_at_max_chunk(self):
+        # A run of one byte value never produces a boundary hash.
+        data = bytes(2 * MAX_CHUNK)
+        self.assertEqual(find_cut(data, 0, len(data)), MAX_CHUNK)
+
+    def test_boundaries_follow_content_not_offsets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            original = random_bytes(2 * 1024 * 1024, 3)
+            a, b = os.path.join(tmp, "a"), os.path.join(tmp, "b")
+            with open(a, "wb") as f:
+                f.write(original)
+            with open(b, "wb") as f:
+                f.write(b"inserted" + original)
+            chunks_a, chunks_b = list(iter_chunks(a)), list(iter_chunks(b))
+        self.assertEqual(b"".join(chunks_a), original)
+        self.assertEqual(b"".join(chunks_b), b"inserted" + original)
+        # After the insert the chunkers resynchronize: all but the first few
+        # chunks are shared.
+        shared = set(chunks_a) & set(chunks_b)
+        self.assertGreaterEqual(len(shared), len(chunks_a) - 2)
+
+
+class ChunkRepositoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.repo = ChunkRepository(self.dir / "repo")
+        self.records = []
+        for n, name in enumerate(("Work", "Personal")):
+            profile = self.dir / f"Signal-{name}"
+            (profile / "sql").mkdir(parents=True)
+            (profile / "sql" / "db.sqlite").write_bytes(random_bytes(600 * 1024, 10 + n))
+            (profile / "attachments.noindex" / "ab").mkdir(parents=True)
+            # The same attachment in both profiles
+            (profile / "attachments.noindex" / "ab" / "photo").write_bytes(
+                random_bytes(500 * 1024, 99))
+            (profile / "config.json").write_text('{"key": "%s"}' % name)
+            (profile / "link").symlink_to("config.json")
+            (profile / "Cache").mkdir()
+            (profile / "Cache" / "data_0").write_bytes(b"cache")
+            self.records.append({"name": name, "profile_dir": str(profile)})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_snapshot_and_restore(self):
+        result = self.repo.snapshot(self.records, workers=2)
+        self.assertEqual(result.files, 6)
+        for record in self.records:
+            target = self.dir / "restored" / record["name"]
+            account = self.repo.restore(result.path, record["name"], str(target))
+            self.assertEqual(account, record)
+            expected = tree_snapshot(Path(record["profile_dir"]))
+            del expected["Cache"], expected[os.path.join("Cache", "data_0")]
+            self.assertEqual(tree_snapshot(target), expected)
+
+    def test_attachments_are_whole_chunks_stored_once(self):
+        self.repo.snapshot(self.records, workers=2)
+        profiles = self.repo.load_snapshot(self.repo.snapshots()[-1])["profiles"]
+        rel = os.path.join("attachments.noindex", "ab", "photo")
+        ids = [profiles[name]["files"][rel][3] for name in ("Work", "Personal")]
+        self.assertEqual(len(ids[0]), 1)
+        self.assertEqual(ids[0], ids[1])
+        self.assertGreater(len(profiles["Work"]["files"][os.path.join("sql", "db.sqlite")][3]), 1)
+
+    def test_unchanged_files_are_not_read_again(self):
+        self.repo.snapshot(self.records, workers=2)
+        count, size = self.repo.stats()
+        again = self.repo.snapshot(self.records, workers=2)
+        self.assertEqual((again.read, again.new_chunks), (0, 0))
+        self.assertEqual(self.repo.stats(), (count, size))
+        self.assertEqual(len(self.repo.snapshots()), 2)
+
+    def test_damaged_chunk_is_reported(self):
+        result = self.repo.snapshot(self.records[:1], workers=1)
+        ids = self.repo.load_snapshot(result.path)["profiles"]["Work"]["files"]["config.json"][3]
+        path = chunkstore._chunk_path(str(self.repo.root), ids[0])
+        with open(path, "wb") as f:
+            f.write(chunkstore.zlib.compress(b"something else"))
+        with self.assertRaises(ValueError):
+            self.repo.restore(result.path, "Work", str(self.dir / "restored"))
+
+    def test_failed_chunk_write_leaves_no_temporary_file(self):
+        (self.repo.root / "chunks").mkdir(parents=True)
+        path = os.path.join(self.records[0]["profile_dir"], "sql", "db.sqlite")
+        with mock.patch.object(chunkstore.os, "replace", side_effect=OSError("disk full")):
+            for whole in (False, True):
+                with self.assertRaises(OSError):
+                    chunkstore._ingest_file(str(self.repo.root), path, whole)
+        leftovers = [name for _, _, names in os.walk(str(self.repo.root)) for name in names]
+        self.assertEqual(leftovers, [])
+
+    def test_stats_ignore_temporary_files(self):
+        self.repo.snapshot(self.records[:1], workers=1)
+        before = self.repo.stats()
+        (self.repo.root / "chunks" / ".tmp-interrupted").write_bytes(b"partial")
+        self.assertEqual(self.repo.stats(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
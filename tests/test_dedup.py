@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from smam_package import dedup
+
+
+def candidate(path: str):
+    st = os.lstat(path)
+    return (path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_nlink)
+
+
+class DedupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.cache = dedup.HashCache(self.dir / "hash_cache.db")
+        self.shared = os.urandom(3 * dedup.MIN_SIZE)
+        self.profiles = []
+        for name in ("Signal-A", "Signal-B", "Signal-C"):
+            attachments = self.dir / name / "attachments.noindex" / "ab"
+            attachments.mkdir(parents=True)
+            (attachments / "shared").write_bytes(self.shared)
+            (attachments / "own").write_bytes(os.urandom(2 * dedup.MIN_SIZE))
+            self.profiles.append(str(self.dir / name))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def shared_files(self):
+        return [os.path.join(p, "attachments.noindex", "ab", "shared") for p in self.profiles]
+
+    def test_duplicates_are_linked_with_content_intact(self):
+        report = dedup.dedup(self.profiles, self.cache, workers=2)
+        self.assertEqual(report.duplicates, 2)
+        self.assertEqual(report.failed, [])
+        for path in self.shared_files():
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.shared)
+        for p in self.profiles:
+            self.assertEqual(os.stat(os.path.join(p, "attachments.noindex", "ab", "own")).st_nlink, 1)
+        leftovers = [n for p in self.profiles
+                     for n in os.listdir(os.path.join(p, "attachments.noindex", "ab"))
+                     if ".smam-dedup." in n]
+        self.assertEqual(leftovers, [])
+
+    def test_dry_run_changes_nothing(self):
+        before = [os.stat(p).st_ino for p in self.shared_files()]
+        report = dedup.dedup(self.profiles, self.cache, dry_run=True, workers=2)
+        self.assertEqual(report.duplicates, 2)
+        self.assertEqual([os.stat(p).st_ino for p in self.shared_files()], before)
+
+    def test_changed_duplicate_is_left_alone(self):
+        keep_path, dup_path = self.shared_files()[:2]
+        keep, dup = candidate(keep_path), candidate(dup_path)
+        with open(dup_path, "r+b") as f:
+            f.write(b"edited")
+        os.utime(dup_path, ns=(1, 1))
+        with self.assertRaises(OSError):
+            dedup._replace(keep, dup)
+        with open(dup_path, "rb") as f:
+            self.assertTrue(f.read().startswith(b"edited"))
+
+    def test_changed_kept_file_is_not_linked_to(self):
+        keep_path, dup_path = self.shared_files()[:2]
+        keep, dup = candidate(keep_path), candidate(dup_path)
+        with open(keep_path, "r+b") as f:
+            f.write(b"edited")
+        os.utime(keep_path, ns=(1, 1))
+        with self.assertRaises(OSError):
+            dedup._replace(keep, dup)
+        with open(dup_path, "rb") as f:
+            self.assertEqual(f.read(), self.shared)
+        self.assertNotEqual(os.stat(dup_path).st_ino, os.stat(keep_path).st_ino)
+
+    def test_leftover_temporary_links_are_ignored_and_removed(self):
+        directory = os.path.join(self.profiles[1], "attachments.noindex", "ab")
+        dead = self.dead_pid()
+        stale = os.path.join(directory, f".shared{dedup.TEMP_MARKER}{dead}.0a0b0c0d")
+        live = os.path.join(directory, f".shared{dedup.TEMP_MARKER}{os.getpid()}.01020304")
+        # The fixed name earlier versions used, for a crashed run that had this PID
+        reused = os.path.join(directory, f".shared{dedup.TEMP_MARKER}{os.getpid()}")
+        for path in (stale, live, reused):
+            with open(path, "wb") as f:
+                f.write(self.shared)
+        candidates = [c[0] for c in dedup.find_candidates(self.profiles)]
+        self.assertFalse(any(dedup.TEMP_MARKER in path for path in candidates))
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(live))
+        report = dedup.dedup(self.profiles, self.cache, workers=2)
+        self.assertEqual((report.duplicates, report.failed), (2, []))
+
+    def dead_pid(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+
+if __name__ == "__main__":
+    unittest.main()
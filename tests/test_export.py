@@ -0,0 +1,29 @@
+import json
+import unittest
+
+from smam_package import smam
+
+from .helpers import SmamHomeTestCase
+
+
+class ExportTest(SmamHomeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.quietly(smam.register_account, "Work", str(self.config / "Signal-Work"))
+
+    def test_export_to_file(self):
+        path = self.home / "accounts.ndjson"
+        status, _, _ = self.run_cli("export", str(path))
+        self.assertEqual(status, smam.EXIT_OK)
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual([r["name"] for r in records], ["Work"])
+
+    def test_unwritable_file_is_a_failure_not_a_usage_error(self):
+        status, _, err = self.run_cli("export", str(self.home / "missing" / "accounts.ndjson"))
+        self.assertEqual(status, smam.EXIT_FAILURE)
+        self.assertIn("Cannot write export file", err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+import errno
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import fsutil, smam
+from smam_package.storage import DuplicateAccountError
+
+from .helpers import SmamHomeTestCase
+
+
+def unsupported(*args, **kwargs):
+    raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+
+def make_template(path: Path) -> None:
+    (path / "Local Storage" / "leveldb").mkdir(parents=True)
+    (path / "Local Storage" / "leveldb" / "000003.log").write_bytes(b"settings" * 1000)
+    (path / "Preferences").write_text('{"spellcheck": true}')
+    (path / "Dictionaries").mkdir()
+    (path / "Dictionaries" / "en-US-10-1.bdic").write_bytes(b"dictionary")
+    (path / "sql").mkdir()
+    (path / "sql" / "db.sqlite").write_bytes(b"messages")
+    (path / "config.json").write_text('{"key": "secret"}')
+    (path / "attachments.noindex" / "ab").mkdir(parents=True)
+    (path / "attachments.noindex" / "ab" / "file").write_bytes(b"attachment")
+    (path / "SingletonLock").symlink_to("host-1234")
+    (path / "Cache" / "logs").mkdir(parents=True)
+    (path / "link").symlink_to("Preferences")
+
+
+class CloneTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.template = self.dir / "template"
+        make_template(self.template)
+        self.clone = self.dir / "clone"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def listing(self, root: Path):
+        return sorted(str(p.relative_to(root)) for p in root.rglob("*"))
+
+    def test_excluded_entries_are_skipped_at_any_depth(self):
+        stats = fsutil.clone_tree(self.template, self.clone)
+        self.assertEqual(self.listing(self.clone), [
+            "Cache", "Dictionaries", "Dictionaries/en-US-10-1.bdic", "Local Storage",
+            "Local Storage/leveldb", "Local Storage/leveldb/000003.log", "Preferences", "link"])
+        self.assertEqual(stats.files, 3)
+        self.assertEqual((self.clone / "Local Storage" / "leveldb" / "000003.log").read_bytes(),
+                         b"settings" * 1000)
+        self.assertTrue((self.clone / "link").is_symlink())
+        self.assertEqual(os.readlink(str(self.clone / "link")), "Preferences")
+
+    def test_target_must_be_empty(self):
+        self.clone.mkdir()
+        (self.clone / "x").write_text("x")
+        with self.assertRaises(FileExistsError):
+            fsutil.clone_tree(self.template, self.clone)
+
+    def test_fallbacks_without_reflink(self):
+        with mock.patch.object(fsutil.fcntl, "ioctl", side_effect=unsupported):
+            stats = fsutil.clone_tree(self.template, self.clone, workers=1)
+        # Reflinks are given up after the first failure; the dictionary may be hard linked.
+        self.assertNotIn(fsutil.REFLINK, stats.methods)
+        self.assertEqual(stats.methods.get(fsutil.HARDLINK), 1)
+        self.assertEqual(os.stat(str(self.clone / "Dictionaries" / "en-US-10-1.bdic")).st_ino,
+                         os.stat(str(self.template / "Dictionaries" / "en-US-10-1.bdic")).st_ino)
+        self.assertNotEqual(os.stat(str(self.clone / "Preferences")).st_ino,
+                            os.stat(str(self.template / "Preferences")).st_ino)
+
+    def test_copy_when_copy_file_range_is_unsupported(self):
+        src, dst = str(self.template / "Preferences"), str(self.dir / "copy")
+        with mock.patch.object(fsutil.fcntl, "ioctl", side_effect=unsupported), \
+                mock.patch.object(fsutil.os, "copy_file_range", side_effect=unsupported, create=True):
+            self.assertEqual(fsutil.clone_file(src, dst), fsutil.COPY)
+        with open(dst) as f:
+            self.assertEqual(f.read(), '{"spellcheck": true}')
+        self.assertEqual(os.stat(dst).st_mtime_ns, os.stat(src).st_mtime_ns)
+
+    def test_copy_file_range_after_failed_reflink(self):
+        if not hasattr(os, "copy_file_range"):
+            self.skipTest("os.copy_file_range is not available")
+        src, dst = str(self.template / "sql" / "db.sqlite"), str(self.dir / "copy")
+        with mock.patch.object(fsutil.fcntl, "ioctl", side_effect=unsupported):
+            self.assertEqual(fsutil.clone_file(src, dst), fsutil.COPY_FILE_RANGE)
+        self.assertFalse(os.path.samefile(src, dst))
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), b"messages")
+
+    def test_io_errors_are_not_treated_as_unsupported(self):
+        src, dst = str(self.template / "Preferences"), str(self.dir / "copy")
+        with mock.patch.object(fsutil.fcntl, "ioctl", side_effect=OSError(errno.EIO, "I/O error")):
+            with self.assertRaises(OSError):
+                fsutil.clone_file(src, dst)
+
+
+def make_tree(root: Path, width: int = 3, depth: int = 3) -> int:
+    """
+    A tree of width subdirectories per level with two files in each
+    directory. Returns the number of files.
+    """
+    files = 0
+    level = [root]
+    root.mkdir()
+    for _ in range(depth):
+        below = []
+        for directory in level:
+            for n in range(2):
+                (directory / f"f{n}").write_bytes(b"x" * 100)
+                files += 1
+            for n in range(width):
+                sub = directory / f"d{n}"
+                sub.mkdir()
+                below.append(sub)
+        level = below
+    return files
+
+
+class ParallelRmtreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_removes_the_whole_tree(self):
+        root = self.dir / "profile"
+        files = make_tree(root)
+        stats = fsutil.parallel_rmtree(root, workers=4)
+        self.assertFalse(root.exists())
+        self.assertEqual(stats.files, files)
+        self.assertEqual(stats.dirs, 1 + 3 + 9 + 27)
+        self.assertEqual(stats.bytes, files * 100)
+        self.assertEqual(stats.errors, [])
+
+    def test_symlinks_are_removed_not_followed(self):
+        outside = self.dir / "outside"
+        make_tree(outside, width=1, depth=1)
+        root = self.dir / "profile"
+        make_tree(root, width=1, depth=2)
+        (root / "d0" / "dir-link").symlink_to(outside)
+        (root / "file-link").symlink_to(outside / "f0")
+        fsutil.parallel_rmtree(root)
+        self.assertFalse(root.exists())
+        self.assertEqual(sorted(os.listdir(str(outside))), ["d0", "f0", "f1"])
+
+    def test_refuses_symlinks_and_files(self):
+        target = self.dir / "target"
+        make_tree(target, width=1, depth=1)
+        (self.dir / "link").symlink_to(target)
+        with self.assertRaises(OSError):
+            fsutil.parallel_rmtree(self.dir / "link")
+        with self.assertRaises(NotADirectoryError):
+            fsutil.parallel_rmtree(target / "f0")
+        self.assertTrue((target / "f0").exists())
+
+    def test_errors_are_collected(self):
+        root = self.dir / "profile"
+        files = make_tree(root)
+        real_unlink = os.unlink
+
+        def unlink(path, *args, **kwargs):
+            if path == "f1":
+                raise PermissionError(errno.EACCES, "Permission denied")
+            return real_unlink(path, *args, **kwargs)
+
+        with mock.patch.object(fsutil.os, "unlink", side_effect=unlink):
+            with self.assertRaises(OSError):
+                fsutil.parallel_rmtree(root, workers=4)
+            stats = fsutil.parallel_rmtree(root, workers=4, ignore_errors=True)
+        # Every directory keeps its f1, so none of them could be removed.
+        self.assertEqual(stats.files, 0)
+        self.assertEqual(len([e for e in stats.errors if e[0].endswith("f1")]), files // 2)
+        self.assertEqual(sum(len(names) for _, _, names in os.walk(str(root))), files // 2)
+        fsutil.parallel_rmtree(root)
+        self.assertFalse(root.exists())
+
+
+class RegisterFromTemplateTest(SmamHomeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.template = self.home / "template"
+        make_template(self.template)
+        self.target = self.config / "Signal-New"
+
+    def register(self):
+        return self.quietly(smam.register_account, "New", str(self.target),
+                            template=str(self.template))
+
+    def test_clone_is_removed_when_the_account_cannot_be_added(self):
+        with mock.patch.object(smam.get_store(), "add",
+                               side_effect=DuplicateAccountError("added meanwhile")):
+            with self.assertRaises(DuplicateAccountError):
+                self.register()
+        self.assertFalse(os.path.lexists(str(self.target)))
+
+    def test_existing_empty_directory_is_kept(self):
+        self.target.mkdir()
+        with mock.patch.object(smam.get_store(), "add",
+                               side_effect=DuplicateAccountError("added meanwhile")):
+            with self.assertRaises(DuplicateAccountError):
+                self.register()
+        self.assertEqual(os.listdir(str(self.target)), [])
+
+    def test_failed_clone_leaves_nothing_behind(self):
+        with mock.patch.object(smam, "clone_tree", side_effect=OSError(errno.ENOSPC, "full")):
+            with self.assertRaises(OSError):
+                self.register()
+        self.assertFalse(os.path.lexists(str(self.target)))
+        self.assertIsNone(smam.get_store().get("New"))
+
+    def test_directory_of_someone_else_is_not_removed(self):
+        # Another process fills the directory between the emptiness check
+        # and the clone: its files must survive.
+        def clone(src, dst):
+            os.makedirs(dst)
+            Path(dst, "theirs").write_text("keep")
+            raise FileExistsError(errno.EEXIST, "Target directory is not empty", dst)
+
+        with mock.patch.object(smam, "clone_tree", side_effect=clone):
+            with self.assertRaises(FileExistsError):
+                self.register()
+        self.assertEqual((self.target / "theirs").read_text(), "keep")
+
+    def test_register_from_template(self):
+        record = self.register()
+        self.assertEqual(smam.get_store().get("New")["profile_dir"], record["profile_dir"])
+        self.assertTrue((self.target / "Preferences").is_file())
+        self.assertFalse((self.target / "sql").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
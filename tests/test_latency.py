@@ -0,0 +1,78 @@
+import math
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from smam_package import latency
+from smam_package.latency import BUCKET_BASE, BUCKET_COUNT, BUCKET_GROWTH, LatencyHistogram, LatencyStore
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_bucket_edges(self):
+        self.assertEqual(latency.bucket_of(0.0), 0)
+        self.assertEqual(latency.bucket_of(BUCKET_BASE), 0)
+        self.assertEqual(latency.bucket_of(BUCKET_BASE * BUCKET_GROWTH * 1.001), 1)
+        self.assertEqual(latency.bucket_of(BUCKET_BASE * BUCKET_GROWTH ** 10.5), 10)
+        self.assertEqual(latency.bucket_of(10 ** 9), BUCKET_COUNT - 1)
+
+    def test_quantiles_are_within_half_a_bucket(self):
+        rng = random.Random(7)
+        samples = [round(rng.lognormvariate(math.log(8), 0.6), 3) for _ in range(2000)]
+        hist = LatencyHistogram()
+        for seconds in samples:
+            hist.add(seconds)
+        ordered = sorted(samples)
+        tolerance = math.sqrt(BUCKET_GROWTH) - 1
+        for q in (0.01, 0.1, 0.5, 0.9, 0.95, 0.99, 1.0):
+            exact = ordered[max(1, math.ceil(q * len(ordered))) - 1]
+            self.assertLessEqual(abs(hist.quantile(q) / exact - 1), tolerance + 1e-9, msg=q)
+        self.assertAlmostEqual(hist.mean, sum(samples) / len(samples), places=6)
+
+    def test_estimates_stay_within_the_observed_range(self):
+        hist = LatencyHistogram()
+        self.assertIsNone(hist.quantile(0.5))
+        self.assertIsNone(hist.mean)
+        hist.add(4.0)
+        self.assertEqual([hist.quantile(q) for q in (0.01, 0.5, 1.0)], [4.0, 4.0, 4.0])
+        # Both samples share a bucket whose middle lies above 4.1.
+        hist.add(4.1)
+        self.assertEqual(hist.quantile(0.5), 4.1)
+        self.assertEqual((hist.min, hist.max, hist.last), (4.0, 4.1, 4.1))
+
+        fast = LatencyHistogram()
+        for seconds in (0.01, 0.02, 0.03):
+            fast.add(seconds)
+        self.assertEqual([fast.quantile(q) for q in (0.01, 0.5, 1.0)], [0.03, 0.03, 0.03])
+
+    def test_dict_round_trip(self):
+        hist = LatencyHistogram()
+        for seconds in (1.2345, 3.0, 30.0, 31.0):
+            hist.add(seconds)
+        copy = LatencyHistogram.from_dict(hist.to_dict())
+        self.assertEqual(copy.to_dict(), hist.to_dict())
+        self.assertEqual(copy.quantile(0.5), hist.quantile(0.5))
+        self.assertEqual(hist.min, 1.234)
+
+
+class LatencyStoreTest(unittest.TestCase):
+
+    def test_record_and_reset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LatencyStore(Path(tmp) / "latency.json")
+            self.assertEqual(store.load(), {})
+            store.record({"Work": 5.0, "Personal": 7.0})
+            store.record({"Work": 6.0})
+            store.record({})
+            histograms = store.load()
+            self.assertEqual((histograms["Work"].count, histograms["Personal"].count), (2, 1))
+            self.assertEqual((histograms["Work"].min, histograms["Work"].max), (5.0, 6.0))
+            store.reset(["Work", "Unknown"])
+            self.assertEqual(list(store.load()), ["Personal"])
+            store.reset()
+            self.assertEqual(store.load(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
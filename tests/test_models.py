@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from smam_package.models import AccountTable, profile_identity
+from smam_package.storage import JsonAccountStore
+
+
+class AccountTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rows_do_not_alias_the_table(self):
+        table = AccountTable.from_records([
+            {"name": "A", "profile_dir": "/p/a", "tags": ["work"], "meta": {"color": "red"}}])
+        row = table[0]
+        row.extra["tags"].append("changed")
+        row.extra["meta"]["color"] = "blue"
+        row.extra["new"] = 1
+        self.assertEqual(table[0].extra, {"tags": ["work"], "meta": {"color": "red"}})
+        record = table.get("A").to_dict()
+        record["tags"].append("changed")
+        self.assertEqual(table.to_records()[0]["tags"], ["work"])
+
+    def test_store_load_returns_fresh_records(self):
+        store = JsonAccountStore(self.dir / "accounts.json")
+        store.ensure()
+        store.add({"name": "A", "profile_dir": str(self.dir / "a"), "tags": ["work"]})
+        store.load()[0]["tags"].append("changed")
+        store.get("A")["tags"].append("changed")
+        for acc in store.iter_accounts():
+            acc["tags"].append("changed")
+        self.assertEqual(store.load()[0]["tags"], ["work"])
+
+    def test_lookup_by_path_and_inode(self):
+        real = self.dir / "real"
+        real.mkdir()
+        alias = self.dir / "alias"
+        alias.symlink_to(real)
+        record = {"name": "A", "profile_dir": str(alias)}
+        record.update(profile_identity(str(alias)))
+        table = AccountTable.from_records([record, {"name": "Legacy", "profile_dir": "/p/legacy"}])
+        self.assertEqual(table.missing_identity(), 1)
+        self.assertEqual(table.find_by_profile_dir(str(real)).name, "A")
+        self.assertEqual(table.find_by_profile_dir(os.path.join(str(self.dir), ".", "real")).name, "A")
+        self.assertIsNone(table.find_by_profile_dir(str(self.dir / "other")))
+        self.assertEqual(table.index_of("Legacy"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
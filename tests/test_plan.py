@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from smam_package import plan, smam
+
+from .helpers import SmamHomeTestCase
+
+
+class PlanApplyTest(SmamHomeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.work = str(self.config / "Signal-Work")
+        self.personal = str(self.config / "Signal-Personal")
+        self.quietly(smam.register_account, "Work", self.work)
+        self.quietly(smam.register_account, "Personal", self.personal)
+
+    def write_state(self, accounts, prune=False) -> str:
+        path = self.home / "state.json"
+        path.write_text(json.dumps({"prune": prune, "accounts": accounts}))
+        return str(path)
+
+    def dirs(self):
+        return {acc["name"]: acc["profile_dir"] for acc in smam.get_store().load()}
+
+    def test_directory_of_another_account_is_a_conflict(self):
+        state = self.write_state([{"name": "X", "profile_dir": self.work},
+                                  {"name": "Work", "profile_dir": self.work + "-old"},
+                                  {"name": "Personal", "profile_dir": self.personal}])
+        self.assertEqual(self.run_cli("plan", state)[0], 0)
+        state = self.write_state([{"name": "X", "profile_dir": self.work}])
+        for command in ("plan", "apply"):
+            status, _, err = self.run_cli(command, state)
+            self.assertEqual(status, smam.EXIT_EXISTS)
+            self.assertIn("'Work' stays registered", err)
+        self.assertEqual(self.dirs(), {"Work": self.work, "Personal": self.personal})
+
+    def test_swap_in_one_run(self):
+        state = self.write_state([{"name": "Work", "profile_dir": self.personal},
+                                  {"name": "Personal", "profile_dir": self.work}])
+        status, out, _ = self.run_cli("apply", state)
+        self.assertEqual(status, 0, out)
+        self.assertEqual(self.dirs(), {"Work": self.personal, "Personal": self.work})
+        self.assertEqual(smam.get_store().load_table().missing_identity(), 0)
+        self.assertIn("No changes", self.run_cli("apply", state)[1])
+
+    def test_rename_with_prune_in_one_run(self):
+        state = self.write_state([{"name": "Office", "profile_dir": self.work},
+                                  {"name": "Personal", "profile_dir": self.personal}], prune=True)
+        actions = smam._compute_plan(state)
+        self.assertEqual([a.kind for a in actions], [plan.UNREGISTER, plan.REGISTER])
+        status, out, _ = self.run_cli("apply", state)
+        self.assertEqual(status, 0, out)
+        self.assertEqual(self.dirs(), {"Personal": self.personal, "Office": self.work})
+        self.assertTrue(smam.Path(self.work).is_dir())
+
+    def test_rerun_is_idempotent(self):
+        state = self.write_state([{"name": "Work", "profile_dir": self.work},
+                                  {"name": "New"}])
+        status, out, _ = self.run_cli("apply", state)
+        self.assertEqual(status, 0, out)
+        self.assertIn("New", self.dirs())
+        status, out, _ = self.run_cli("apply", state)
+        self.assertEqual(status, 0)
+        self.assertIn("No changes", out)
+        self.assertEqual(smam._compute_plan(state), [])
+
+    def test_repoint_of_removed_account_is_skipped(self):
+        actions = [plan.Action(plan.REPOINT, "Gone", self.work + "-x", "")]
+        self.assertEqual(self.quietly(smam.apply_plan, actions), 1)
+        self.assertNotIn("Gone", self.dirs())
+
+
+class SqlitePlanApplyTest(PlanApplyTest):
+    backend = "sqlite"
+
+
+if __name__ == "__main__":
+    unittest.main()
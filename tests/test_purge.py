@@ -0,0 +1,88 @@
+import os
+import socket
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from smam_package import purge
+
+
+class ValidatePolicyTest(unittest.TestCase):
+
+    def test_defaults_are_filled_in(self):
+        self.assertEqual(purge.validate_policy({}), purge.DEFAULT_POLICY)
+        self.assertEqual(purge.validate_policy({"max_age_days": 1.5, "keep": ["GPUCache"]}),
+                         {"purge": True, "max_age_days": 1.5, "keep": ["GPUCache"]})
+
+    def test_bad_policies_are_rejected(self):
+        for policy in ({"max_age": 3}, {"purge": "yes"}, {"purge": 1},
+                       {"max_age_days": -1}, {"max_age_days": "7"},
+                       {"max_age_days": True}, {"max_age_days": False},
+                       {"keep": "Cache"}, {"keep": ["Local Storage"]}):
+            with self.assertRaises(ValueError, msg=policy):
+                purge.validate_policy(policy)
+
+
+class PurgeProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.profile = Path(self.tmp.name) / "Signal-Work"
+        old = time.time() - 30 * 86400
+        for name in ("Cache", "GPUCache", os.path.join("Service Worker", "CacheStorage")):
+            directory = self.profile / name / "sub"
+            directory.mkdir(parents=True)
+            (directory / "old").write_bytes(b"o" * 10)
+            os.utime(str(directory / "old"), (old, old))
+            (directory / "new").write_bytes(b"n" * 20)
+        (self.profile / "sql").mkdir()
+        (self.profile / "sql" / "db.sqlite").write_bytes(b"messages")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def files(self):
+        return sorted(str(p.relative_to(self.profile))
+                      for p in self.profile.rglob("*") if p.is_file())
+
+    def test_default_policy_empties_every_cache(self):
+        result = purge.purge_profile(str(self.profile))
+        self.assertEqual((result.files, result.bytes, result.errors), (6, 90, 0))
+        self.assertEqual(self.files(), ["sql/db.sqlite"])
+
+    def test_dry_run_removes_nothing(self):
+        before = self.files()
+        result = purge.purge_profile(str(self.profile), dry_run=True)
+        self.assertEqual((result.files, result.bytes), (6, 90))
+        self.assertEqual(self.files(), before)
+
+    def test_max_age_and_keep(self):
+        result = purge.purge_profile(str(self.profile), {"max_age_days": 14, "keep": ["GPUCache"]})
+        self.assertEqual((result.files, result.bytes), (2, 20))
+        self.assertEqual(self.files(), [
+            "Cache/sub/new", "GPUCache/sub/new", "GPUCache/sub/old",
+            "Service Worker/CacheStorage/sub/new", "sql/db.sqlite"])
+
+    def test_exempt_and_running_profiles_are_skipped(self):
+        before = self.files()
+        self.assertEqual(purge.purge_profile(str(self.profile), {"purge": False}).skipped, "policy")
+        (self.profile / "SingletonLock").symlink_to(f"{socket.gethostname()}-{os.getpid()}")
+        self.assertEqual(purge.purge_profile(str(self.profile)).skipped, "running")
+        self.assertEqual(self.files(), before)
+
+    def test_purge_all_reports_invalid_policies(self):
+        accounts = [{"name": "Work", "profile_dir": str(self.profile)},
+                    {"name": "Bad", "profile_dir": str(self.profile),
+                     "cache_policy": {"max_age_days": True}}]
+        seen = []
+        results = purge.purge_all(accounts, dry_run=True, workers=2,
+                                  progress=lambda name, result: seen.append(name))
+        self.assertEqual([acc["name"] for acc, _ in results], ["Work", "Bad"])
+        self.assertEqual(results[0][1].files, 6)
+        self.assertTrue(results[1][1].skipped.startswith("invalid cache_policy"))
+        self.assertEqual(sorted(seen), ["Bad", "Work"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from smam_package import smam
+from smam_package.trash import TRASH_DIR_NAME
+
+from .helpers import SmamHomeTestCase
+
+
+class ReconcileFixTest(SmamHomeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.quietly(smam.register_account, "Work", str(self.config / "Signal-Work"))
+        self.quietly(smam.register_account, "Gone", str(self.config / "Signal-Gone"),
+                     desktop_icon=True)
+        (self.config / "Signal-Gone").rmdir()
+        # An unregistered profile, and directories that are not profiles
+        self.orphan = self.config / "Signal-Old"
+        (self.orphan / "sql").mkdir(parents=True)
+        (self.orphan / "sql" / "db.sqlite").write_bytes(b"messages")
+        (self.config / "Signal-Empty").mkdir()
+        (self.config / "Other" / "sql").mkdir(parents=True)
+        (self.config / "Other" / "sql" / "db.sqlite").write_bytes(b"not signal")
+        self.stray = smam.get_desktop_file_path("Stray")
+        self.stray.write_text("[Desktop Entry]\n")
+        background = mock.patch.object(smam, "start_background_reclaim")
+        self.reclaim = background.start()
+        self.addCleanup(background.stop)
+
+    def accounts(self):
+        return {acc["name"]: acc["profile_dir"] for acc in smam.get_store().load()}
+
+    def test_report_without_fix_changes_nothing(self):
+        status, out, _ = self.run_cli("reconcile")
+        self.assertEqual(status, smam.EXIT_FAILURE)
+        self.assertIn(str(self.orphan), out)
+        self.assertIn("Gone -> ", out)
+        self.assertIn(str(self.stray), out)
+        self.assertNotIn("Signal-Empty", out)
+        self.assertNotIn("Other", out)
+        self.assertEqual(set(self.accounts()), {"Work", "Gone"})
+        self.assertTrue(self.stray.exists())
+
+    def test_fix_adopts_orphaned_profiles(self):
+        status, out, _ = self.run_cli("reconcile", "--fix")
+        self.assertEqual(status, smam.EXIT_OK, out)
+        self.assertEqual(self.accounts(), {"Work": str(self.config / "Signal-Work"),
+                                           "Old": str(self.orphan)})
+        self.assertFalse(self.stray.exists())
+        self.assertFalse(smam.get_desktop_file_path("Gone").exists())
+        self.assertTrue((self.orphan / "sql" / "db.sqlite").exists())
+        self.assertTrue((self.config / "Signal-Empty").is_dir())
+        self.assertTrue((self.config / "Other").is_dir())
+        self.reclaim.assert_not_called()
+        status, out, _ = self.run_cli("reconcile")
+        self.assertEqual(status, smam.EXIT_OK)
+        self.assertIn("in sync", out)
+
+    def test_only_delete_dirs_moves_profiles_to_the_trash(self):
+        status, out, _ = self.run_cli("reconcile", "--fix", "--delete-dirs")
+        self.assertEqual(status, smam.EXIT_OK, out)
+        self.assertFalse(self.orphan.exists())
+        trashed = list((self.config / TRASH_DIR_NAME).iterdir())
+        self.assertEqual([p.name.split(".")[0] for p in trashed], ["Signal-Old"])
+        self.assertEqual(set(self.accounts()), {"Work"})
+        self.assertTrue((self.config / "Signal-Empty").is_dir())
+        self.assertTrue((self.config / "Other" / "sql" / "db.sqlite").exists())
+        self.reclaim.assert_called_once_with()
+
+    def test_adopted_name_does_not_clash(self):
+        self.quietly(smam.register_account, "Old", str(self.home / "elsewhere"))
+        status, out, _ = self.run_cli("reconcile", "--fix", "--adopt")
+        self.assertEqual(status, smam.EXIT_OK, out)
+        self.assertEqual(self.accounts()["Old-2"], str(self.orphan))
+
+
+class SqliteReconcileFixTest(ReconcileFixTest):
+    backend = "sqlite"
+
+
+if __name__ == "__main__":
+    unittest.main()
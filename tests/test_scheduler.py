@@ -0,0 +1,130 @@
+import unittest
+from unittest import mock
+
+from smam_package import scheduler
+
+
+class FakeClock:
+    """
+    Stands in for the time module: sleep() only advances monotonic().
+    """
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class FakeProcess:
+    """
+    A Signal instance that uses a full core for 'busy' seconds after it was
+    started and is idle afterwards (busy None: never settles).
+    """
+
+    def __init__(self, clock: FakeClock, pid: int, busy, exits_after=None) -> None:
+        self.clock = clock
+        self.pid = pid
+        self.busy = busy
+        self.exits_after = exits_after
+        self.began = clock.now
+
+    def cpu(self) -> float:
+        elapsed = self.clock.now - self.began
+        return elapsed if self.busy is None else min(elapsed, self.busy)
+
+    def poll(self):
+        if self.exits_after is not None and self.clock.now - self.began >= self.exits_after:
+            return 0
+        return None
+
+
+class BatchLaunchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.processes = {}
+        self.load = 0.0
+        patches = [mock.patch.object(scheduler, "time", self.clock),
+                   mock.patch.object(scheduler, "read_process_table", self.process_table),
+                   mock.patch.object(scheduler, "load_per_cpu", lambda: self.load)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def process_table(self):
+        # Every instance has one renderer child that does all the work.
+        table = {}
+        for pid, process in self.processes.items():
+            if process.poll() is None:
+                table[pid] = (1, 0.0)
+                table[pid + 1] = (pid, process.cpu())
+        return table
+
+    def launch(self, behaviour, **kwargs):
+        # behaviour: {name: (busy seconds, exits after)}
+        def start(acc):
+            if acc["name"] == "Broken":
+                raise OSError("signal-desktop not found")
+            pid = 100 * (len(self.processes) + 1)
+            self.processes[pid] = FakeProcess(self.clock, pid, *behaviour[acc["name"]])
+            return self.processes[pid]
+
+        accounts = [{"name": name, "profile_dir": "/p/" + name} for name in behaviour]
+        kwargs.setdefault("running", lambda acc: acc["name"] == "Open")
+        report = scheduler.batch_launch(accounts, start, settle_cpu=0.1, settle_time=2.0, **kwargs)
+        return {r.name: r for r in report.results}, report
+
+    def test_ready_when_cpu_use_settles(self):
+        results, report = self.launch({"Work": (3.0, None)})
+        work = results["Work"]
+        self.assertEqual((work.state, work.ready_by), (scheduler.READY, scheduler.SETTLED))
+        # Ready counts from when it went quiet, not from when that was confirmed.
+        self.assertAlmostEqual(work.time_to_ready, 3.0, delta=0.3)
+        self.assertEqual(report.seconds, work.ready)
+
+    def test_max_parallel_waits_for_quiescence(self):
+        results, _ = self.launch({"A": (3.0, None), "B": (1.0, None), "C": (1.0, None)},
+                                 max_parallel=1)
+        self.assertGreaterEqual(results["B"].started, results["A"].ready + 2.0)
+        self.assertGreaterEqual(results["C"].started, results["B"].ready + 2.0)
+
+        results, _ = self.launch({"A": (3.0, None), "B": (1.0, None)}, max_parallel=2,
+                                 min_stagger=0.5)
+        self.assertAlmostEqual(results["B"].started - results["A"].started, 0.5, delta=0.3)
+
+    def test_high_load_holds_back_the_next_start(self):
+        self.load = 5.0
+        results, _ = self.launch({"A": (3.0, None), "B": (1.0, None)}, max_parallel=2)
+        self.assertGreater(results["B"].started, results["A"].ready)
+
+    def test_timeout_exit_and_skipped_instances(self):
+        results, _ = self.launch({"Busy": (None, None), "Crash": (5.0, 1.0), "Open": (0, None),
+                                  "Broken": (0, None)}, max_parallel=0, timeout=10.0)
+        self.assertEqual(results["Busy"].state, scheduler.TIMEOUT)
+        self.assertAlmostEqual(results["Busy"].time_to_ready, 10.0, delta=0.3)
+        self.assertEqual(results["Crash"].state, scheduler.EXITED)
+        self.assertEqual(results["Open"].state, scheduler.ALREADY_RUNNING)
+        self.assertIsNone(results["Open"].started)
+        self.assertEqual(results["Broken"].state, scheduler.FAILED)
+        self.assertIn("not found", results["Broken"].error)
+
+    def test_window_makes_an_instance_ready_early(self):
+        # The renderer (a child of the started process) shows a window.
+        results, _ = self.launch({"Work": (None, None)}, timeout=10.0,
+                                 windows=lambda: {101} if self.clock.now >= 1001.0 else set())
+        work = results["Work"]
+        self.assertEqual((work.state, work.ready_by), (scheduler.READY, scheduler.WINDOW))
+        self.assertAlmostEqual(work.time_to_ready, 1.0, delta=0.3)
+
+    def test_progress_sees_every_state(self):
+        seen = []
+        self.launch({"Work": (1.0, None)}, progress=lambda r: seen.append((r.name, r.state)))
+        self.assertEqual(seen, [("Work", scheduler.STARTING), ("Work", scheduler.READY)])
+
+
+if __name__ == "__main__":
+    unittest.main()
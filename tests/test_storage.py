@@ -0,0 +1,263 @@
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import smam, storage
+from smam_package.storage import (ConcurrentModificationError, CorruptStoreError,
+                                  DuplicateAccountError, JournaledJsonAccountStore,
+                                  JsonAccountStore, SqliteAccountStore, fold_journal,
+                                  iter_json_array, migrate_json_to_sqlite)
+
+from .helpers import SmamHomeTestCase
+
+BACKENDS = ("json", "journal", "sqlite")
+WRITERS = 6
+ADDS_PER_WRITER = 20
+
+
+def make_store(kind: str, directory: Path):
+    if kind == "json":
+        return JsonAccountStore(directory / "accounts.json")
+    if kind == "journal":
+        # A small threshold makes compactions run while other writers append.
+        return JournaledJsonAccountStore(directory / "accounts.json",
+                                         directory / "accounts.journal", compact_threshold=2048)
+    return SqliteAccountStore(directory / "accounts.db")
+
+
+def _writer(kind: str, directory: str, writer: int) -> None:
+    store = make_store(kind, Path(directory))
+    for i in range(ADDS_PER_WRITER):
+        store.add({"name": f"w{writer}-{i}", "profile_dir": os.path.join(directory, f"p{writer}-{i}")})
+    compactor = getattr(store, "_compactor", None)
+    if compactor is not None:
+        compactor.join()
+
+
+def _run_processes(target, args_list) -> None:
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        if p.exitcode != 0:
+            raise AssertionError(f"writer exited with status {p.exitcode}")
+
+
+class ConcurrentWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_lost_updates(self):
+        for kind in BACKENDS:
+            with self.subTest(backend=kind):
+                directory = self.dir / kind
+                directory.mkdir()
+                make_store(kind, directory).ensure()
+                _run_processes(_writer, [(kind, str(directory), w) for w in range(WRITERS)])
+                names = [acc["name"] for acc in make_store(kind, directory).load()]
+                self.assertEqual(len(names), WRITERS * ADDS_PER_WRITER)
+                self.assertEqual(len(set(names)), len(names))
+
+    def test_sqlite_first_run_in_parallel(self):
+        # Every writer creates the database itself: no ensure() beforehand.
+        _run_processes(_writer, [("sqlite", str(self.dir), w) for w in range(WRITERS)])
+        self.assertEqual(len(make_store("sqlite", self.dir).load()), WRITERS * ADDS_PER_WRITER)
+
+    def test_stale_save_is_rejected(self):
+        for kind in BACKENDS:
+            with self.subTest(backend=kind):
+                directory = self.dir / kind
+                directory.mkdir()
+                store = make_store(kind, directory)
+                store.ensure()
+                accounts, version = store.load_versioned()
+                make_store(kind, directory).add({"name": "other", "profile_dir": "/tmp/other"})
+                with self.assertRaises(ConcurrentModificationError):
+                    store.save(accounts, expected_version=version)
+
+    def test_duplicates_are_rejected(self):
+        for kind in BACKENDS:
+            with self.subTest(backend=kind):
+                directory = self.dir / kind
+                directory.mkdir()
+                store = make_store(kind, directory)
+                store.ensure()
+                store.add({"name": "A", "profile_dir": str(directory / "a")})
+                with self.assertRaises(DuplicateAccountError):
+                    store.add({"name": "A", "profile_dir": str(directory / "b")})
+                with self.assertRaises(DuplicateAccountError):
+                    store.add({"name": "B", "profile_dir": str(directory / "a")})
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.json = self.dir / "accounts.json"
+        self.journal = self.dir / "accounts.journal"
+        self.db = self.dir / "accounts.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _journaled(self):
+        store = JournaledJsonAccountStore(self.json, self.journal)
+        store.ensure()
+        store.add({"name": "A", "profile_dir": str(self.dir / "a")})
+        store.add({"name": "B", "profile_dir": str(self.dir / "b")})
+        store.remove("A")
+        store.add({"name": "C", "profile_dir": str(self.dir / "c")})
+        self.assertGreater(self.journal.stat().st_size, 0)
+
+    def test_sqlite_migration_replays_journal(self):
+        self._journaled()
+        self.assertEqual(migrate_json_to_sqlite(self.json, self.db, self.journal), 2)
+        store = SqliteAccountStore(self.db)
+        self.assertEqual([acc["name"] for acc in store.load()], ["B", "C"])
+        self.assertFalse(self.json.exists())
+        self.assertFalse(self.journal.exists())
+        self.assertTrue((self.dir / "accounts.journal.migrated").exists())
+        self.assertEqual(store.load_table().missing_identity(), 0)
+
+    def test_plain_json_migration(self):
+        self.json.write_text(json.dumps([{"name": "A", "profile_dir": str(self.dir / "a")}]))
+        self.assertEqual(migrate_json_to_sqlite(self.json, self.db, self.journal), 1)
+        self.assertEqual(sorted(os.listdir(str(self.dir))),
+                         ["accounts.db", "accounts.json.lock", "accounts.json.migrated"])
+        store = SqliteAccountStore(self.db)
+        self.assertEqual(store.load()[0]["canonical_dir"], str(self.dir / "a"))
+        self.assertIsNone(migrate_json_to_sqlite(self.json, self.db))
+
+    def test_failed_migration_leaves_no_database(self):
+        self.json.write_text(json.dumps([{"name": "A", "profile_dir": str(self.dir / "a")},
+                                         {"name": "B", "profile_dir": str(self.dir / "b")}]))
+        with mock.patch.object(storage.os, "replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                migrate_json_to_sqlite(self.json, self.db)
+        self.assertEqual(sorted(os.listdir(str(self.dir))), ["accounts.json", "accounts.json.lock"])
+        # The next run migrates again.
+        self.assertEqual(migrate_json_to_sqlite(self.json, self.db), 2)
+        self.assertEqual(len(SqliteAccountStore(self.db).load()), 2)
+
+    def test_fold_journal_for_plain_json(self):
+        self._journaled()
+        self.assertTrue(fold_journal(self.json, self.journal))
+        self.assertFalse(self.journal.exists())
+        names = [acc["name"] for acc in JsonAccountStore(self.json).load()]
+        self.assertEqual(names, ["B", "C"])
+        self.assertFalse(fold_journal(self.json, self.journal))
+
+    def test_sqlite_backfills_legacy_rows(self):
+        store = SqliteAccountStore(self.dir / "accounts.db")
+        store.ensure()
+        legacy = {"name": "L", "profile_dir": str(self.dir / "l")}
+        conn = sqlite3.connect(str(self.dir / "accounts.db"))
+        conn.execute("INSERT INTO accounts (name, profile_dir, canonical_dir, data) "
+                     "VALUES (?, ?, ?, ?)", ("L", legacy["profile_dir"], legacy["profile_dir"],
+                                             json.dumps(legacy)))
+        conn.commit()
+        conn.close()
+        self.assertEqual(store.load_table().missing_identity(), 1)
+        self.assertEqual(store.backfill_identity(), 1)
+        self.assertEqual(store.load_table().missing_identity(), 0)
+
+
+def _add_one(path: str) -> None:
+    JsonAccountStore(Path(path)).add({"name": "late", "profile_dir": "/tmp/late"})
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def parse(self, text: str, chunk_size: int = 64 * 1024):
+        return list(iter_json_array(io.StringIO(text), chunk_size))
+
+    def test_valid_input_at_every_chunk_size(self):
+        text = ' [ {"name": "a, ]", "n": [1, 2]} ,\n 12345, "x", true, null, -1.5e3 ]\n'
+        expected = json.loads(text)
+        for chunk_size in (1, 2, 3, 7, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse(text, chunk_size), expected)
+
+    def test_empty_inputs(self):
+        self.assertEqual(self.parse(""), [])
+        self.assertEqual(self.parse("  \n"), [])
+        self.assertEqual(self.parse("[]"), [])
+        self.assertEqual(self.parse(" [ ] "), [])
+
+    def test_invalid_inputs_are_rejected(self):
+        for text in ('[{"name": "a"}', '[{"name": "a"},', '[{"name": "a"', '{"name": "a"}',
+                     "[1 2]", "[1,,2]", "[,1]", "[1,]", "[1] 2", "[1]]", "[tru]", "[12"):
+            for chunk_size in (1, 64):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(CorruptStoreError):
+                        self.parse(text, chunk_size)
+
+    def test_elements_come_out_before_the_end_is_read(self):
+        items = iter_json_array(io.StringIO('[{"n": 1}, {"n": 2}, this is not JSON'), 8)
+        self.assertEqual(next(items), {"n": 1})
+        self.assertEqual(next(items), {"n": 2})
+        with self.assertRaises(CorruptStoreError):
+            next(items)
+
+
+class StreamingListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "accounts.json"
+        store = JsonAccountStore(self.path)
+        store.ensure()
+        store.add_many([{"name": f"a{i}", "profile_dir": f"/tmp/a{i}"} for i in range(50)])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_paused_listing_does_not_block_writers(self):
+        for cached in (False, True):
+            with self.subTest(cached=cached):
+                store = JsonAccountStore(self.path)
+                if cached:
+                    store.load_table()
+                records = store.iter_accounts()
+                self.assertEqual(next(records)["name"], "a0")
+                writer = multiprocessing.Process(target=_add_one, args=(str(self.path),))
+                writer.start()
+                writer.join(timeout=10)
+                if writer.is_alive():
+                    writer.terminate()
+                    self.fail("a writer was blocked by a paused listing")
+                # The listing goes on with the snapshot it started from.
+                self.assertEqual(len(list(records)), 49)
+                JsonAccountStore(self.path).remove("late")
+
+
+class SwitchToSqliteTest(SmamHomeTestCase):
+
+    def test_interrupted_switch_is_retried(self):
+        self.quietly(smam.register_account, "Work", str(self.config / "Signal-Work"))
+        with mock.patch.object(smam, "STORE_BACKEND", "sqlite"), \
+                mock.patch.object(smam, "_store", None):
+            with mock.patch.object(storage.os, "replace", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    smam.get_store()
+            self.assertFalse(smam.ACCOUNTS_DB.exists())
+            self.assertIsNone(smam._store)
+            self.assertEqual([acc["name"] for acc in self.quietly(smam.get_store).load()], ["Work"])
+            self.assertTrue(smam.ACCOUNTS_DB.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
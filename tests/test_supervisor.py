@@ -0,0 +1,142 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from smam_package import supervisor
+from smam_package.instances import process_start_ticks
+from smam_package.supervisor import InstanceRegistry
+
+
+class InstanceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.registry = InstanceRegistry(self.dir / "instances.json")
+        self.acc = {"name": "Work", "profile_dir": str(self.dir / "Signal-Work")}
+        os.mkdir(self.acc["profile_dir"])
+
+    def spawn(self, *args, code: str = "import time; time.sleep(30)") -> subprocess.Popen:
+        process = subprocess.Popen([sys.executable, "-c", code] + list(args))
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        return process
+
+    def spawn_ready(self, *args) -> subprocess.Popen:
+        # /proc/<pid>/cmdline can still be empty right after the exec; wait
+        # until the child has run.
+        code = "import time; print(flush=True); time.sleep(30)"
+        process = subprocess.Popen([sys.executable, "-c", code] + list(args), stdout=subprocess.PIPE)
+        self.addCleanup(process.stdout.close)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        process.stdout.readline()
+        return process
+
+    def dead_pid(self) -> int:
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        return process.pid
+
+    def lock(self, host: str, pid: int) -> None:
+        os.symlink(f"{host}-{pid}", os.path.join(self.acc["profile_dir"], "SingletonLock"))
+
+
+class IdentityTest(InstanceTestCase):
+
+    def test_tracked_pid_checks_the_start_time(self):
+        process = self.spawn()
+        self.registry.record("Work", process.pid, self.acc["profile_dir"])
+        entry = self.registry.load()["Work"]
+        self.assertEqual(entry["start_ticks"], process_start_ticks(process.pid))
+        self.assertEqual(supervisor.tracked_pid(entry), process.pid)
+        # The same PID with another start time is some other process.
+        self.assertIsNone(supervisor.tracked_pid(dict(entry, start_ticks=entry["start_ticks"] - 1)))
+        self.assertIsNone(supervisor.tracked_pid(dict(entry, pid=self.dead_pid())))
+        self.assertIsNone(supervisor.tracked_pid(dict(entry, pid="1")))
+
+    def test_status_sources(self):
+        process = self.spawn()
+        self.registry.record("Work", process.pid, self.acc["profile_dir"])
+        result = supervisor.status([self.acc], self.registry)[0]
+        self.assertEqual((result.pid, result.source), (process.pid, supervisor.TRACKED))
+        self.assertIsNotNone(result.started)
+
+        # A stale entry falls through to the SingletonLock.
+        self.registry.record("Work", self.dead_pid(), self.acc["profile_dir"])
+        self.lock(socket.gethostname(), process.pid)
+        result = supervisor.status([self.acc], self.registry)[0]
+        self.assertEqual((result.pid, result.source), (process.pid, supervisor.LOCK))
+        self.assertIsNone(result.started)
+
+    def test_stale_and_foreign_locks_are_not_running(self):
+        self.lock(socket.gethostname(), self.dead_pid())
+        self.assertFalse(supervisor.status([self.acc], self.registry)[0].running)
+        os.unlink(os.path.join(self.acc["profile_dir"], "SingletonLock"))
+        self.lock("other-host.example", os.getpid())
+        self.assertIsNone(supervisor.find_instance(self.acc, self.registry))
+
+    def test_instance_found_by_command_line(self):
+        process = self.spawn_ready(f"--user-data-dir={self.acc['profile_dir']}")
+        result = supervisor.status([self.acc], self.registry)[0]
+        self.assertEqual((result.pid, result.source), (process.pid, supervisor.PROCESS))
+
+    def test_launch_refuses_a_running_profile(self):
+        process = self.spawn()
+        self.lock(socket.gethostname(), process.pid)
+        with self.assertRaises(supervisor.AlreadyRunningError) as cm:
+            supervisor.launch(self.acc, lambda acc: self.spawn(), self.registry)
+        self.assertEqual(cm.exception.pid, process.pid)
+        self.assertEqual(self.registry.load(), {})
+
+    def test_prune_drops_dead_entries(self):
+        process = self.spawn()
+        self.registry.record("Work", process.pid, self.acc["profile_dir"])
+        self.registry.record("Gone", self.dead_pid(), "/p/gone")
+        self.registry.prune()
+        self.assertEqual(list(self.registry.load()), ["Work"])
+
+
+class SuperviseTest(InstanceTestCase):
+
+    def supervise(self, start, **kwargs):
+        events = []
+        supervisor.supervise([self.acc], start, self.registry, backoff=0.01, poll=0.01,
+                             progress=lambda name, event, detail: events.append(event), **kwargs)
+        return events
+
+    def test_crashes_are_restarted_until_max_restarts(self):
+        events = self.supervise(lambda acc: self.spawn(code="raise SystemExit(3)"),
+                                max_restarts=2)
+        self.assertEqual(events, [supervisor.STARTED, supervisor.CRASHED, supervisor.RESTARTING,
+                                  supervisor.STARTED, supervisor.CRASHED, supervisor.RESTARTING,
+                                  supervisor.STARTED, supervisor.CRASHED, supervisor.GAVE_UP])
+        self.assertEqual(self.registry.load(), {})
+
+    def test_normal_exit_is_not_restarted(self):
+        events = self.supervise(lambda acc: self.spawn(code=""))
+        self.assertEqual(events, [supervisor.STARTED, supervisor.STOPPED])
+
+    def test_adopted_instance_with_stale_lock_counts_as_crashed(self):
+        # Signal exits but leaves its SingletonLock behind.
+        adopted = self.spawn(code="import time; time.sleep(0.3)")
+        self.lock(socket.gethostname(), adopted.pid)
+        reaper = supervisor.reap_in_background(adopted)
+
+        def start(acc):
+            reaper.join()
+            os.unlink(os.path.join(acc["profile_dir"], "SingletonLock"))
+            return self.spawn(code="")
+
+        events = self.supervise(start)
+        self.assertEqual(events, [supervisor.ADOPTED, supervisor.CRASHED, supervisor.RESTARTING,
+                                  supervisor.STARTED, supervisor.STOPPED])
+
+
+if __name__ == "__main__":
+    unittest.main()
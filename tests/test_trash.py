@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import smam
+from smam_package.fsutil import parallel_rmtree
+from smam_package.trash import Trash
+
+from .helpers import SmamHomeTestCase
+
+
+def make_profile(path: Path) -> None:
+    (path / "sql").mkdir(parents=True)
+    (path / "sql" / "db.sqlite").write_bytes(b"x" * 1000)
+    (path / "attachments.noindex" / "ab").mkdir(parents=True)
+    (path / "attachments.noindex" / "ab" / "f").write_bytes(b"y" * 100)
+
+
+class TrashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.trash = Trash(self.dir / "trash_roots.json", self.dir / "reclaim.lock")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_move_then_reclaim(self):
+        make_profile(self.dir / "Signal-A")
+        moved = self.trash.move(str(self.dir / "Signal-A"))
+        self.assertFalse((self.dir / "Signal-A").exists())
+        self.assertTrue(moved.is_dir())
+        self.assertEqual(self.trash.pending(), [moved])
+        self.assertEqual(self.trash.reclaim(), 1)
+        self.assertEqual(self.trash.pending(), [])
+
+    def test_symlinks_are_not_followed(self):
+        outside = self.dir / "outside"
+        outside.mkdir()
+        (outside / "keep").write_text("precious")
+        make_profile(self.dir / "Signal-A")
+        os.symlink(str(outside), str(self.dir / "Signal-A" / "link"))
+        self.trash.move(str(self.dir / "Signal-A"))
+        self.trash.reclaim()
+        self.assertEqual((outside / "keep").read_text(), "precious")
+
+    def test_refuses_to_trash_a_symlink(self):
+        make_profile(self.dir / "real")
+        os.symlink(str(self.dir / "real"), str(self.dir / "Signal-L"))
+        with self.assertRaises(OSError):
+            self.trash.move(str(self.dir / "Signal-L"))
+        self.assertTrue((self.dir / "real" / "sql" / "db.sqlite").exists())
+
+    def test_directories_trashed_during_reclaim_are_reclaimed(self):
+        make_profile(self.dir / "Signal-A")
+        make_profile(self.dir / "Signal-B")
+        self.trash.move(str(self.dir / "Signal-A"))
+
+        def remove(path):
+            # A second deletion happens while the reclaimer holds the lock.
+            if (self.dir / "Signal-B").exists():
+                self.assertTrue(self.trash.is_reclaiming())
+                self.trash.move(str(self.dir / "Signal-B"))
+            return parallel_rmtree(path)
+
+        self.assertEqual(self.trash.reclaim(remove), 2)
+        self.assertEqual(self.trash.pending(), [])
+
+    def test_only_one_reclaimer(self):
+        make_profile(self.dir / "Signal-A")
+        self.trash.move(str(self.dir / "Signal-A"))
+        results = []
+
+        def remove(path):
+            results.append(self.trash.reclaim())
+            return parallel_rmtree(path)
+
+        self.assertEqual(self.trash.reclaim(remove), 1)
+        self.assertEqual(results, [None])
+
+    def test_failed_removal_stays_pending(self):
+        make_profile(self.dir / "Signal-A")
+        moved = self.trash.move(str(self.dir / "Signal-A"))
+
+        def remove(path):
+            raise PermissionError("denied")
+
+        self.assertEqual(self.trash.reclaim(remove), 0)
+        self.assertEqual(self.trash.pending(), [moved])
+
+
+class BackgroundReclaimTest(SmamHomeTestCase):
+
+    def test_reclaimer_output_goes_to_the_log(self):
+        profile = self.config / "Signal-Old"
+        make_profile(profile)
+        smam.get_trash().move(str(profile))
+        # The reclaimer imports smam_package from the source tree, like the tests.
+        source = os.path.dirname(os.path.dirname(os.path.abspath(smam.__file__)))
+        with mock.patch.dict(os.environ, {"PYTHONPATH": source}):
+            smam.start_background_reclaim()
+        deadline = time.monotonic() + 30
+        while smam.get_trash().pending() or smam.get_trash().is_reclaiming():
+            self.assertLess(time.monotonic(), deadline, "reclaimer did not finish")
+            time.sleep(0.05)
+        log = smam.RECLAIM_LOG.read_text()
+        self.assertTrue(log.startswith("--- "))
+        self.assertIn("reclaim --quiet", log)
+
+
+if __name__ == "__main__":
+    unittest.main()
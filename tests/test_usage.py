@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from smam_package import usage
+from smam_package.usage import SMALL_DIR_FILES, UsageCache
+
+
+class UsageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.profile = str(self.dir / "Signal-Work")
+        attachments = Path(self.profile, "attachments.noindex", "ab")
+        attachments.mkdir(parents=True)
+        for n in range(SMALL_DIR_FILES + 8):
+            (attachments / f"file{n}").write_bytes(b"a" * 4096)
+        Path(self.profile, "sql").mkdir()
+        Path(self.profile, "sql", "db.sqlite").write_bytes(b"d" * 8192)
+        Path(self.profile, "config.json").write_text("{}")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cache(self) -> UsageCache:
+        return UsageCache(self.dir / "usage-cache.json", self.dir / "usage.json")
+
+    def read_dirs(self, cache: UsageCache, **kwargs):
+        # Scan and return the directories that were listed again.
+        with mock.patch.object(usage, "_read_dir", wraps=usage._read_dir) as read_dir:
+            result = cache.scan(self.profile, workers=2, **kwargs)
+        listed = sorted(os.path.relpath(call[0][0], self.profile) for call in read_dir.call_args_list)
+        return result, listed
+
+    def test_scan_matches_measure(self):
+        result = self.cache().scan(self.profile, workers=2)
+        expected = usage.measure(self.profile, workers=2)
+        self.assertEqual((result.total, result.files, result.by_dir),
+                         (expected.total, expected.files, expected.by_dir))
+        self.assertEqual(result.files, SMALL_DIR_FILES + 10)
+        self.assertEqual(set(result.by_dir), {usage.TOP_LEVEL, "attachments.noindex", "sql"})
+        self.assertGreaterEqual(result.by_dir["attachments.noindex"], (SMALL_DIR_FILES + 8) * 4096)
+
+    def test_unchanged_large_directories_are_not_listed_again(self):
+        cache = self.cache()
+        _, listed = self.read_dirs(cache)
+        self.assertEqual(listed, [".", "attachments.noindex", "attachments.noindex/ab", "sql"])
+        cache.save()
+
+        cache = self.cache()
+        first, listed = self.read_dirs(cache)
+        self.assertEqual(listed, [".", "attachments.noindex", "sql"])
+        # Growing a small directory's file is seen without an mtime change.
+        Path(self.profile, "sql", "db.sqlite").write_bytes(b"d" * 65536)
+        second, listed = self.read_dirs(cache)
+        self.assertEqual(listed, [".", "attachments.noindex", "sql"])
+        self.assertGreater(second.by_dir["sql"], first.by_dir["sql"])
+        # A new file changes the large directory's mtime.
+        Path(self.profile, "attachments.noindex", "ab", "new").write_bytes(b"n" * 4096)
+        third, listed = self.read_dirs(cache)
+        self.assertIn("attachments.noindex/ab", listed)
+        self.assertEqual(third.files, second.files + 1)
+        _, listed = self.read_dirs(cache, rescan=True)
+        self.assertIn("attachments.noindex/ab", listed)
+
+    def test_hard_links_are_counted_once(self):
+        before = usage.measure(self.profile, workers=2)
+        os.link(os.path.join(self.profile, "sql", "db.sqlite"),
+                os.path.join(self.profile, "db-link"))
+        after = usage.measure(self.profile, workers=2)
+        self.assertEqual(after.files, before.files + 1)
+        self.assertEqual(after.total, before.total)
+
+    def test_totals_survive_and_forget_drops_profiles(self):
+        cache = self.cache()
+        result = cache.scan(self.profile, workers=2)
+        cache.scan(str(self.dir), workers=2)
+        cache.save()
+        cache = self.cache()
+        self.assertEqual(cache.get(self.profile).total, result.total)
+        self.assertEqual(set(cache.totals()), {self.profile, str(self.dir)})
+        cache.forget({self.profile})
+        cache.save()
+        self.assertEqual(set(self.cache().totals()), {self.profile})
+        self.assertIsNone(self.cache().get(str(self.dir)))
+
+    def test_missing_profile_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.cache().scan(str(self.dir / "gone"))
+
+
+if __name__ == "__main__":
+    unittest.main()